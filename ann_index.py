@@ -0,0 +1,266 @@
+"""
+Approximate nearest-neighbour candidate retrieval for very large profile pools.
+
+Each complete profile is embedded as a small vector of its numeric
+compatibility factors (budget midpoint and width, the three lifestyle
+levels, and pet/smoking preferences with 'maybe' half way between 'yes' and
+'no'), scaled so that a unit of distance costs roughly the same score in
+every dimension. An inverted-file (IVF) index clusters the vectors with
+k-means into about sqrt(N) lists; a query scans only the lists whose
+centroids are nearest the probe's vector, so the shortlist grows with
+sqrt(N) instead of N. The shortlist is then scored exactly, so scores are
+never approximate, only the set of candidates considered.
+
+Training runs k-means over the whole pool, which takes seconds at large
+sizes, so the app calls train() from a background worker: the clustering
+runs on a copy of the vectors without holding the lock, and the new lists
+are swapped in at once. Until then queries use the previous lists, and
+profiles changed meanwhile are assigned to the new lists at the swap.
+
+probes is the recall-versus-latency knob: more probed lists find more of
+the exact matches at the cost of scoring more candidates (see
+benchmarks/ann_recall.py). Location, interests and deal-breakers are not
+embedded: they still count when the shortlist is scored.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from scoring import LIFESTYLE_FIELDS, as_float
+
+# Lists scanned per query
+DEFAULT_PROBES = 16
+# Below this many profiles the index stays untrained and callers use the exact path
+MIN_TRAINING_SIZE = 1000
+# Retrain once the pool grows or shrinks by this factor since the last training
+RETRAIN_FACTOR = 2.0
+# k-means runs on a sample of this many vectors per list
+TRAINING_SAMPLE_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+# Vectors assigned to centroids per distance matrix
+ASSIGN_CHUNK = 8192
+
+# Budget currency units per unit of score lost, roughly a typical budget range
+BUDGET_SCALE = 1000.0
+# Score weight per lifestyle level step: 40% over three factors, 4 steps each
+LIFESTYLE_STEP = 0.4 / len(LIFESTYLE_FIELDS) / 4
+PREFERENCE_VALUES = {'yes': 1.0, 'maybe': 0.5, 'no': 0.0}
+# Missing preferences sit with 'maybe', which is half credit against either answer
+MISSING_PREFERENCE = 0.5
+
+# Profile attributes the embedding reads
+FEATURE_FIELDS = ('budget_min', 'budget_max') + LIFESTYLE_FIELDS + ('pet_preference', 'smoking_preference')
+DIMENSIONS = 7
+
+
+def embed(profile: Any) -> np.ndarray:
+    """Vector of a profile's numeric compatibility factors"""
+    budget_min = as_float(profile.budget_min)
+    budget_max = as_float(profile.budget_max)
+    return np.array([
+        0.3 * (budget_min + budget_max) / 2 / BUDGET_SCALE,
+        0.15 * (budget_max - budget_min) / BUDGET_SCALE,
+        *(LIFESTYLE_STEP * as_float(getattr(profile, field)) for field in LIFESTYLE_FIELDS),
+        0.1 * PREFERENCE_VALUES.get(profile.pet_preference, MISSING_PREFERENCE),
+        0.1 * PREFERENCE_VALUES.get(profile.smoking_preference, MISSING_PREFERENCE),
+    ], dtype=np.float64)
+
+
+def squared_distances(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Squared Euclidean distance from every vector to every centroid"""
+    return (
+        np.einsum('ij,ij->i', vectors, vectors)[:, None]
+        - 2 * vectors @ centroids.T
+        + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    )
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid for each vector, in bounded-memory chunks"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        labels[start:start + ASSIGN_CHUNK] = squared_distances(chunk, centroids).argmin(axis=1)
+    return labels
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = KMEANS_ITERATIONS,
+           seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means seeded with random points; empty clusters keep their previous centroid"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroids(vectors, centroids)
+        counts = np.bincount(labels, minlength=clusters)
+        filled = counts > 0
+        for dimension in range(vectors.shape[1]):
+            sums = np.bincount(labels, weights=vectors[:, dimension], minlength=clusters)
+            centroids[filled, dimension] = sums[filled] / counts[filled]
+    return centroids
+
+
+class AnnIndex:
+    """IVF index over embedded complete profiles, returning candidate shortlists"""
+
+    def __init__(self, probes: int = DEFAULT_PROBES, lists: Optional[int] = None, seed: int = 0):
+        self.probes = probes
+        self.lists = lists
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._lock = threading.Lock()
+        self._positions: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._user_ids = np.zeros(1024, dtype=np.int64)
+        self._vectors = np.zeros((1024, DIMENSIONS), dtype=np.float64)
+        self._labels: Dict[int, int] = {}
+        self._members: List[Set[int]] = []
+        # Users updated or removed while a training runs (None when none is running)
+        self._changed: Optional[Set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._positions
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def update(self, user_id: int, profile: Any):
+        """Insert or replace the vector of a complete profile"""
+        with self._lock:
+            self._store(user_id, embed(profile))
+
+    def remove(self, user_id: int):
+        """Drop a profile from the index (e.g. when it is no longer complete)"""
+        with self._lock:
+            self._discard(user_id)
+
+    def _store(self, user_id: int, vector: np.ndarray):
+        position = self._positions.get(user_id)
+        if position is None:
+            if self._free:
+                position = self._free.pop()
+            else:
+                position = self._size
+                self._size += 1
+                if position == len(self._user_ids):
+                    self._user_ids = np.concatenate([self._user_ids, np.zeros_like(self._user_ids)])
+                    self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._positions[user_id] = position
+        self._user_ids[position] = user_id
+        self._vectors[position] = vector
+        if self._changed is not None:
+            self._changed.add(user_id)
+
+        if self.centroids is not None:
+            label = int(nearest_centroids(vector[None, :], self.centroids)[0])
+            previous = self._labels.get(user_id)
+            if previous != label:
+                if previous is not None:
+                    self._members[previous].discard(user_id)
+                self._members[label].add(user_id)
+                self._labels[user_id] = label
+
+    def _discard(self, user_id: int):
+        position = self._positions.pop(user_id, None)
+        if position is None:
+            return
+        self._free.append(position)
+        if self._changed is not None:
+            self._changed.add(user_id)
+        label = self._labels.pop(user_id, None)
+        if label is not None:
+            self._members[label].discard(user_id)
+
+    def sync(self, rows: Iterable[Any]):
+        """Apply rows (user_id, is_complete and FEATURE_FIELDS); retraining is left to the caller"""
+        with self._lock:
+            for row in rows:
+                if row.is_complete:
+                    self._store(row.user_id, embed(row))
+                else:
+                    self._discard(row.user_id)
+
+    def needs_training(self) -> bool:
+        """True if the pool changed size enough since the last training, and no training is running"""
+        if self._changed is not None:
+            return False
+        size = len(self._positions)
+        if size < MIN_TRAINING_SIZE:
+            return self.is_trained
+        return (not self.is_trained or size > self.trained_size * RETRAIN_FACTOR
+                or size < self.trained_size / RETRAIN_FACTOR)
+
+    def retrain(self):
+        """train() if needs_training(); the task the app's background worker runs"""
+        if self.needs_training():
+            self.train()
+
+    def train(self):
+        """Cluster the current vectors and swap in the rebuilt lists (untrained below MIN_TRAINING_SIZE)"""
+        with self._lock:
+            positions = np.array(sorted(self._positions.values()), dtype=np.int64)
+            user_ids = self._user_ids[positions].tolist()
+            vectors = self._vectors[positions]
+            self._changed = set()
+
+        try:
+            centroids = self._cluster(vectors) if len(user_ids) >= MIN_TRAINING_SIZE else None
+            labels = nearest_centroids(vectors, centroids).tolist() if centroids is not None else []
+        except BaseException:
+            with self._lock:
+                self._changed = None
+            raise
+
+        with self._lock:
+            changed, self._changed = self._changed, None
+            if centroids is None:
+                self.centroids = None
+                self.trained_size = 0
+                self._labels = {}
+                self._members = []
+                return
+
+            self._labels = {user_id: label for user_id, label in zip(user_ids, labels) if user_id not in changed}
+            self._members = [set() for _ in range(len(centroids))]
+            for user_id, label in self._labels.items():
+                self._members[label].add(user_id)
+            self.centroids = centroids
+            self.trained_size = len(user_ids)
+            # Vectors stored while k-means ran were assigned against the old centroids
+            for user_id in changed:
+                position = self._positions.get(user_id)
+                if position is not None:
+                    label = int(nearest_centroids(self._vectors[position][None, :], centroids)[0])
+                    self._labels[user_id] = label
+                    self._members[label].add(user_id)
+
+    def _cluster(self, vectors: np.ndarray) -> np.ndarray:
+        """k-means centroids of a sample of the vectors, about sqrt(N) unless lists is set"""
+        clusters = min(self.lists or max(1, round(len(vectors) ** 0.5)), len(vectors))
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), clusters * TRAINING_SAMPLE_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        return kmeans(sample, clusters, seed=self.seed)
+
+    def candidates(self, profile: Any, probes: Optional[int] = None) -> Optional[Set[int]]:
+        """
+        User IDs in the probes lists nearest the profile's vector, or None
+        while the index is untrained (the caller then considers everyone)
+        """
+        with self._lock:
+            if self.centroids is None:
+                return None
+            probes = min(probes or self.probes, len(self.centroids))
+            distances = squared_distances(embed(profile)[None, :], self.centroids)[0]
+            nearest = np.argpartition(distances, probes - 1)[:probes]
+            result: Set[int] = set()
+            for label in nearest.tolist():
+                result.update(self._members[label])
+            return result
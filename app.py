@@ -1,99 +1,247 @@
-from flask import Flask, request, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, Flask, current_app, request, jsonify, stream_with_context
+from flask.cli import AppGroup
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from sqlalchemy.dialects.postgresql import JSONB
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import base64
+import binascii
+import functools
+import hmac
 import json
+import logging
 import random
-from typing import List, Dict, Any
+import time
+import click
+from typing import Callable, List, Dict, Any, Optional
+from scoring import MATCH_THRESHOLD, ProfileBatch, SCORING_FIELDS, exclude_deal_breakers, score_batch, top_k
+from precompute import ProfileRow, score_all_pairs
+from assignment import CANDIDATES_PER_SLOT, PairGraph, assign
+from background import BackgroundWorker
+from jobs import JobQueue, store_from_url
+from passwords import HashingBusyError, PasswordHasher
+from candidate_index import CandidateIndex
+from ann_index import AnnIndex
+from profile_store import ProfileStore
+from cache import ResponseCache, backend_from_url, is_shared_url
+import migrations
+from database import REPLICA_BIND, RecentWrites, engine_options, use_replica
+from ratelimit import RateLimit, RateLimiter, SingleFlight, buckets_from_url
+from serializers import FastJSONProvider, Serializer
+from compression import Compressor
+from bulk import DEFAULT_BATCH_SIZE, BulkImporter, export_csv
+from writebehind import BufferFullError, WriteBehindBuffer
+from extensions import cors, db, jwt, metrics
+from models import MATCH_ACCEPTED, MATCH_PENDING, MATCH_RESPONSES, Match, User, UserProfile, Waitlist
+import vocabulary
 
-# Initialize Flask app
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 # Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///roommatch.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-string')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-
-# Initialize extensions
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
-CORS(app, origins=['http://localhost:3000', 'http://127.0.0.1:5500', 'http://localhost:5500'])
-
-# Database Models
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    first_name = db.Column(db.String(50), nullable=False)
-    last_name = db.Column(db.String(50), nullable=False)
-    phone = db.Column(db.String(20))
-    is_verified = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    # Relationship
-    profile = db.relationship('UserProfile', backref='user', uselist=False, cascade='all, delete-orphan')
-    sent_matches = db.relationship('Match', foreign_keys='Match.user1_id', backref='user1', lazy='dynamic')
-    received_matches = db.relationship('Match', foreign_keys='Match.user2_id', backref='user2', lazy='dynamic')
-
-class UserProfile(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    
-    # Basic Info
-    age = db.Column(db.Integer)
-    gender = db.Column(db.String(20))
-    occupation = db.Column(db.String(100))
-    education = db.Column(db.String(100))
-    
-    # Living Preferences
-    budget_min = db.Column(db.Integer)
-    budget_max = db.Column(db.Integer)
-    location_preference = db.Column(db.String(200))
-    room_type = db.Column(db.String(50))  # single, shared, studio
-    
-    # Lifestyle Preferences (stored as JSON)
-    lifestyle_preferences = db.Column(db.Text)  # JSON string
-    
-    # Compatibility Factors
-    cleanliness_level = db.Column(db.Integer)  # 1-5 scale
-    social_level = db.Column(db.Integer)  # 1-5 scale
-    noise_tolerance = db.Column(db.Integer)  # 1-5 scale
-    pet_preference = db.Column(db.String(20))  # yes, no, maybe
-    smoking_preference = db.Column(db.String(20))  # yes, no, maybe
-    
-    # Bio and Additional Info
-    bio = db.Column(db.Text)
-    interests = db.Column(db.Text)  # JSON string
-    deal_breakers = db.Column(db.Text)  # JSON string
-    
-    # Profile Status
-    is_complete = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-class Match(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user1_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    user2_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    compatibility_score = db.Column(db.Float, nullable=False)
-    match_reason = db.Column(db.Text)
-    status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Ensure unique matches
-    __table_args__ = (db.UniqueConstraint('user1_id', 'user2_id', name='unique_match'),)
+def configure(app: Flask, overrides: Optional[Dict[str, Any]] = None):
+    """Load the app's settings from the environment, then apply overrides (e.g. a test database)"""
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///roommatch.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 0)) or None
+    app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    app.config['DATABASE_MAX_OVERFLOW'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    app.config['DATABASE_POOL_TIMEOUT'] = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+    app.config['DATABASE_POOL_RECYCLE'] = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+    app.config['DATABASE_POOL_PRE_PING'] = os.environ.get('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    app.config['DATABASE_STATEMENT_TIMEOUT'] = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 0))
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    app.config['DATABASE_REPLICA_LAG'] = int(os.environ.get('DATABASE_REPLICA_LAG', 5))
+    app.config['RECENT_WRITES_URL'] = os.environ.get('RECENT_WRITES_URL', 'memory')
+    app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-string')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    app.config['CORS_ORIGINS'] = [origin.strip() for origin in os.environ.get(
+        'CORS_ORIGINS', 'http://localhost:3000,http://127.0.0.1:5500,http://localhost:5500').split(',') if origin.strip()]
+    app.config['JOB_STORE_URL'] = os.environ.get('JOB_STORE_URL', 'sqlite:///roommatch_jobs.db')
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['PASSWORD_HASH_ALGORITHM'] = os.environ.get('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+    app.config['PASSWORD_HASH_COST'] = int(os.environ.get('PASSWORD_HASH_COST', 0)) or None
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 0)) or None
+    app.config['RESPONSE_CACHE_URL'] = os.environ.get('RESPONSE_CACHE_URL', 'memory')
+    app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 10000))
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    app.config['ADMIN_API_TOKEN'] = os.environ.get('ADMIN_API_TOKEN')
+    app.config['MATCH_RETRIEVAL'] = os.environ.get('MATCH_RETRIEVAL', 'exact').lower()
+    app.config['ANN_PROBES'] = int(os.environ.get('ANN_PROBES', 16))
+    app.config['ANN_LISTS'] = int(os.environ.get('ANN_LISTS', 0)) or None
+    app.config['MAX_MATCHES_PER_USER'] = int(os.environ.get('MAX_MATCHES_PER_USER', 50))
+    app.config['RATE_LIMIT_URL'] = os.environ.get('RATE_LIMIT_URL', 'memory')
+    app.config['PROXY_FIX_X_FOR'] = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    app.config['RATE_LIMIT_LOGIN'] = os.environ.get('RATE_LIMIT_LOGIN', '10/minute')
+    app.config['RATE_LIMIT_REGISTER'] = os.environ.get('RATE_LIMIT_REGISTER', '5/minute')
+    app.config['RATE_LIMIT_GENERATE'] = os.environ.get('RATE_LIMIT_GENERATE', '6/minute')
+    app.config['WAITLIST_FLUSH_INTERVAL'] = float(os.environ.get('WAITLIST_FLUSH_INTERVAL', 1.0))
+    app.config['WAITLIST_BATCH_SIZE'] = int(os.environ.get('WAITLIST_BATCH_SIZE', 500))
+    app.config['WAITLIST_MAX_PENDING'] = int(os.environ.get('WAITLIST_MAX_PENDING', 0)) or None
+    app.config.update(overrides or {})
+    
+    # Engine and pool options, applied to the primary and the optional read replica
+    settings = pool_settings(app.config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], **settings)
+    if app.config['DATABASE_REPLICA_URL']:
+        # Whichever process served a user's write, every process must keep their reads on the primary
+        if not is_shared_url(app.config['RECENT_WRITES_URL']):
+            raise ValueError('DATABASE_REPLICA_URL needs a shared RECENT_WRITES_URL (redis://...), '
+                             f"not {app.config['RECENT_WRITES_URL']}")
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: {'url': app.config['DATABASE_REPLICA_URL'],
+                           **engine_options(app.config['DATABASE_REPLICA_URL'], **settings)}
+        }
+
+def pool_settings(config) -> Dict[str, Any]:
+    """Connection pool options from the DATABASE_POOL_* settings"""
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pre_ping': config['DATABASE_POOL_PRE_PING'],
+        'statement_timeout_ms': config['DATABASE_STATEMENT_TIMEOUT'],
+    }
+
+# Response serializers, built once per model or row shape
+serialize_account = Serializer(('id', 'email', 'first_name', 'last_name'))
+serialize_user = Serializer(('id', 'email', 'first_name', 'last_name', 'phone', 'is_verified'))
+serialize_profile = Serializer((
+    'age', 'gender', 'occupation', 'education', 'budget_min', 'budget_max', 'location_preference',
+    'room_type', 'cleanliness_level', 'social_level', 'noise_tolerance', 'pet_preference',
+    'smoking_preference', 'bio', 'is_complete', 'lifestyle_preferences', 'interests', 'deal_breakers'
+))
+serialize_match = Serializer(('id', 'compatibility_score', 'match_reason', 'status', 'created_at'))
+serialize_match_user = Serializer((('id', 'user_id'), 'first_name', 'last_name', 'age', 'occupation', 'bio'))
+
+# Fields a profile needs before it takes part in matching
+PROFILE_REQUIRED_FIELDS = ('age', 'gender', 'budget_min', 'budget_max', 'location_preference',
+                           'cleanliness_level', 'social_level', 'noise_tolerance')
+
+# Maximum row errors listed in a bulk import response (all are counted)
+MAX_REPORTED_IMPORT_ERRORS = 1000
+
+# Page size for GET /api/matches
+MATCHES_PAGE_SIZE = 50
+MAX_MATCHES_PAGE_SIZE = 200
+
+# Services built from the app's settings, kept in app.extensions['roommatch']
+class Services:
+    """Config-dependent services and in-process caches of one app"""
+    
+    def __init__(self, app: Flask):
+        config = app.config
+        
+        # In-process index of complete profiles, used to prune match candidates
+        self.candidate_index = CandidateIndex()
+        
+        # Approximate candidate retrieval (MATCH_RETRIEVAL=ann): an IVF index whose shortlist is scored exactly
+        self.ann_index = AnnIndex(probes=config['ANN_PROBES'], lists=config['ANN_LISTS']) \
+            if config['MATCH_RETRIEVAL'] == 'ann' else None
+        
+        # Compact snapshot of complete profiles' scoring fields, read by the scoring hot path
+        self.profile_store = ProfileStore()
+        
+        # Per-user cache of GET /api/profile and GET /api/matches responses
+        self.response_cache = ResponseCache(
+            backend_from_url(config['RESPONSE_CACHE_URL'], max_entries=config['RESPONSE_CACHE_SIZE']),
+            ttl=config['RESPONSE_CACHE_TTL']
+        )
+        
+        # Users whose data changed recently are read from the primary while the replica catches up
+        self.recent_writes = RecentWrites(backend_from_url(config['RECENT_WRITES_URL']),
+                                          window=config['DATABASE_REPLICA_LAG'])
+        
+        # Token buckets per client on the endpoints that hash a password or scan every candidate
+        self.rate_limiter = RateLimiter(buckets_from_url(config['RATE_LIMIT_URL']), {
+            'login': RateLimit.parse(config['RATE_LIMIT_LOGIN']),
+            'register': RateLimit.parse(config['RATE_LIMIT_REGISTER']),
+            'generate': RateLimit.parse(config['RATE_LIMIT_GENERATE']),
+        })
+        
+        self.start_workers(app)
+    
+    def start_workers(self, app: Flask):
+        """
+        Build the services that own threads or process pools. A forked worker
+        inherits them without their threads, so after_fork() builds them again
+        """
+        config = app.config
+        
+        # Password hashing runs on its own bounded process pool (started on first use)
+        self.password_hasher = PasswordHasher(
+            algorithm=config['PASSWORD_HASH_ALGORITHM'],
+            cost=config['PASSWORD_HASH_COST'],
+            workers=config['PASSWORD_HASH_WORKERS'],
+            max_pending=config['PASSWORD_HASH_MAX_PENDING'],
+            metrics=metrics
+        )
+        
+        # Retraining of the ANN index runs here, off the request threads, and swaps the new lists in whole
+        self.ann_trainer = BackgroundWorker('ann-training')
+        
+        # Background queue for match maintenance triggered by profile updates
+        self.match_worker = BackgroundWorker('match-maintenance', context=app.app_context)
+        
+        # Job queue for asynchronous match generation, pollable via /api/matches/jobs/<id>
+        self.match_jobs = JobQueue(store_from_url(config['JOB_STORE_URL']), workers=config['JOB_WORKERS'],
+                                   context=app.app_context)
+        
+        # Waitlist signups are buffered, deduplicated by email and inserted in batches
+        self.waitlist_buffer = WriteBehindBuffer(
+            'waitlist', store_waitlist_signups,
+            interval=config['WAITLIST_FLUSH_INTERVAL'],
+            max_batch=config['WAITLIST_BATCH_SIZE'],
+            max_pending=config['WAITLIST_MAX_PENDING'],
+            context=app.app_context
+        )
+
+def service(name: str) -> Any:
+    """Proxy to the current app's service of that name"""
+    return LocalProxy(lambda: getattr(current_app.extensions['roommatch'], name))
+
+password_hasher: PasswordHasher = service('password_hasher')
+candidate_index: CandidateIndex = service('candidate_index')
+profile_store: ProfileStore = service('profile_store')
+response_cache: ResponseCache = service('response_cache')
+recent_writes: RecentWrites = service('recent_writes')
+match_worker: BackgroundWorker = service('match_worker')
+ann_trainer: BackgroundWorker = service('ann_trainer')
+match_jobs: JobQueue = service('match_jobs')
+rate_limiter: RateLimiter = service('rate_limiter')
+waitlist_buffer: WriteBehindBuffer = service('waitlist_buffer')
+
+def ann_retrieval() -> Optional[AnnIndex]:
+    """The current app's ANN index when MATCH_RETRIEVAL=ann, else None"""
+    return current_app.extensions['roommatch'].ann_index
+
+PROFILE_SYNC_BATCH = 5000
+
+# Concurrent identical match generations for a user share one candidate scan
+generate_flight = SingleFlight()
+
+def store_waitlist_signups(rows: List[Dict[str, Any]]):
+    """Insert a batch of waitlist signups in one statement, skipping emails already on the list"""
+    db.session.execute(insert_ignoring_conflicts(Waitlist), rows)
+    db.session.commit()
+    metrics.waitlist_signups.inc(len(rows), outcome='written')
+
+WAITLIST_EXPORT_FIELDS = ('email', 'name', 'created_at')
 
 # Utility Functions
 def calculate_compatibility_score(profile1: UserProfile, profile2: UserProfile) -> float:
     """Calculate compatibility score between two user profiles"""
+    # Deal-breakers rule a pair out entirely
+    if vocabulary.has_deal_breaker(profile1, profile2):
+        return 0.0
+    
     score = 0.0
     total_weight = 0.0
     
@@ -119,8 +267,16 @@ def calculate_compatibility_score(profile1: UserProfile, profile2: UserProfile)
             factor_score = 1 - abs(val1 - val2) / 4  # Normalize to 0-1
             lifestyle_score += factor_score
     
+    # Interest overlap (Jaccard) counts as one more factor when both profiles list interests
+    lifestyle_count = len(lifestyle_factors)
+    interests1 = vocabulary.interest_bits(profile1)
+    interests2 = vocabulary.interest_bits(profile2)
+    if interests1 and interests2:
+        lifestyle_score += vocabulary.jaccard(interests1, interests2)
+        lifestyle_count += 1
+    
     if lifestyle_factors:
-        lifestyle_score /= len(lifestyle_factors)
+        lifestyle_score /= lifestyle_count
         score += lifestyle_score * 0.4
         total_weight += 0.4
     
@@ -162,6 +318,11 @@ def generate_match_reason(profile1: UserProfile, profile2: UserProfile, score: f
         if budget_overlap > 0:
             reasons.append("Similar budget range")
     
+    # Shared interests
+    shared_interests = vocabulary.decode(vocabulary.interest_bits(profile1) & vocabulary.interest_bits(profile2))
+    if shared_interests:
+        reasons.append(f"Shared interests: {', '.join(shared_interests[:3])}")
+    
     # Lifestyle factors
     if abs(profile1.cleanliness_level - profile2.cleanliness_level) <= 1:
         reasons.append("Compatible cleanliness standards")
@@ -186,14 +347,348 @@ def generate_match_reason(profile1: UserProfile, profile2: UserProfile, score: f
     
     return ", ".join(reasons[:3])  # Limit to 3 reasons
 
+def canonical_pair(user_a: int, user_b: int) -> tuple:
+    """(user1_id, user2_id) for a pair of users: lower ID first, as every Match is stored"""
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+def get_matched_user_ids(user_id: int) -> set:
+    """Return the IDs of every user already paired with user_id, in either direction"""
+    counterparts = db.session.query(Match.user2_id).filter(Match.user1_id == user_id).union_all(
+        db.session.query(Match.user1_id).filter(Match.user2_id == user_id)
+    )
+    return {row[0] for row in counterparts}
+
+def sync_profile_snapshots():
+    """
+    Stream profile changes made since the last sync (including by other
+    workers) into the candidate index and the compact profile store
+    """
+    statement = db.select(
+        UserProfile.user_id, UserProfile.is_complete, UserProfile.updated_at,
+        *(getattr(UserProfile, field) for field in SCORING_FIELDS)
+    )
+    read_at = datetime.utcnow()
+    since = candidate_index.sync_since()
+    if since is not None:
+        # Rows in the overlap window come back on every read: check their keys, and load
+        # only the ones not applied yet (commits that were pending at the last read)
+        watermark = candidate_index.synced_at
+        window = db.session.execute(
+            db.select(UserProfile.user_id, UserProfile.updated_at)
+            .where(UserProfile.updated_at >= since, UserProfile.updated_at <= watermark)
+        )
+        pending = [row.user_id for row in candidate_index.unseen(window)]
+        if len(pending) > PROFILE_SYNC_BATCH:
+            statement = statement.where(UserProfile.updated_at >= since)
+        else:
+            statement = statement.where(db.or_(UserProfile.updated_at > watermark, UserProfile.user_id.in_(pending)))
+    
+    ann_index = ann_retrieval()
+    result = db.session.execute(statement.execution_options(yield_per=PROFILE_SYNC_BATCH))
+    for rows in result.partitions():
+        rows = candidate_index.unseen(rows)
+        profile_store.sync(rows)
+        if ann_index is not None:
+            ann_index.sync(rows)
+        candidate_index.sync(rows, read_at)
+    
+    # Queries keep using the current lists until the retrained ones are swapped in
+    if ann_index is not None and ann_index.needs_training():
+        ann_trainer.submit('retrain', ann_index.retrain)
+
+def candidate_batch(user_id: int, profile: UserProfile, exclude: set = frozenset(),
+                    include: set = frozenset()) -> ProfileBatch:
+    """
+    Batch of complete profiles that can possibly clear the match threshold
+    against profile (in ANN mode, the nearest shortlist), always including
+    the users in include
+    """
+    sync_profile_snapshots()
+    ann_index = ann_retrieval()
+    if ann_index is not None and ann_index.is_trained:
+        candidate_ids = ann_index.candidates(profile)
+    else:
+        candidate_ids = candidate_index.candidates(profile)
+    if candidate_ids is not None and include:
+        candidate_ids |= set(include)
+    # Deal-breakers are a bitmask test per candidate, applied before anything is scored
+    return exclude_deal_breakers(profile, profile_store.batch(candidate_ids, exclude={user_id, *exclude}))
+
+def generate_matches_for_user(user_id: int, k: int = None, progress=None) -> Dict[str, Any]:
+    """Score candidates for one user and store new matches above the threshold (or the top k)"""
+    progress = progress or (lambda fraction: None)
+    profile = UserProfile.query.filter_by(user_id=user_id).first()
+    if not profile or not profile.is_complete:
+        raise ValueError('Complete your profile to generate matches')
+    
+    # Load existing pairs once instead of querying per candidate
+    batch = candidate_batch(user_id, profile, exclude=get_matched_user_ids(user_id))
+    progress(0.3)
+    
+    scoring_started = time.perf_counter()
+    if k is None:
+        # Score every candidate in one vectorized pass, keeping those > 0.6
+        scores = score_batch(profile, batch).tolist()
+        scored = [(i, score) for i, score in enumerate(scores) if score > MATCH_THRESHOLD]
+    else:
+        # Keep only the k best, pruning candidates by their score upper bound
+        scored = top_k(profile, batch, k, threshold=MATCH_THRESHOLD)
+    metrics.record_scoring(len(batch), time.perf_counter() - scoring_started)
+    progress(0.6)
+    
+    new_matches = []
+    
+    for index, score in scored:
+        potential_profile = profile_store.record(int(batch.user_ids[index]))
+        match_reason = generate_match_reason(profile, potential_profile, score)
+        new_matches.append({
+            'user_id': potential_profile.user_id,
+            'compatibility_score': score,
+            'match_reason': match_reason
+        })
+    progress(0.8)
+    
+    # Insert all new matches in a single executemany
+    if new_matches:
+        db.session.execute(db.insert(Match), [
+            {
+                'user1_id': min(user_id, new_match['user_id']),
+                'user2_id': max(user_id, new_match['user_id']),
+                'compatibility_score': new_match['compatibility_score'],
+                'match_reason': new_match['match_reason']
+            }
+            for new_match in new_matches
+        ])
+    db.session.commit()
+    users_changed(user_id, *(new_match['user_id'] for new_match in new_matches))
+    
+    return {
+        'message': f'Generated {len(new_matches)} new matches',
+        'new_matches': new_matches
+    }
+
+def refresh_user_matches(user_id: int):
+    """
+    Re-score one user's row of the pair matrix after a profile change:
+    refresh pending matches, retire those that no longer clear the
+    threshold and create any new ones
+    """
+    profile = UserProfile.query.filter_by(user_id=user_id).first()
+    matches = user_matches_query(user_id).all()
+    pending = [match for match in matches if match.status == MATCH_PENDING]
+    
+    scored = {}
+    if profile and profile.is_complete:
+        # Pending counterparts are always re-scored, even when outside an ANN shortlist
+        batch = candidate_batch(user_id, profile, include={
+            match.user2_id if match.user1_id == user_id else match.user1_id for match in pending
+        })
+        scores = score_batch(profile, batch)
+        scored = {
+            other_user_id: (profile_store.record(other_user_id), score)
+            for other_user_id, score in zip(batch.user_ids.tolist(), scores.tolist())
+            if score > MATCH_THRESHOLD
+        }
+    
+    for match in pending:
+        other_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
+        if other_user_id in scored:
+            row, score = scored[other_user_id]
+            match.compatibility_score = score
+            match.match_reason = generate_match_reason(profile, row, score)
+        else:
+            db.session.delete(match)
+    
+    matched_user_ids = {match.user1_id if match.user2_id == user_id else match.user2_id for match in matches}
+    new_matches = [
+        dict(zip(('user1_id', 'user2_id'), canonical_pair(user_id, other_user_id)),
+             compatibility_score=score, match_reason=generate_match_reason(profile, row, score))
+        for other_user_id, (row, score) in scored.items() if other_user_id not in matched_user_ids
+    ]
+    if new_matches:
+        db.session.execute(insert_ignoring_conflicts(Match), new_matches)
+    db.session.commit()
+    users_changed(user_id, *matched_user_ids, *scored)
+
+def user_matches_query(user_id: int):
+    """Every Match involving user_id, as a UNION ALL that uses an index on each side"""
+    return Match.query.filter(Match.user1_id == user_id).union_all(Match.query.filter(Match.user2_id == user_id))
+
+def match_list_query(user_id: int, limit: int, status: str = None, cursor: tuple = None, interest: str = None):
+    """
+    One page of a user's matches joined to the other user and their profile,
+    best first. Each side of the pair is its own SELECT walking its
+    (userN_id, compatibility_score, id) index, merged by a UNION ALL.
+    """
+    def side(own_user_id, other_user_id):
+        query = db.select(
+            Match.id.label('id'), Match.compatibility_score, Match.match_reason, Match.status, Match.created_at,
+            User.id.label('user_id'), User.first_name, User.last_name,
+            UserProfile.age, UserProfile.occupation, UserProfile.bio
+        ).join(
+            User, User.id == other_user_id
+        ).join(
+            UserProfile, UserProfile.user_id == User.id
+        ).where(own_user_id == user_id)
+        
+        if status:
+            query = query.where(Match.status == status)
+        # Only matches whose other user lists this interest, filtered in SQL
+        if interest:
+            query = query.where(json_array_contains(UserProfile.interests, interest))
+        # Keyset pagination on (compatibility_score, id)
+        if cursor:
+            query = query.where(db.tuple_(Match.compatibility_score, Match.id) < cursor)
+        return query
+    
+    return db.union_all(
+        side(Match.user1_id, Match.user2_id), side(Match.user2_id, Match.user1_id)
+    ).order_by(db.desc('compatibility_score'), db.desc('id')).limit(limit)
+
+def encode_cursor(score: float, match_id: int) -> str:
+    """Encode a (compatibility_score, id) keyset position as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([score, match_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        score, match_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(match_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+
+def insert_ignoring_conflicts(model):
+    """INSERT statement that skips rows violating a unique constraint where supported"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return db.insert(model)
+    return insert(model).on_conflict_do_nothing()
+
+def json_array_contains(column, value):
+    """SQL condition that a JSON array column contains value (JSONB @> on PostgreSQL, json_each on SQLite)"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return column.op('@>')(db.cast(json.dumps([value]), JSONB))
+    elements = db.func.json_each(column).table_valued('value')
+    return db.select(elements.c.value).where(elements.c.value == value).exists()
+
+def users_changed(*user_ids: int):
+    """Drop cached responses of users whose data changed and read them from the primary for a while"""
+    response_cache.invalidate(*user_ids)
+    if current_app.config['DATABASE_REPLICA_URL']:
+        recent_writes.mark(*user_ids)
+
+def all_users_changed():
+    """users_changed for everyone, e.g. after a bulk rebuild"""
+    response_cache.invalidate_all()
+    if current_app.config['DATABASE_REPLICA_URL']:
+        recent_writes.mark_all()
+
+def read_from_replica(user_id: int):
+    """Serve this request's reads from the replica, unless user_id changed data within the lag window"""
+    if current_app.config['DATABASE_REPLICA_URL']:
+        use_replica(not recent_writes.is_recent(user_id))
+
+def admin_required(view):
+    """Only allow requests carrying ADMIN_API_TOKEN in X-Admin-Token (admin routes are off while it is unset)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['ADMIN_API_TOKEN']
+        if not token or not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode()):
+            return jsonify({'error': 'Admin token required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def rate_limit_client() -> str:
+    """Rate limit key of the caller: their JWT identity on protected routes, else their address"""
+    try:
+        return f'user:{get_jwt_identity()}'
+    except RuntimeError:
+        return f'ip:{request.remote_addr}'
+
+def login_rate_limit_key() -> str:
+    """
+    Rate limit key of a login attempt: the normalized email and the caller's
+    address, so users sharing an address (an office, a carrier NAT) do not
+    use up each other's attempts
+    """
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    email = email.strip().lower() if isinstance(email, str) else ''
+    return f'email:{email}|ip:{request.remote_addr}'
+
+def rate_limited(endpoint: str, key: Callable[[], str] = rate_limit_client):
+    """Reject callers over the endpoint's rate limit with 429 and Retry-After (inside jwt_required, if any)"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            wait = rate_limiter.check(endpoint, key())
+            if wait:
+                metrics.rate_limited.inc(endpoint=endpoint)
+                return jsonify({'error': 'Too many requests, try again later'}), 429, \
+                    {'Retry-After': rate_limiter.retry_after(wait)}
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def waitlist_export_query():
+    return db.select(*(getattr(Waitlist, field) for field in WAITLIST_EXPORT_FIELDS)).order_by(Waitlist.id)
+
+def bulk_importer(batch_size: int = DEFAULT_BATCH_SIZE) -> BulkImporter:
+    return BulkImporter(db, User, UserProfile, password_hasher, PROFILE_REQUIRED_FIELDS, batch_size=batch_size)
+
+def cached_json_response(namespace: str, user_id: int, render):
+    """
+    Serve render()'s JSON response through the per-user response cache,
+    answering a matching If-None-Match with 304 before anything is rendered
+    """
+    etag = response_cache.etag(namespace, user_id, request.query_string.decode())
+    # Weak comparison, so ETags weakened by compression still revalidate
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        def build():
+            rendered = current_app.make_response(render())
+            return rendered.get_data(), rendered.status_code
+        
+        body, status = response_cache.get_or_build(etag, build)
+        response = current_app.response_class(body, status=status, mimetype='application/json')
+        if status != 200:
+            return response
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 # API Routes
+api = Blueprint('api', __name__)
+
+@api.before_app_request
+def refuse_oversized_body():
+    """Answer 413 before reading a body whose declared length is over MAX_CONTENT_LENGTH"""
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    if limit is not None and (request.content_length or 0) > limit:
+        return jsonify({'error': 'Request body too large'}), 413
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'message': 'Roommatch API is running'})
 
-@app.route('/api/auth/register', methods=['POST'])
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of this worker process, for scrapers sending METRICS_TOKEN as a bearer token"""
+    token = current_app.config['METRICS_TOKEN']
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                            f'Bearer {token}'.encode()):
+        return jsonify({'error': 'Metrics token required'}), 403
+    return current_app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/api/auth/register', methods=['POST'])
+@rate_limited('register')
 def register():
     """User registration endpoint"""
     try:
@@ -212,7 +707,7 @@ def register():
         # Create new user
         user = User(
             email=data['email'],
-            password_hash=generate_password_hash(data['password']),
+            password_hash=password_hasher.hash(data['password']),
             first_name=data['first_name'],
             last_name=data['last_name'],
             phone=data.get('phone')
@@ -227,18 +722,17 @@ def register():
         return jsonify({
             'message': 'User created successfully',
             'access_token': access_token,
-            'user': {
-                'id': user.id,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name
-            }
+            'user': serialize_account(user)
         }), 201
         
+    except HashingBusyError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
+@rate_limited('login', key=login_rate_limit_key)
 def login():
     """User login endpoint"""
     try:
@@ -249,76 +743,61 @@ def login():
         
         user = User.query.filter_by(email=data['email']).first()
         
-        if not user or not check_password_hash(user.password_hash, data['password']):
+        if not user or not password_hasher.verify(data['password'], user.password_hash):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # Upgrade hashes made with an older algorithm or cost
+        if password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.hash(data['password'])
+            db.session.commit()
+        
         access_token = create_access_token(identity=user.id)
         
         return jsonify({
             'message': 'Login successful',
             'access_token': access_token,
-            'user': {
-                'id': user.id,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'is_verified': user.is_verified
-            }
+            'user': {**serialize_account(user), 'is_verified': user.is_verified}
         }), 200
         
+    except HashingBusyError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/profile', methods=['GET'])
+@api.route('/api/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
-    """Get user profile"""
+    """Get user profile (cached, supports If-None-Match)"""
     try:
         user_id = get_jwt_identity()
+        read_from_replica(user_id)
+        return cached_json_response('profile', user_id, lambda: render_profile(user_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def render_profile(user_id: int):
+    """Build the GET /api/profile response"""
+    try:
         user = User.query.get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        profile_data = {
-            'user': {
-                'id': user.id,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'phone': user.phone,
-                'is_verified': user.is_verified
-            }
-        }
-        
-        if user.profile:
-            profile_data['profile'] = {
-                'age': user.profile.age,
-                'gender': user.profile.gender,
-                'occupation': user.profile.occupation,
-                'education': user.profile.education,
-                'budget_min': user.profile.budget_min,
-                'budget_max': user.profile.budget_max,
-                'location_preference': user.profile.location_preference,
-                'room_type': user.profile.room_type,
-                'cleanliness_level': user.profile.cleanliness_level,
-                'social_level': user.profile.social_level,
-                'noise_tolerance': user.profile.noise_tolerance,
-                'pet_preference': user.profile.pet_preference,
-                'smoking_preference': user.profile.smoking_preference,
-                'bio': user.profile.bio,
-                'is_complete': user.profile.is_complete,
-                'lifestyle_preferences': json.loads(user.profile.lifestyle_preferences) if user.profile.lifestyle_preferences else None,
-                'interests': json.loads(user.profile.interests) if user.profile.interests else None,
-                'deal_breakers': json.loads(user.profile.deal_breakers) if user.profile.deal_breakers else None
-            }
-        
-        return jsonify(profile_data), 200
+        return profile_response(user, user.profile)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/profile', methods=['POST', 'PUT'])
+def profile_response(user: User, profile: UserProfile):
+    """GET /api/profile response for a loaded user and profile (shared by the WSGI and ASGI routes)"""
+    profile_data = {'user': serialize_user(user)}
+    if profile:
+        profile_data['profile'] = serialize_profile(profile)
+    
+    return jsonify(profile_data), 200
+
+@api.route('/api/profile', methods=['POST', 'PUT'])
 @jwt_required()
 def create_update_profile():
     """Create or update user profile"""
@@ -338,6 +817,9 @@ def create_update_profile():
             profile = UserProfile(user_id=user_id)
             db.session.add(profile)
         
+        # Snapshot the fields that affect matching, to diff after the update
+        scoring_before = [getattr(profile, field) for field in SCORING_FIELDS] + [profile.is_complete]
+        
         # Update profile fields
         profile.age = data.get('age')
         profile.gender = data.get('gender')
@@ -354,21 +836,39 @@ def create_update_profile():
         profile.smoking_preference = data.get('smoking_preference')
         profile.bio = data.get('bio')
         
-        # Handle JSON fields
+        # JSON fields are stored as native JSON documents
         if data.get('lifestyle_preferences'):
-            profile.lifestyle_preferences = json.dumps(data['lifestyle_preferences'])
+            profile.lifestyle_preferences = data['lifestyle_preferences']
         if data.get('interests'):
-            profile.interests = json.dumps(data['interests'])
+            profile.interests = data['interests']
         if data.get('deal_breakers'):
-            profile.deal_breakers = json.dumps(data['deal_breakers'])
+            profile.deal_breakers = data['deal_breakers']
         
         # Check if profile is complete
-        required_fields = ['age', 'gender', 'budget_min', 'budget_max', 'location_preference', 
-                          'cleanliness_level', 'social_level', 'noise_tolerance']
-        profile.is_complete = all(getattr(profile, field) for field in required_fields)
+        profile.is_complete = all(getattr(profile, field) for field in PROFILE_REQUIRED_FIELDS)
         
         db.session.commit()
         
+        # Keep the candidate index and profile store in step with this profile
+        ann_index = ann_retrieval()
+        if profile.is_complete:
+            candidate_index.update(user_id, profile)
+            profile_store.upsert([profile])
+            if ann_index is not None:
+                ann_index.update(user_id, profile)
+        else:
+            candidate_index.remove(user_id)
+            profile_store.remove(user_id)
+            if ann_index is not None:
+                ann_index.remove(user_id)
+        
+        # Counterparts' match lists embed this profile, so drop their cached copies too
+        users_changed(user_id, *get_matched_user_ids(user_id))
+        
+        # Re-score this user's matches in the background if anything relevant changed
+        if scoring_before != [getattr(profile, field) for field in SCORING_FIELDS] + [profile.is_complete]:
+            match_worker.submit(('refresh', user_id), refresh_user_matches, user_id)
+        
         return jsonify({
             'message': 'Profile updated successfully',
             'is_complete': profile.is_complete
@@ -378,54 +878,67 @@ def create_update_profile():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/matches', methods=['GET'])
+@api.route('/api/matches', methods=['GET'])
 @jwt_required()
 def get_matches():
-    """Get user's matches"""
+    """Get user's matches, best first (paginated with ?cursor=, ?limit=, ?status= and ?interest=; cached)"""
     try:
         user_id = get_jwt_identity()
+        read_from_replica(user_id)
+        return cached_json_response('matches', user_id, lambda: render_matches(user_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def render_matches(user_id: int):
+    """Build one page of the GET /api/matches response"""
+    try:
         user = User.query.get(user_id)
         
         if not user or not user.profile or not user.profile.is_complete:
             return jsonify({'error': 'Complete your profile to see matches'}), 400
         
-        # Get all matches for this user
-        matches = Match.query.filter(
-            (Match.user1_id == user_id) | (Match.user2_id == user_id)
-        ).all()
-        
-        match_data = []
-        for match in matches:
-            # Get the other user
-            other_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
-            other_user = User.query.get(other_user_id)
-            
-            if other_user and other_user.profile:
-                match_data.append({
-                    'id': match.id,
-                    'user': {
-                        'id': other_user.id,
-                        'first_name': other_user.first_name,
-                        'last_name': other_user.last_name,
-                        'age': other_user.profile.age,
-                        'occupation': other_user.profile.occupation,
-                        'bio': other_user.profile.bio
-                    },
-                    'compatibility_score': match.compatibility_score,
-                    'match_reason': match.match_reason,
-                    'status': match.status,
-                    'created_at': match.created_at.isoformat()
-                })
+        try:
+            page = matches_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({'matches': match_data}), 200
+        rows = db.session.execute(match_list_query(user_id, page['limit'] + 1, **page['filters'])).all()
+        return matches_page_response(rows, page['limit'])
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/matches/generate', methods=['POST'])
+def matches_page_args() -> Dict[str, Any]:
+    """Page size and match_list_query filters of a GET /api/matches request, raising ValueError if invalid"""
+    limit = request.args.get('limit', MATCHES_PAGE_SIZE, type=int)
+    if not 1 <= limit <= MAX_MATCHES_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_MATCHES_PAGE_SIZE}')
+    
+    cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    return {
+        'limit': limit,
+        'filters': {'status': request.args.get('status'), 'cursor': cursor, 'interest': request.args.get('interest')}
+    }
+
+def matches_page_response(rows: list, limit: int):
+    """GET /api/matches response for match_list_query rows fetched with limit + 1 (shared by the WSGI and ASGI routes)"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    # created_at is written as ISO 8601 by the JSON provider
+    match_data = serialize_match.many(rows)
+    for match, user in zip(match_data, serialize_match_user.many(rows)):
+        match['user'] = user
+    
+    next_cursor = encode_cursor(rows[-1].compatibility_score, rows[-1].id) if has_more else None
+    
+    return jsonify({'matches': match_data, 'next_cursor': next_cursor}), 200
+
+@api.route('/api/matches/generate', methods=['POST'])
 @jwt_required()
+@rate_limited('generate')
 def generate_matches():
-    """Generate new matches for user"""
+    """Generate new matches for user (top k only via ?k=, as a background job via ?async=1)"""
     try:
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
@@ -433,63 +946,61 @@ def generate_matches():
         if not user or not user.profile or not user.profile.is_complete:
             return jsonify({'error': 'Complete your profile to generate matches'}), 400
         
-        # Find potential matches
-        potential_matches = UserProfile.query.filter(
-            UserProfile.user_id != user_id,
-            UserProfile.is_complete == True
-        ).all()
-        
-        new_matches = []
-        
-        for potential_profile in potential_matches:
-            # Check if match already exists
-            existing_match = Match.query.filter(
-                ((Match.user1_id == user_id) & (Match.user2_id == potential_profile.user_id)) |
-                ((Match.user1_id == potential_profile.user_id) & (Match.user2_id == user_id))
-            ).first()
-            
-            if existing_match:
-                continue
-            
-            # Calculate compatibility score
-            score = calculate_compatibility_score(user.profile, potential_profile)
-            
-            # Only create matches with score > 0.6
-            if score > 0.6:
-                match_reason = generate_match_reason(user.profile, potential_profile, score)
-                
-                match = Match(
-                    user1_id=user_id,
-                    user2_id=potential_profile.user_id,
-                    compatibility_score=score,
-                    match_reason=match_reason
-                )
-                
-                db.session.add(match)
-                new_matches.append({
-                    'user_id': potential_profile.user_id,
-                    'compatibility_score': score,
-                    'match_reason': match_reason
-                })
+        k = request.args.get('k', type=int)
+        if 'k' in request.args and (k is None or k < 1):
+            return jsonify({'error': 'k must be a positive integer'}), 400
         
-        db.session.commit()
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            # Repeated requests (for the same k) while a job is in flight get the same job back
+            job = match_jobs.submit('generate', f'generate:{user_id}:{k or "all"}', user_id,
+                                    generate_matches_for_user, user_id, k=k)
+            return jsonify({
+                'message': 'Match generation started',
+                'job_id': job['id'],
+                'status': job['status'],
+                'status_url': f"/api/matches/jobs/{job['id']}"
+            }), 202
+        
+        # Identical requests arriving while one is running wait for its result instead of scanning again
+        result, shared = generate_flight.do(('generate', user_id, k), lambda: generate_matches_for_user(user_id, k=k))
+        if shared:
+            metrics.coalesced.inc(operation='generate')
+        return jsonify(result), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/matches/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_match_job(job_id):
+    """Poll the status, progress and result of a match generation job"""
+    try:
+        user_id = get_jwt_identity()
+        job = match_jobs.get(job_id)
+        
+        if not job or job['owner_id'] != user_id:
+            return jsonify({'error': 'Job not found'}), 404
         
         return jsonify({
-            'message': f'Generated {len(new_matches)} new matches',
-            'new_matches': new_matches
+            'id': job['id'],
+            'status': job['status'],
+            'progress': job['progress'],
+            'result': job['result'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
         }), 200
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/matches/<int:match_id>/respond', methods=['POST'])
+@api.route('/api/matches/<int:match_id>/respond', methods=['POST'])
 @jwt_required()
-def respond_to_match():
+def respond_to_match(match_id):
     """Respond to a match (accept/reject)"""
     try:
         user_id = get_jwt_identity()
-        match_id = request.view_args['match_id']
         data = request.get_json()
         
         match = Match.query.get(match_id)
@@ -500,11 +1011,12 @@ def respond_to_match():
             return jsonify({'error': 'Unauthorized'}), 403
         
         response = data.get('response')  # 'accept' or 'reject'
-        if response not in ['accept', 'reject']:
+        if response not in MATCH_RESPONSES:
             return jsonify({'error': 'Invalid response'}), 400
         
         match.status = response
         db.session.commit()
+        users_changed(match.user1_id, match.user2_id)
         
         return jsonify({
             'message': f'Match {response}ed successfully',
@@ -515,7 +1027,38 @@ def respond_to_match():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/waitlist', methods=['POST'])
+@api.route('/api/admin/users/import', methods=['POST'])
+@admin_required
+def import_users():
+    """Import users and profiles from an NDJSON request body, one user per line"""
+    try:
+        batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+        if batch_size < 1:
+            return jsonify({'error': 'batch_size must be a positive integer'}), 400
+        
+        errors = []
+        def record_error(error):
+            if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+                errors.append(error)
+        
+        # The body is read line by line, never held in memory as a whole
+        summary = bulk_importer(batch_size).run(request.stream, on_error=record_error)
+        return jsonify({**summary, 'errors': errors, 'errors_truncated': summary['failed'] > len(errors)}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/admin/users/export', methods=['GET'])
+@admin_required
+def export_users():
+    """Stream every user and profile as NDJSON"""
+    batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+    return current_app.response_class(stream_with_context(bulk_importer().export(batch_size)), mimetype='application/x-ndjson')
+
+@api.route('/api/waitlist', methods=['POST'])
 def join_waitlist():
     """Join the waitlist (for non-registered users)"""
     try:
@@ -524,33 +1067,348 @@ def join_waitlist():
         if not data.get('email'):
             return jsonify({'error': 'Email is required'}), 400
         
-        # In a real implementation, you'd store this in a waitlist table
-        # For now, we'll just return a success message
+        email = data['email'].strip().lower() if isinstance(data['email'], str) else ''
+        if '@' not in email or len(email) > Waitlist.email.type.length:
+            return jsonify({'error': 'A valid email is required'}), 400
+        name = data.get('name')
+        if name is not None and (not isinstance(name, str) or len(name) > Waitlist.name.type.length):
+            return jsonify({'error': 'Invalid name'}), 400
+        
+        # Stored by the write-behind buffer; repeats of a waiting email are coalesced here,
+        # emails already stored are skipped by the batch insert
+        try:
+            buffered = waitlist_buffer.add(email, {'email': email, 'name': name, 'created_at': datetime.utcnow()})
+        except BufferFullError:
+            return jsonify({'error': 'Waitlist is busy, please try again shortly'}), 503, {'Retry-After': '5'}
+        metrics.waitlist_signups.inc(outcome='buffered' if buffered else 'coalesced')
         
         return jsonify({
             'message': 'Successfully joined the waitlist! We\'ll notify you when Roommatch launches.',
-            'email': data['email']
+            'email': email
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/admin/waitlist/export', methods=['GET'])
+@admin_required
+def export_waitlist():
+    """Stream the waitlist as CSV, oldest signup first"""
+    batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+    # Include this process's signups that are still waiting in the buffer
+    waitlist_buffer.flush()
+    return current_app.response_class(stream_with_context(export_csv(db, waitlist_export_query(), batch_size)),
+                              mimetype='text/csv',
+                              headers={'Content-Disposition': 'attachment; filename=waitlist.csv'})
+
 # Error handlers
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return jsonify({'error': 'Internal server error'}), 500
 
-# Database initialization
-@app.before_first_request
-def create_tables():
+# CLI Commands
+def complete_profile_rows() -> List[ProfileRow]:
+    """Scoring fields of every complete profile"""
+    return [
+        ProfileRow(*row) for row in db.session.query(
+            UserProfile.user_id, *(getattr(UserProfile, field) for field in SCORING_FIELDS)
+        ).filter(UserProfile.is_complete == True)
+    ]
+
+matches_cli = AppGroup('matches', help='Match maintenance commands.')
+
+@matches_cli.command('rebuild')
+@click.option('--since', type=click.DateTime(), help='Only re-score profiles updated after this time.')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+@click.option('--block-size', type=int, default=256, show_default=True, help='Probe users per worker task.')
+def rebuild_matches(since, workers, block_size):
+    """Precompute matches for all pairs of complete profiles"""
+    started = time.perf_counter()
+    
+    rows = complete_profile_rows()
+    profiles = {row.user_id: row for row in rows}
+    
+    changed_ids = None
+    if since:
+        # Profiles no longer complete stay in scope, so their pending matches are retired
+        changed_ids = {
+            row.user_id for row in db.session.query(UserProfile.user_id).filter(UserProfile.updated_at > since)
+        }
+    
+    # Existing pairs keyed by (lower ID, higher ID), whichever way they were stored
+    existing = {
+        (min(row.user1_id, row.user2_id), max(row.user1_id, row.user2_id)): row
+        for row in db.session.query(Match.id, Match.user1_id, Match.user2_id, Match.status)
+    }
+    
+    pairs = created = updated = 0
+    kept = set()
+    for block_matches, block_pairs in score_all_pairs(rows, changed_ids, MATCH_THRESHOLD, workers, block_size):
+        pairs += block_pairs
+        inserts = []
+        updates = []
+        for user1_id, user2_id, score in block_matches:
+            match_reason = generate_match_reason(profiles[user1_id], profiles[user2_id], score)
+            current = existing.get((user1_id, user2_id))
+            if current is None:
+                inserts.append({
+                    'user1_id': user1_id,
+                    'user2_id': user2_id,
+                    'compatibility_score': score,
+                    'match_reason': match_reason
+                })
+            elif current.status == MATCH_PENDING:
+                # Answered matches keep the score the user responded to
+                updates.append({'id': current.id, 'compatibility_score': score, 'match_reason': match_reason})
+                kept.add((user1_id, user2_id))
+        
+        if inserts:
+            db.session.execute(insert_ignoring_conflicts(Match), inserts)
+        if updates:
+            db.session.execute(db.update(Match), updates)
+        db.session.commit()
+        all_users_changed()
+        created += len(inserts)
+        updated += len(updates)
+    
+    # Pending matches in the re-scored scope that no longer clear the threshold are retired,
+    # as on a profile update (refresh_user_matches)
+    stale = [
+        {'match_id': row.id} for pair, row in existing.items()
+        if row.status == MATCH_PENDING and pair not in kept
+        and (changed_ids is None or pair[0] in changed_ids or pair[1] in changed_ids)
+    ]
+    if stale:
+        db.session.execute(Match.__table__.delete().where(Match.__table__.c.id == db.bindparam('match_id')), stale)
+        db.session.commit()
+        all_users_changed()
+    
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f'Scored {pairs} pairs from {len(rows)} profiles in {elapsed:.2f}s '
+        f'({pairs / elapsed if elapsed else 0:.0f} pairs/sec): '
+        f'{created} matches created, {updated} updated, {len(stale)} removed'
+    )
+
+@matches_cli.command('assign')
+@click.option('--capacity', type=click.IntRange(min=1), default=None,
+              help='Matches per user (default: MAX_MATCHES_PER_USER).')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+@click.option('--block-size', type=int, default=256, show_default=True, help='Probe users per worker task.')
+@click.option('--dry-run', is_flag=True, help='Report the assignment without writing it.')
+def assign_matches(capacity, workers, block_size, dry_run):
+    """Replace pending matches with a capacity-limited assignment over all pairs"""
+    started = time.perf_counter()
+    capacity = capacity or current_app.config['MAX_MATCHES_PER_USER']
+    
+    rows = complete_profile_rows()
+    profiles = {row.user_id: row for row in rows}
+    
+    # Answered pairs are never reassigned; accepted ones hold a slot of both users
+    existing = {
+        (min(row.user1_id, row.user2_id), max(row.user1_id, row.user2_id)): row
+        for row in db.session.query(Match.id, Match.user1_id, Match.user2_id, Match.status)
+    }
+    used = {}
+    for pair, row in existing.items():
+        if row.status == MATCH_ACCEPTED:
+            for user_id in pair:
+                used[user_id] = used.get(user_id, 0) + 1
+    
+    graph = PairGraph(keep_per_user=capacity * CANDIDATES_PER_SLOT)
+    pairs = 0
+    for block_matches, block_pairs in score_all_pairs(rows, None, MATCH_THRESHOLD, workers, block_size):
+        pairs += block_pairs
+        graph.add(
+            match for match in block_matches
+            if match[:2] not in existing or existing[match[:2]].status == MATCH_PENDING
+        )
+    user1, user2, scores = graph.arrays()
+    chosen = assign(user1, user2, scores, capacity, used)
+    
+    assigned = set()
+    inserts = []
+    updates = []
+    for user1_id, user2_id, score in zip(user1[chosen].tolist(), user2[chosen].tolist(), scores[chosen].tolist()):
+        assigned.add((user1_id, user2_id))
+        match_reason = generate_match_reason(profiles[user1_id], profiles[user2_id], score)
+        current = existing.get((user1_id, user2_id))
+        if current is None:
+            inserts.append({
+                'user1_id': user1_id,
+                'user2_id': user2_id,
+                'compatibility_score': score,
+                'match_reason': match_reason
+            })
+        else:
+            updates.append({'id': current.id, 'compatibility_score': score, 'match_reason': match_reason})
+    stale = [{'match_id': row.id} for pair, row in existing.items()
+             if row.status == MATCH_PENDING and pair not in assigned]
+    
+    # One transaction: drop unassigned pending matches, refresh kept ones, insert the new ones
+    if not dry_run:
+        if stale:
+            db.session.execute(
+                Match.__table__.delete().where(Match.__table__.c.id == db.bindparam('match_id')), stale
+            )
+        if updates:
+            db.session.execute(db.update(Match), updates)
+        if inserts:
+            db.session.execute(insert_ignoring_conflicts(Match), inserts)
+        db.session.commit()
+        all_users_changed()
+    
+    matched_users = len(set(user1[chosen].tolist()) | set(user2[chosen].tolist()))
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f'{"Would assign" if dry_run else "Assigned"} {len(chosen)} matches to {matched_users} of {len(rows)} '
+        f'users (at most {capacity} each) from {pairs} pairs scored and {len(scores)} kept in {elapsed:.2f}s: '
+        f'{len(inserts)} created, {len(updates)} kept, {len(stale)} pending removed'
+    )
+
+
+users_cli = AppGroup('users', help='Bulk user commands.')
+
+@users_cli.command('import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Users written per transaction.')
+def import_users_command(source, batch_size):
+    """Import users and profiles from an NDJSON file ('-' for stdin); row errors go to stderr as NDJSON"""
+    def report(error):
+        click.echo(json.dumps(error), err=True)
+    
+    summary = bulk_importer(batch_size).run(source, on_error=report)
+    click.echo(f"Imported {summary['imported']} users, {summary['failed']} rows failed")
+
+@users_cli.command('export')
+@click.argument('target', type=click.File('w'), default='-')
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows fetched per round trip.')
+def export_users_command(target, batch_size):
+    """Write every user and profile as NDJSON to a file (default stdout)"""
+    for line in bulk_importer().export(batch_size):
+        target.write(line)
+
+
+waitlist_cli = AppGroup('waitlist', help='Waitlist commands.')
+
+@waitlist_cli.command('export')
+@click.argument('target', type=click.File('w'), default='-')
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows fetched per round trip.')
+def export_waitlist_command(target, batch_size):
+    """Write the waitlist as CSV to a file (default stdout)"""
+    for chunk in export_csv(db, waitlist_export_query(), batch_size):
+        target.write(chunk)
+
+
+schema_cli = AppGroup('schema', help='Database schema commands.')
+
+def upgrade_database(target: Optional[int] = None) -> List[tuple]:
+    """Create missing tables and apply pending migrations up to target; returns those applied"""
     db.create_all()
+    return migrations.upgrade(db.engine, target)
+
+@schema_cli.command('upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Stop after this version.')
+def upgrade_schema(target):
+    """Create missing tables and apply pending migrations"""
+    applied = upgrade_database(target)
+    for version, description in applied:
+        click.echo(f'Applied {version}: {description}')
+    click.echo(f'Schema at version {migrations.current_version(db.engine)}')
+
+@schema_cli.command('version')
+def schema_version():
+    """Show the current schema version"""
+    click.echo(migrations.current_version(db.engine))
+
+
+# Application factory
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """
+    Build the app: settings from the environment (then config), extensions,
+    services, routes and CLI commands. Nothing here touches the database;
+    run `flask schema upgrade` to create or migrate the schema
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    configure(app, config)
+    
+    # Behind PROXY_FIX_X_FOR reverse proxies, take the client address from X-Forwarded-For
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
+    db.init_app(app)
+    jwt.init_app(app)
+    cors.init_app(app, origins=app.config['CORS_ORIGINS'])
+    with app.app_context():
+        # Engines are created here but connect on first use
+        metrics.init_app(app, db.engines.values())
+    
+    # gzip/Brotli for responses of at least COMPRESSION_MIN_SIZE bytes (0 = off)
+    Compressor(min_size=app.config['COMPRESSION_MIN_SIZE']).init_app(app)
+    
+    app.extensions['roommatch'] = Services(app)
+    app.register_blueprint(api)
+    for group in (matches_cli, users_cli, waitlist_cli, schema_cli):
+        app.cli.add_command(group)
+    return app
+
+def warm_up(app: Flask):
+    """
+    Load the candidate caches before serving. The gunicorn master runs this
+    before forking (see gunicorn.conf.py), so workers start with the caches
+    in copy-on-write memory instead of each loading them on its first request
+    """
+    with app.app_context():
+        try:
+            sync_profile_snapshots()
+            # Workers inherit the trained ANN index instead of each training their own
+            ann_trainer.join()
+        except Exception:
+            logger.exception('Cache warm-up failed (is the schema upgraded?); caches will load on first use')
+        # Connections must not be shared with forked workers
+        for engine in db.engines.values():
+            engine.dispose()
+
+def after_fork(app: Flask):
+    """
+    Drop connection pools inherited from a parent process without closing its
+    connections, and start fresh worker threads and process pools
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    app.extensions['roommatch'].start_workers(app)
+
+def check_worker_backends(app: Flask, workers: int):
+    """
+    Refuse to serve from several worker processes over a per-process response
+    cache: a write handled by one worker would leave the others answering with
+    stale responses and ETags. gunicorn.conf.py runs this before forking
+    """
+    url = app.config['RESPONSE_CACHE_URL']
+    if workers > 1 and not is_shared_url(url):
+        raise RuntimeError(f'RESPONSE_CACHE_URL={url} keeps the cache inside each process; '
+                           f'point it at a shared redis:// URL to run {workers} workers')
+    # Per-process rate limits still work, only looser: each worker allows the full limit
+    if workers > 1 and not is_shared_url(app.config['RATE_LIMIT_URL']):
+        logger.warning('RATE_LIMIT_URL=%s keeps rate limits per process, so clients get up to %d times '
+                       'each limit; point it at a shared redis:// URL to enforce them exactly',
+                       app.config['RATE_LIMIT_URL'], workers)
 
 if __name__ == '__main__':
+    app = create_app()
+    # The development server upgrades the schema itself; deployments run `flask schema upgrade`
     with app.app_context():
-        db.create_all()
+        upgrade_database()
     app.run(debug=True, host='0.0.0.0', port=5000)
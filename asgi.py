@@ -0,0 +1,291 @@
+"""
+ASGI entry point for Roommatch.
+
+    uvicorn asgi:application --workers 4
+
+GET /api/health, /api/profile and /api/matches are served by async views
+that query through an asyncio SQLAlchemy engine (aiosqlite for SQLite,
+asyncpg for PostgreSQL), so one worker keeps many database round trips in
+flight instead of one per thread. Every other route is the Flask app,
+called on the event loop's thread pool. Its request body is received as
+the app reads it (so a bulk import is never held in memory whole) and its
+response is streamed back chunk by chunk.
+
+The async views run inside a Flask request context built from the ASGI
+scope, so JWT checks, the before/after request hooks (metrics, CORS), the
+response cache, ETags and the response bodies are the same as the WSGI
+routes'. Calls into the response cache and the recent-writes tracker (network
+round trips with the Redis backend) run on the loop's thread pool too, so
+they never block the event loop. Needs an ASGI server such as uvicorn and the async driver of the
+database.
+"""
+
+import asyncio
+import io
+import sys
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from flask import Flask, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import User, UserProfile, create_app, db, match_list_query, matches_page_args, matches_page_response, \
+    metrics, pool_settings, profile_response, recent_writes, response_cache
+from database import REPLICA_BIND, async_engine
+
+app = create_app()
+
+
+class AsyncDatabase:
+    """asyncio engines for the app's primary database and optional read replica, created on first use"""
+
+    def __init__(self, flask_app: Flask):
+        self.flask_app = flask_app
+        self._engines: Dict[Optional[str], Any] = {}
+
+    def engine(self, bind: Optional[str] = None):
+        if bind not in self._engines:
+            with self.flask_app.app_context():
+                # The sync engine's URL, after Flask-SQLAlchemy resolved relative SQLite paths
+                url = db.engines[bind].url.render_as_string(hide_password=False)
+            engine = self._engines[bind] = async_engine(url, **pool_settings(self.flask_app.config))
+            metrics.watch_engine(engine.sync_engine)
+        return self._engines[bind]
+
+    async def session(self, user_id: Any) -> AsyncSession:
+        """Session for a user's reads: the replica, unless they changed data within the lag window"""
+        if self.flask_app.config['DATABASE_REPLICA_URL'] and not await run_blocking(recent_writes.is_recent, user_id):
+            return AsyncSession(self.engine(REPLICA_BIND))
+        return AsyncSession(self.engine())
+
+    async def dispose(self):
+        for engine in self._engines.values():
+            await engine.dispose()
+        self._engines.clear()
+
+
+async_db = AsyncDatabase(app)
+
+
+async def run_blocking(func: Callable[..., Any], *args) -> Any:
+    """Run a blocking call (e.g. a cache round trip) on the loop's thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+async def cached_json_response(namespace: str, user_id: int, render: Callable[[], Awaitable[Any]]):
+    """Async counterpart of app.cached_json_response"""
+    # The proxies are resolved here, in the request context; the pool threads only get bound methods
+    etag = await run_blocking(response_cache.etag, namespace, user_id, request.query_string.decode())
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        body = await run_blocking(response_cache.get, etag)
+        if body is None:
+            rendered = app.make_response(await render())
+            if rendered.status_code != 200:
+                return rendered
+            body = rendered.get_data()
+            await run_blocking(response_cache.put, etag, body)
+        response = app.response_class(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Async views
+
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({'status': 'healthy', 'message': 'Roommatch API is running'})
+
+
+async def get_profile():
+    """Get user profile (cached, supports If-None-Match)"""
+    try:
+        user_id = get_jwt_identity()
+
+        async def render():
+            async with await async_db.session(user_id) as session:
+                user = await session.get(User, user_id)
+                if not user:
+                    return jsonify({'error': 'User not found'}), 404
+                profile = await session.scalar(select(UserProfile).where(UserProfile.user_id == user_id))
+                return profile_response(user, profile)
+
+        return await cached_json_response('profile', user_id, render)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+async def get_matches():
+    """Get user's matches, best first (paginated with ?cursor=, ?limit=, ?status= and ?interest=; cached)"""
+    try:
+        user_id = get_jwt_identity()
+
+        async def render():
+            async with await async_db.session(user_id) as session:
+                is_complete = await session.scalar(
+                    select(UserProfile.is_complete).where(UserProfile.user_id == user_id)
+                )
+                if not is_complete:
+                    return jsonify({'error': 'Complete your profile to see matches'}), 400
+
+                try:
+                    page = matches_page_args()
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+
+                rows = (await session.execute(match_list_query(user_id, page['limit'] + 1, **page['filters']))).all()
+                return matches_page_response(rows, page['limit'])
+
+        return await cached_json_response('matches', user_id, render)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Path -> (view, requires a JWT); only GET requests are served asynchronously
+ASYNC_ROUTES = {
+    '/api/health': (health_check, False),
+    '/api/profile': (get_profile, True),
+    '/api/matches': (get_matches, True),
+}
+
+
+class ReceiveStream(io.RawIOBase):
+    """Request body read from ASGI receive() by a thread pool thread, one message at a time"""
+
+    def __init__(self, receive: Callable[[], Awaitable[Dict[str, Any]]], loop: asyncio.AbstractEventLoop):
+        self.receive = receive
+        self.loop = loop
+        self._chunk = memoryview(b'')
+        self._more = True
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._chunk and self._more:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            # A client that disconnects ends the body early; Werkzeug reports the missing bytes
+            self._chunk = memoryview(message.get('body', b''))
+            self._more = message['type'] == 'http.request' and message.get('more_body', False)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def environ_from_scope(scope: Dict[str, Any], body: Optional[io.RawIOBase] = None) -> Dict[str, Any]:
+    """WSGI environ for an ASGI HTTP request, reading its body from body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BufferedReader(body) if body is not None else io.BytesIO(),
+        # The body stream ends with the request body, even without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def encode_headers(headers) -> list:
+    return [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+
+class Application:
+    """ASGI application serving ASYNC_ROUTES natively and everything else through the Flask app"""
+
+    def __init__(self, flask_app: Flask, routes: Dict[str, Any]):
+        self.flask_app = flask_app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        route = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+        if route is None:
+            await self.call_wsgi(scope, receive, send)
+            return
+
+        response = await self.dispatch(scope, *route)
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': encode_headers(response.headers.items())})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def dispatch(self, scope, view, protected: bool):
+        """Run an async view like Flask would: request hooks, JWT check and error handlers included"""
+        flask_app = self.flask_app
+        with flask_app.request_context(environ_from_scope(scope)):
+            try:
+                response = flask_app.preprocess_request()
+                if response is None:
+                    if protected:
+                        verify_jwt_in_request()
+                    response = await view()
+            except Exception as e:
+                try:
+                    response = flask_app.handle_user_exception(e)
+                except Exception as unhandled:
+                    response = flask_app.handle_exception(unhandled)
+            return flask_app.process_response(flask_app.make_response(response))
+
+    async def call_wsgi(self, scope, receive, send):
+        """Run the Flask app on the loop's thread pool, streaming its request body and response"""
+        loop = asyncio.get_running_loop()
+        environ = environ_from_scope(scope, ReceiveStream(receive, loop))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        result = await loop.run_in_executor(None, self.flask_app.wsgi_app, environ, start_response)
+        chunks = iter(result)
+        try:
+            # start_response may be deferred until the first chunk of a streamed response
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': encode_headers(started['headers'])})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(None, result.close)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = Application(app, ASYNC_ROUTES)
@@ -0,0 +1,57 @@
+"""
+Minimal in-process background worker for Roommatch.
+
+Tasks run one at a time on a daemon thread so request handlers can hand off
+slow work and return immediately. Tasks submitted under a key that is
+already waiting in the queue are coalesced into the queued one.
+"""
+
+import logging
+import queue
+import threading
+from contextlib import nullcontext
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """Single-thread task queue with per-key coalescing"""
+
+    def __init__(self, name: str, context: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self._context = context or nullcontext
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, key: Hashable, func: Callable, *args, **kwargs) -> bool:
+        """Queue func(*args, **kwargs); return False if an equal key is already queued"""
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        self._queue.put((key, func, args, kwargs))
+        return True
+
+    def join(self):
+        """Block until every queued task has finished"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            key, func, args, kwargs = self._queue.get()
+            # Release the key first so changes made while running queue a new pass
+            with self._lock:
+                self._pending.discard(key)
+            try:
+                with self._context():
+                    func(*args, **kwargs)
+            except Exception:
+                logger.exception('Background task %r failed', key)
+            finally:
+                self._queue.task_done()
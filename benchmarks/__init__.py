@@ -0,0 +1 @@
+"""Reproducible benchmarks for Roommatch (run from the repository root with python -m benchmarks.<name>)"""
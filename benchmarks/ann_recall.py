@@ -0,0 +1,143 @@
+"""
+Recall and latency of approximate (IVF) candidate retrieval against the exact path.
+
+Builds a seeded population in memory (no database), loads it into the
+profile store, the exact candidate index and an ANN index, then for a
+sample of probe users compares, at each --probes setting:
+- recall: the share of the exact matches (score above the threshold) the
+  ANN shortlist still finds
+- recall@k: the share of the exact top k it still finds
+- shortlist: candidates scored per query, against the exact path's
+- retrieval plus scoring latency, against the exact path's
+
+    python -m benchmarks.ann_recall --size 200000 --probes 1,4,8,16,32 --k 50
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from ann_index import AnnIndex
+from benchmarks.populations import profile_fields
+from candidate_index import CandidateIndex
+from precompute import ProfileRow
+from profile_store import ProfileStore
+from scoring import MATCH_THRESHOLD, SCORING_FIELDS, exclude_deal_breakers, score_batch
+
+
+def build(size: int, seed: int, lists: int = None):
+    """Populate the store and both indexes with the complete profiles of a seeded population"""
+    rng = random.Random(seed)
+    rows = []
+    for user_id in range(1, size + 1):
+        fields = profile_fields(rng)
+        if fields['is_complete']:
+            rows.append(ProfileRow(user_id, *(fields[field] for field in SCORING_FIELDS)))
+
+    store, exact, ann = ProfileStore(), CandidateIndex(), AnnIndex(lists=lists, seed=seed)
+    store.upsert(rows)
+    started = time.perf_counter()
+    for row in rows:
+        exact.update(row.user_id, row)
+    for row in rows:
+        ann.update(row.user_id, row)
+    ann.train()
+    return rows, store, exact, ann, time.perf_counter() - started
+
+
+def matches(profile: Any, store: ProfileStore, candidate_ids) -> Tuple[Dict[int, float], int]:
+    """Scores above the threshold by user ID, as candidate_batch and score_batch find them, and the candidates scored"""
+    batch = exclude_deal_breakers(profile, store.batch(candidate_ids, exclude={profile.user_id}))
+    scores = score_batch(profile, batch)
+    keep = scores > MATCH_THRESHOLD
+    return dict(zip(batch.user_ids[keep].tolist(), scores[keep].tolist())), len(batch)
+
+
+def top(scored: Dict[int, float], k: int) -> set:
+    return {user_id for user_id, _ in sorted(scored.items(), key=lambda item: (-item[1], item[0]))[:k]}
+
+
+def run(size: int, seed: int, samples: int, probes: List[int], k: int, lists: int = None) -> Dict[str, Any]:
+    rows, store, exact, ann, build_seconds = build(size, seed, lists)
+    sample = random.Random(seed).sample(rows, min(samples, len(rows)))
+    results: Dict[str, Any] = {
+        'size': size, 'complete_profiles': len(rows), 'lists': len(ann.centroids), 'k': k,
+        'index_build_seconds': round(build_seconds, 2),
+    }
+
+    truth, exact_ms, exact_scored = {}, [], []
+    for profile in sample:
+        started = time.perf_counter()
+        truth[profile.user_id], scored = matches(profile, store, exact.candidates(profile))
+        exact_ms.append((time.perf_counter() - started) * 1000)
+        exact_scored.append(scored)
+    results['exact'] = {
+        'p50_ms': round(statistics.median(exact_ms), 2),
+        'mean_shortlist': round(statistics.mean(exact_scored)),
+        'mean_matches': round(statistics.mean(len(found) for found in truth.values())),
+    }
+
+    results['ann'] = []
+    for probe_count in probes:
+        latencies, shortlists, recalls, top_recalls = [], [], [], []
+        for profile in sample:
+            started = time.perf_counter()
+            found, scored = matches(profile, store, ann.candidates(profile, probes=probe_count))
+            latencies.append((time.perf_counter() - started) * 1000)
+            shortlists.append(scored)
+            expected = truth[profile.user_id]
+            if expected:
+                recalls.append(len(found.keys() & expected.keys()) / len(expected))
+                best = top(expected, k)
+                top_recalls.append(len(top(found, k) & best) / len(best))
+        results['ann'].append({
+            'probes': probe_count,
+            'recall': round(statistics.mean(recalls), 4) if recalls else None,
+            'recall_at_k': round(statistics.mean(top_recalls), 4) if top_recalls else None,
+            'mean_shortlist': round(statistics.mean(shortlists)),
+            'p50_ms': round(statistics.median(latencies), 2),
+        })
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Measure ANN candidate recall against exact retrieval')
+    parser.add_argument('--size', type=int, default=100000, help='Users to generate.')
+    parser.add_argument('--samples', type=int, default=200, help='Probe users to query.')
+    parser.add_argument('--probes', default='1,2,4,8,16,32', help='Comma-separated probe counts.')
+    parser.add_argument('--lists', type=int, help='IVF lists (default: sqrt of the pool).')
+    parser.add_argument('--k', type=int, default=20, help='Top matches compared for recall@k.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-recall-at-k', type=float,
+                        help='Exit 1 unless the largest probe count reaches this recall@k.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    probes = [int(value) for value in args.probes.split(',')]
+    results = run(args.size, args.seed, args.samples, probes, args.k, args.lists)
+
+    exact = results['exact']
+    print(f"{results['complete_profiles']} profiles, {results['lists']} lists, "
+          f"index built in {results['index_build_seconds']}s")
+    print(f'{"probes":>7}{"recall":>9}{"recall@k":>10}{"shortlist":>11}{"p50 ms":>9}')
+    print(f'{"exact":>7}{1:>9}{1:>10}{exact["mean_shortlist"]:>11}{exact["p50_ms"]:>9}')
+    for row in results['ann']:
+        print(f'{row["probes"]:>7}{row["recall"]:>9}{row["recall_at_k"]:>10}{row["mean_shortlist"]:>11}'
+              f'{row["p50_ms"]:>9}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.min_recall_at_k is not None and (results['ann'][-1]['recall_at_k'] or 0) < args.min_recall_at_k:
+        print(f'recall@k below {args.min_recall_at_k}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+gunicorn config module the load test uses to simulate a networked database.
+
+With LOAD_TEST_DB_LATENCY_MS set, every SQLite statement first sleeps that
+long in the thread executing it: the request thread for the sync driver
+(like psycopg2 waiting on the network) and the connection's own thread for
+aiosqlite (like asyncpg, which leaves the event loop free meanwhile).
+"""
+
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY = float(os.environ.get('LOAD_TEST_DB_LATENCY_MS', 0)) / 1000
+
+
+def add_latency(dbapi_connection, connection_record):
+    def wait(statement):
+        time.sleep(LATENCY)
+
+    if hasattr(dbapi_connection, 'set_trace_callback'):
+        dbapi_connection.set_trace_callback(wait)
+    else:
+        # SQLAlchemy's aiosqlite adapter: install it on the driver connection, in its thread
+        dbapi_connection.await_(dbapi_connection.driver_connection.set_trace_callback(wait))
+
+
+def post_fork(server, worker):
+    if LATENCY:
+        event.listen(Engine, 'connect', add_latency)
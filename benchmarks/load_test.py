@@ -0,0 +1,199 @@
+"""
+Load test of the WSGI and ASGI serving modes.
+
+Seeds a population into a throwaway SQLite database (or uses --database-url),
+generates matches for a sample of users, then starts each server with the
+same number of worker processes:
+- wsgi: gunicorn sync workers running wsgi:app (one request at a time per worker)
+- asgi: gunicorn with uvicorn workers running asgi:application
+and drives GET /api/matches and GET /api/profile at each concurrency level
+over keep-alive HTTP/1.1 connections, reporting requests/sec and latency.
+The response cache is disabled unless --cached is given, so every request
+reaches the database.
+
+A local SQLite database answers in microseconds, which leaves nothing for
+async views to overlap: both modes are then bound by Python CPU time. So
+--db-latency-ms (default 2) adds a per-statement delay standing in for
+the network round trip to a database server (see benchmarks/latency.py);
+pass 0 to measure plain SQLite, or --database-url to use a real server.
+
+    python -m benchmarks.load_test --workers 1 --concurrency 1,32,256 --duration 10
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUNICORN = [sys.executable, '-m', 'gunicorn', '--config', 'python:benchmarks.latency', '--log-level', 'warning']
+SERVERS = {
+    'wsgi': lambda port, workers: [*GUNICORN, '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+    'asgi': lambda port, workers: [*GUNICORN, '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+                                   '--worker-class', 'uvicorn.workers.UvicornWorker', 'asgi:application'],
+}
+PATHS = ('/api/matches', '/api/profile')
+
+
+def prepare(database_url: str, size: int, users: int, seed: int) -> List[str]:
+    """Seed the database, generate matches for a sample of users and return their access tokens"""
+    os.environ.update({'DATABASE_URL': database_url, 'JOB_STORE_URL': 'memory', 'PASSWORD_HASH_WORKERS': '0'})
+    from flask_jwt_extended import create_access_token
+
+    import app as roommatch
+    import migrations
+    from app import User, UserProfile, db
+    from benchmarks.populations import seed_population
+
+    with roommatch.create_app().app_context():
+        db.create_all()
+        migrations.upgrade(db.engine)
+        if not db.session.query(User.id).first():
+            seed_population(db, User, UserProfile, size, seed)
+        complete_ids = [row[0] for row in db.session.query(UserProfile.user_id).filter(UserProfile.is_complete == True)]
+        sample = random.Random(seed).sample(complete_ids, min(users, len(complete_ids)))
+        for user_id in sample:
+            roommatch.generate_matches_for_user(user_id)
+        return [create_access_token(identity=user_id) for user_id in sample]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def fetch(connection, host: str, path: str, token: str):
+    """Send one keep-alive GET; returns (status, connection to reuse or None)"""
+    reader, writer = connection
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n\r\n'.encode())
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('Server closed the connection')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    if headers.get('connection', '').lower() == 'close':
+        writer.close()
+        connection = None
+    return int(status_line.split()[1]), connection
+
+
+async def client(host: str, port: int, requests, deadline: float, latencies: List[float], errors: List[int]):
+    connection = None
+    while time.perf_counter() < deadline:
+        path, token = next(requests)
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            status, connection = await fetch(connection, host, path, token)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Keep-alive connection dropped by the server; retry on a fresh one
+            connection = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors.append(status)
+    if connection is not None:
+        connection[1].close()
+
+
+async def load(port: int, tokens: List[str], concurrency: int, duration: float) -> Dict[str, Any]:
+    """Drive the server with concurrency clients for duration seconds"""
+    requests = itertools.cycle([(path, token) for token in tokens for path in PATHS])
+    latencies: List[float] = []
+    errors: List[int] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client('127.0.0.1', port, requests, started + duration, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        'errors': len(errors),
+    }
+
+
+def serve(mode: str, workers: int, env: Dict[str, str]):
+    """Start a server and wait until it answers the health check"""
+    port = free_port()
+    process = subprocess.Popen(SERVERS[mode](port, workers), cwd=ROOT, env=env)
+    for _ in range(200):
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.1) as sock:
+                sock.sendall(b'GET /api/health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if sock.recv(64).startswith(b'HTTP/1.1 200'):
+                    return process, port
+        except OSError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Compare WSGI and ASGI serving throughput')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes per server.')
+    parser.add_argument('--concurrency', default='1,32,256', help='Comma-separated concurrent client counts.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level.')
+    parser.add_argument('--size', type=int, default=10000, help='Users to seed.')
+    parser.add_argument('--users', type=int, default=200, help='Users making requests.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', help='Existing database to test against (seeded if empty).')
+    parser.add_argument('--db-latency-ms', type=float, default=2, help='Simulated round trip per SQLite statement.')
+    parser.add_argument('--cached', action='store_true', help='Keep the response cache enabled.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="roommatch-load-"), "load.db")}'
+    tokens = prepare(database_url, args.size, args.users, args.seed)
+    env = dict(os.environ, DATABASE_URL=database_url, JOB_STORE_URL='memory', PASSWORD_HASH_WORKERS='0',
+               PYTHONPATH=ROOT, LOAD_TEST_DB_LATENCY_MS=str(args.db_latency_ms))
+    if not args.cached:
+        env['RESPONSE_CACHE_SIZE'] = '0'
+
+    results = []
+    print(f'{"mode":<6}{"clients":>9}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for mode in args.modes.split(','):
+        process, port = serve(mode, args.workers, env)
+        try:
+            # Warm every worker up (first-request setup, connection pools) before measuring
+            asyncio.run(load(port, tokens, args.workers * 4, 1))
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                result = {'mode': mode, **asyncio.run(load(port, tokens, concurrency, args.duration))}
+                results.append(result)
+                print(f'{mode:<6}{concurrency:>9}{result["requests_per_sec"]:>10}{result["p50_ms"]:>10}'
+                      f'{result["p99_ms"]:>10}{result["errors"]:>8}')
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'workers': args.workers, 'cached': args.cached, 'db_latency_ms': args.db_latency_ms,
+                       'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
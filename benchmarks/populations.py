@@ -0,0 +1,75 @@
+"""
+Synthetic user populations for Roommatch benchmarks.
+
+Profiles are drawn from a seeded RNG, so every run (and every machine)
+benchmarks exactly the same data. Users are inserted with a placeholder
+password hash; benchmarks authenticate with JWTs created directly.
+"""
+
+import random
+from typing import Any, Dict, List
+
+from vocabulary import TERMS
+
+CITIES = [f'City {i}' for i in range(40)]
+INTERESTS = TERMS[:40]
+HABITS = TERMS[40:]
+PREFERENCES = ['yes', 'no', 'maybe']
+
+# Rows per INSERT batch while seeding
+SEED_CHUNK = 20000
+
+
+def profile_fields(rng: random.Random) -> Dict[str, Any]:
+    """Random profile answers with roughly the spread of real sign-ups"""
+    budget_min = rng.randrange(400, 3000, 50)
+    fields = {
+        'age': rng.randint(18, 45),
+        'gender': rng.choice(['female', 'male', 'non-binary']),
+        'occupation': rng.choice(['Engineer', 'Student', 'Designer', 'Nurse', 'Teacher', None]),
+        'budget_min': budget_min,
+        'budget_max': budget_min + rng.randrange(200, 1500, 50),
+        'location_preference': rng.choice(CITIES),
+        'room_type': rng.choice(['single', 'shared', 'studio']),
+        'cleanliness_level': rng.randint(1, 5),
+        'social_level': rng.randint(1, 5),
+        'noise_tolerance': rng.randint(1, 5),
+        'pet_preference': rng.choice(PREFERENCES),
+        'smoking_preference': rng.choice(PREFERENCES),
+        'bio': 'Looking for a friendly roommate.',
+        'interests': rng.sample(INTERESTS, rng.randint(0, 5)) or None,
+        'deal_breakers': rng.sample(HABITS, rng.randint(1, 2)) if rng.random() < 0.3 else None,
+    }
+    # A few profiles are left unfinished, as in production
+    if rng.random() < 0.05:
+        fields['noise_tolerance'] = None
+    fields['is_complete'] = all(fields[field] for field in (
+        'age', 'gender', 'budget_min', 'budget_max', 'location_preference',
+        'cleanliness_level', 'social_level', 'noise_tolerance'
+    ))
+    return fields
+
+
+def seed_population(db: Any, user_model: Any, profile_model: Any, size: int, seed: int = 0) -> int:
+    """Insert users 1..size with profiles in bulk; returns the number of complete profiles"""
+    rng = random.Random(seed)
+    complete = 0
+    for start in range(1, size + 1, SEED_CHUNK):
+        stop = min(start + SEED_CHUNK, size + 1)
+        users: List[Dict[str, Any]] = []
+        profiles: List[Dict[str, Any]] = []
+        for user_id in range(start, stop):
+            users.append({
+                'id': user_id,
+                'email': f'user{user_id}@bench.roommatch.com',
+                'password_hash': 'x',
+                'first_name': 'Bench',
+                'last_name': f'User{user_id}',
+            })
+            fields = profile_fields(rng)
+            complete += fields['is_complete']
+            profiles.append({'user_id': user_id, **fields})
+        db.session.execute(db.insert(user_model), users)
+        db.session.execute(db.insert(profile_model), profiles)
+        db.session.commit()
+    return complete
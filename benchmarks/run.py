@@ -0,0 +1,242 @@
+"""
+Scoring, match generation and API benchmarks for Roommatch.
+
+Each population size runs in a fresh process against its own SQLite file.
+After seeding it measures:
+- POST /api/matches/generate latency and queries per request
+- GET /api/matches latency (cold and cached) and queries against the
+  user's match count
+- calculate_compatibility_score and score_batch throughput in pairs/sec
+Requests go through Flask's test client. Results are written as JSON and,
+given a baseline, compared against it; the exit status is 1 on regression.
+
+    python -m benchmarks.run --sizes 1000,10000 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+DEFAULT_SIZES = '1000,10000'
+# Allowed relative slowdown of medians and throughput before it counts as a regression;
+# single-shot and tail timings (seeding, first request, p95) are reported but not compared
+DEFAULT_TOLERANCE = 0.3
+# Absolute slack for millisecond timings, which are noisy when tiny
+MS_SLACK = 0.5
+# Random pairs scored by the scalar calculate_compatibility_score benchmark
+SCALAR_PAIRS = 20000
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def run_size(size: int, seed: int, samples: int) -> Dict[str, Any]:
+    """Seed a population of size users and benchmark it (runs in its own process)"""
+    workdir = tempfile.mkdtemp(prefix='roommatch-bench-')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "bench.db")}',
+        'JOB_STORE_URL': 'memory',
+        'RESPONSE_CACHE_URL': 'memory',
+        'PASSWORD_HASH_WORKERS': '0',
+    })
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import event
+
+    import app as roommatch
+    import migrations
+    from app import Match, User, UserProfile, db
+    from benchmarks.populations import seed_population
+    from scoring import score_batch
+
+    flask_app = roommatch.create_app()
+    rng = random.Random(seed)
+    results: Dict[str, Any] = {'size': size}
+
+    with flask_app.app_context():
+        db.create_all()
+        migrations.upgrade(db.engine)
+        started = time.perf_counter()
+        results['complete_profiles'] = seed_population(db, User, UserProfile, size, seed)
+        results['seed_seconds'] = round(time.perf_counter() - started, 3)
+
+        complete_ids = [row[0] for row in db.session.query(UserProfile.user_id).filter(UserProfile.is_complete == True)]
+        sample = rng.sample(complete_ids, min(samples, len(complete_ids)))
+        headers = {user_id: {'Authorization': f'Bearer {create_access_token(identity=user_id)}'} for user_id in sample}
+
+    queries: List[str] = []
+    with flask_app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+
+    def timed_request(method: str, url: str, user_id: int):
+        queries.clear()
+        started = time.perf_counter()
+        response = client.open(url, method=method, headers=headers[user_id])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        assert response.status_code == 200, response.get_json()
+        return response.get_json(), elapsed_ms, len(queries)
+
+    client = flask_app.test_client()
+    client.get('/api/health')
+
+    # Match generation; the first request also loads the profile snapshot
+    latencies, query_counts, created = [], [], []
+    for user_id in sample:
+        payload, elapsed_ms, query_count = timed_request('POST', '/api/matches/generate', user_id)
+        latencies.append(elapsed_ms)
+        query_counts.append(query_count)
+        created.append(len(payload['new_matches']))
+    results['generate'] = {
+        'requests': len(sample),
+        'first_request_ms': round(latencies[0], 2),
+        'p50_ms': round(percentile(latencies[1:] or latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies[1:] or latencies, 0.95), 2),
+        'mean_new_matches': round(statistics.mean(created), 1),
+        'max_queries': max(query_counts[1:] or query_counts),
+    }
+
+    # Match listing, cold (cache just invalidated) and warm, against match count
+    with flask_app.app_context():
+        match_counts = {user_id: roommatch.user_matches_query(user_id).count() for user_id in sample}
+    records = []
+    for user_id in sorted(sample, key=match_counts.get):
+        with flask_app.app_context():
+            roommatch.response_cache.invalidate(user_id)
+        _, cold_ms, cold_queries = timed_request('GET', '/api/matches', user_id)
+        _, warm_ms, warm_queries = timed_request('GET', '/api/matches', user_id)
+        records.append({
+            'matches': match_counts[user_id],
+            'cold_ms': round(cold_ms, 2),
+            'warm_ms': round(warm_ms, 2),
+            'cold_queries': cold_queries,
+            'warm_queries': warm_queries,
+        })
+    results['get_matches'] = {
+        'p50_cold_ms': round(percentile([record['cold_ms'] for record in records], 0.5), 2),
+        'p95_cold_ms': round(percentile([record['cold_ms'] for record in records], 0.95), 2),
+        'p50_warm_ms': round(percentile([record['warm_ms'] for record in records], 0.5), 2),
+        'max_cold_queries': max(record['cold_queries'] for record in records),
+        'max_warm_queries': max(record['warm_queries'] for record in records),
+        'by_match_count': records,
+    }
+
+    # Scoring throughput: the scalar reference function and the vectorized batch path
+    with flask_app.app_context():
+        profiles = UserProfile.query.filter_by(is_complete=True).limit(2000).all()
+        pairs = [(rng.choice(profiles), rng.choice(profiles)) for _ in range(SCALAR_PAIRS)]
+        started = time.perf_counter()
+        for profile1, profile2 in pairs:
+            roommatch.calculate_compatibility_score(profile1, profile2)
+        scalar_seconds = time.perf_counter() - started
+
+        batch = roommatch.profile_store.batch()
+        probes = profiles[:samples]
+        started = time.perf_counter()
+        for probe in probes:
+            score_batch(probe, batch)
+        batch_seconds = time.perf_counter() - started
+    results['scoring'] = {
+        'scalar_pairs_per_sec': round(len(pairs) / scalar_seconds),
+        'batch_pairs_per_sec': round(len(probes) * len(batch) / batch_seconds),
+    }
+    results['total_matches'] = sum(record['matches'] for record in records)
+    return results
+
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    """Numeric leaves of a results tree keyed by dotted path (lists are skipped)"""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{path}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Describe every metric that regressed against the baseline"""
+    regressions = []
+    current_flat = flatten(current['results'])
+    for path, expected in flatten(baseline['results']).items():
+        actual = current_flat.get(path)
+        name = path.rsplit('.', 1)[-1]
+        if actual is None:
+            continue
+        if name.endswith('_per_sec'):
+            regressed = actual < expected * (1 - tolerance)
+        elif name.startswith('p50_'):
+            regressed = actual > expected * (1 + tolerance) + MS_SLACK
+        elif 'queries' in name:
+            regressed = actual > expected
+        else:
+            continue
+        if regressed:
+            regressions.append(f'{path}: {actual} (baseline {expected})')
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Roommatch scoring, match generation and API benchmarks')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated population sizes (e.g. 1000,10000,100000,1000000).')
+    parser.add_argument('--samples', type=int, default=50, help='Users timed per endpoint.')
+    parser.add_argument('--seed', type=int, default=0, help='Population RNG seed.')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the results.')
+    parser.add_argument('--baseline', help='Baseline results to compare against.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed relative slowdown.')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to --baseline instead of comparing.')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': args.seed,
+            'samples': args.samples,
+        },
+        'results': {},
+    }
+    # Each size gets a fresh interpreter so no in-process index or cache carries over
+    context = multiprocessing.get_context('spawn')
+    for size in (int(size) for size in args.sizes.split(',')):
+        with context.Pool(1) as pool:
+            result = pool.apply(run_size, (size, args.seed, args.samples))
+        report['results'][str(size)] = result
+        print(f'{size:>8} profiles: generate p50 {result["generate"]["p50_ms"]} ms, '
+              f'get_matches p50 {result["get_matches"]["p50_cold_ms"]} ms cold / '
+              f'{result["get_matches"]["p50_warm_ms"]} ms warm, '
+              f'scoring {result["scoring"]["batch_pairs_per_sec"]:,} pairs/sec')
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline written to {args.baseline}')
+    elif args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+        print('No regressions against the baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Startup benchmark for Roommatch.
+
+Seeds a population into a throwaway SQLite database and upgrades its schema,
+then measures, each run in a fresh interpreter:
+- import_ms: importing the app module
+- create_app_ms: building the app (configuration, extensions, services)
+- schema_check_ms: create_all() plus the migration check on an up-to-date
+  database, which every worker used to run before its first request and
+  now only `flask schema upgrade` does
+- warm_up_ms: loading the candidate caches (done once, in the gunicorn master)
+- first_generate_ms: the first POST /api/matches/generate, cold (it loads
+  the caches itself) and after warm_up
+With --gunicorn it also boots gunicorn with one worker, with and without
+gunicorn.conf.py (preloading and warming the app in the master before the
+worker forks), and reports the seconds until the health check answers and
+the worker's first generate latency.
+
+    python -m benchmarks.startup --size 20000 --runs 3 --gunicorn
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from benchmarks.load_test import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUNICORN = [sys.executable, '-m', 'gunicorn', '--workers', '1', '--log-level', 'warning']
+SERVERS = {
+    # A config without settings (the benchmarks package), since gunicorn reads ./gunicorn.conf.py by default
+    'plain': lambda port: [*GUNICORN, '--config', 'python:benchmarks', '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+    'preload': lambda port: [*GUNICORN, '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+}
+
+
+def environment(database_url: str) -> Dict[str, str]:
+    return {**os.environ, 'DATABASE_URL': database_url, 'JOB_STORE_URL': 'memory', 'PASSWORD_HASH_WORKERS': '0',
+            'RATE_LIMIT_GENERATE': '0', 'PYTHONPATH': ROOT}
+
+
+def prepare(database_url: str, size: int, seed: int) -> Dict[str, Any]:
+    """Seed the database and return a complete profile's user ID and access token"""
+    os.environ.update(environment(database_url))
+    from flask_jwt_extended import create_access_token
+
+    import app as roommatch
+    from app import User, UserProfile, db
+    from benchmarks.populations import seed_population
+
+    flask_app = roommatch.create_app()
+    with flask_app.app_context():
+        roommatch.upgrade_database()
+        complete = seed_population(db, User, UserProfile, size, seed)
+        # Every sync checks the keys of profiles changed within the last minute (the overlap
+        # window); in production nearly all are older than that, so age the seeded ones accordingly
+        db.session.execute(db.update(UserProfile).values(updated_at=datetime.utcnow() - timedelta(days=1)))
+        db.session.commit()
+        user_id = db.session.query(UserProfile.user_id).filter(UserProfile.is_complete == True).first()[0]
+        return {'complete_profiles': complete, 'user_id': user_id, 'token': create_access_token(identity=user_id)}
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def measure(database_url: str, token: str, warm: bool) -> Dict[str, float]:
+    """Time each startup phase in this (fresh) process"""
+    os.environ.update(environment(database_url))
+    timings = {}
+    started = time.perf_counter()
+    import app as roommatch
+    import migrations
+    from app import db
+    timings['import_ms'] = elapsed_ms(started)
+
+    started = time.perf_counter()
+    flask_app = roommatch.create_app()
+    timings['create_app_ms'] = elapsed_ms(started)
+
+    with flask_app.app_context():
+        started = time.perf_counter()
+        db.create_all()
+        migrations.upgrade(db.engine)
+        timings['schema_check_ms'] = elapsed_ms(started)
+
+    if warm:
+        started = time.perf_counter()
+        roommatch.warm_up(flask_app)
+        timings['warm_up_ms'] = elapsed_ms(started)
+
+    client = flask_app.test_client()
+    started = time.perf_counter()
+    response = client.post('/api/matches/generate', headers={'Authorization': f'Bearer {token}'})
+    timings['first_generate_ms'] = elapsed_ms(started)
+    assert response.status_code == 200, response.get_json()
+    return timings
+
+
+def boot(mode: str, database_url: str, token: str) -> Dict[str, float]:
+    """Start gunicorn, time until it answers, then time its worker's first generate"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(SERVERS[mode](port), cwd=ROOT, env=environment(database_url))
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1):
+                    break
+            except OSError:
+                if process.poll() is not None or time.perf_counter() - started > 120:
+                    raise RuntimeError(f'gunicorn ({mode}) did not start')
+                time.sleep(0.02)
+        ready_s = round(time.perf_counter() - started, 3)
+
+        request = urllib.request.Request(f'http://127.0.0.1:{port}/api/matches/generate', method='POST',
+                                         headers={'Authorization': f'Bearer {token}'})
+        started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+        return {'ready_s': ready_s, 'first_generate_ms': elapsed_ms(started)}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def median_of(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    return {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Roommatch startup and first-request benchmark')
+    parser.add_argument('--size', type=int, default=20000, help='Users in the seeded population.')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh processes per measurement (medians are reported).')
+    parser.add_argument('--seed', type=int, default=0, help='Population RNG seed.')
+    parser.add_argument('--gunicorn', action='store_true', help='Also boot gunicorn with and without preloading.')
+    parser.add_argument('--output', default='startup_results.json', help='Where to write the results.')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='roommatch-startup-')
+    database_url = f'sqlite:///{os.path.join(workdir, "startup.db")}'
+    # Every measurement gets a fresh interpreter, as a newly booted worker would
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        population = pool.apply(prepare, (database_url, args.size, args.seed))
+
+    results: Dict[str, Any] = {}
+    for name, warm in (('cold', False), ('warm', True)):
+        runs = []
+        for _ in range(args.runs):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(measure, (database_url, population['token'], warm)))
+        results[name] = median_of(runs)
+        print(f'{name:>8}: ' + ', '.join(f'{key} {value}' for key, value in results[name].items()))
+
+    if args.gunicorn:
+        for mode in SERVERS:
+            results[f'gunicorn_{mode}'] = median_of([boot(mode, database_url, population['token'])
+                                                     for _ in range(args.runs)])
+            print(f'{mode:>8}: ' + ', '.join(f'{key} {value}' for key, value in results[f'gunicorn_{mode}'].items()))
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'size': args.size,
+            'complete_profiles': population['complete_profiles'],
+            'runs': args.runs,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
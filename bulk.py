@@ -0,0 +1,299 @@
+"""
+Bulk NDJSON import and export of users with their profiles.
+
+Each import line is one JSON object holding the registration fields (email,
+first_name, last_name, optional phone, and either a password or an existing
+password_hash in a supported format) plus any profile fields. Lines are
+validated on their own; valid rows are then written in batches, one
+transaction per batch: a multi-row INSERT ... RETURNING for the users, then
+one for their profiles with is_complete already computed. Emails that are
+already registered or repeated in the input are row errors, and a failing
+line never stops the import: every error is reported with its line number.
+If a batch still hits a constraint (say, a concurrent registration), it is
+retried row by row so only the offending rows fail.
+
+Exports stream one object per user with the same field names (password
+hashes excluded), read through a server-side cursor so memory use does not
+grow with the number of users. export_csv streams any query the same way as
+CSV, for tables (like the waitlist) that are read in a spreadsheet.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy.exc import IntegrityError
+
+from serializers import dumps
+
+# Rows written per transaction
+DEFAULT_BATCH_SIZE = 1000
+
+# Leading characters that make spreadsheet applications evaluate a CSV cell
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Accepted JSON types per field; string lengths come from the table columns
+USER_FIELDS = {'email': str, 'first_name': str, 'last_name': str, 'phone': str}
+PROFILE_FIELDS = {
+    'age': int,
+    'gender': str,
+    'occupation': str,
+    'education': str,
+    'budget_min': int,
+    'budget_max': int,
+    'location_preference': str,
+    'room_type': str,
+    'cleanliness_level': int,
+    'social_level': int,
+    'noise_tolerance': int,
+    'pet_preference': str,
+    'smoking_preference': str,
+    'bio': str,
+    'lifestyle_preferences': dict,
+    'interests': list,
+    'deal_breakers': list,
+}
+REQUIRED_USER_FIELDS = ('email', 'first_name', 'last_name')
+LEVEL_FIELDS = ('cleanliness_level', 'social_level', 'noise_tolerance')
+PREFERENCE_FIELDS = ('pet_preference', 'smoking_preference')
+PREFERENCES = ('yes', 'no', 'maybe')
+# Prefixes of the hash formats passwords.PasswordHasher can verify
+PASSWORD_HASH_PREFIXES = ('$2', 'pbkdf2:', 'scrypt:')
+
+EXPORT_USER_FIELDS = ('id', 'email', 'first_name', 'last_name', 'phone', 'is_verified', 'created_at')
+
+
+class RowError(ValueError):
+    """An import line that cannot be imported"""
+
+
+class ImportRow:
+    """One validated import line"""
+
+    __slots__ = ('line', 'user', 'profile', 'password')
+
+    def __init__(self, line: int, user: Dict[str, Any], profile: Optional[Dict[str, Any]], password: Optional[str]):
+        self.line = line
+        self.user = user
+        self.profile = profile
+        self.password = password
+
+
+class BulkImporter:
+    """Validates NDJSON user rows and writes them in batched transactions"""
+
+    def __init__(self, db: Any, user_model: Any, profile_model: Any, password_hasher: Any,
+                 required_profile_fields: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.user_model = user_model
+        self.profile_model = profile_model
+        self.password_hasher = password_hasher
+        self.required_profile_fields = tuple(required_profile_fields)
+        self.batch_size = batch_size
+        self._lengths = {
+            column.name: column.type.length
+            for table in (user_model.__table__, profile_model.__table__)
+            for column in table.columns if getattr(column.type, 'length', None)
+        }
+
+    def validate(self, line: int, text: Any) -> ImportRow:
+        """Parse and check one line, raising RowError"""
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise RowError(f'Invalid JSON: {e}') from e
+        if not isinstance(data, dict):
+            raise RowError('Each line must be a JSON object')
+        try:
+            return self._validate_object(line, data)
+        except RowError as e:
+            e.email = data.get('email')
+            raise
+
+    def _validate_object(self, line: int, data: Dict[str, Any]) -> ImportRow:
+        unknown = sorted(set(data) - set(USER_FIELDS) - set(PROFILE_FIELDS) - {'password', 'password_hash'})
+        if unknown:
+            raise RowError(f'Unknown fields: {", ".join(unknown)}')
+        for field in REQUIRED_USER_FIELDS:
+            if not data.get(field):
+                raise RowError(f'{field} is required')
+
+        user = {field: self._value(field, expected, data.get(field)) for field, expected in USER_FIELDS.items()}
+        if '@' not in user['email']:
+            raise RowError('email is invalid')
+
+        password, password_hash = data.get('password'), data.get('password_hash')
+        if bool(password) == bool(password_hash):
+            raise RowError('Exactly one of password and password_hash is required')
+        if password_hash:
+            if not isinstance(password_hash, str) or not password_hash.startswith(PASSWORD_HASH_PREFIXES):
+                raise RowError('password_hash must be a bcrypt, pbkdf2 or scrypt hash')
+            user['password_hash'] = self._value('password_hash', str, password_hash)
+        elif not isinstance(password, str):
+            raise RowError('password must be a string')
+
+        profile = None
+        if any(field in data for field in PROFILE_FIELDS):
+            profile = {field: self._value(field, expected, data.get(field)) for field, expected in PROFILE_FIELDS.items()}
+            self._check_profile(profile)
+            # Same rule as create_update_profile
+            profile['is_complete'] = all(profile[field] for field in self.required_profile_fields)
+        return ImportRow(line, user, profile, password if not password_hash else None)
+
+    def _value(self, field: str, expected: type, value: Any) -> Any:
+        if value is None:
+            return None
+        # bool is an int subclass, but true/false is never a valid number here
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise RowError(f'{field} must be of type {expected.__name__}')
+        if expected is str:
+            value = value.strip()
+            if field in self._lengths and len(value) > self._lengths[field]:
+                raise RowError(f'{field} is longer than {self._lengths[field]} characters')
+        return value
+
+    @staticmethod
+    def _check_profile(profile: Dict[str, Any]):
+        for field in LEVEL_FIELDS:
+            if profile[field] is not None and not 1 <= profile[field] <= 5:
+                raise RowError(f'{field} must be between 1 and 5')
+        for field in PREFERENCE_FIELDS:
+            if profile[field] is not None and profile[field] not in PREFERENCES:
+                raise RowError(f'{field} must be one of {", ".join(PREFERENCES)}')
+        if profile['age'] is not None and profile['age'] < 0:
+            raise RowError('age must not be negative')
+        if (profile['budget_min'] is not None and profile['budget_max'] is not None
+                and profile['budget_min'] > profile['budget_max']):
+            raise RowError('budget_min must not exceed budget_max')
+        for field in ('interests', 'deal_breakers'):
+            if profile[field] is not None and not all(isinstance(term, str) for term in profile[field]):
+                raise RowError(f'{field} must be a list of strings')
+
+    def run(self, lines: Iterable[Any], on_error: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, int]:
+        """Import NDJSON lines; each row error is passed to on_error as {'line', 'email', 'error'}"""
+        summary = {'imported': 0, 'failed': 0}
+
+        def fail(line: int, email: Any, error: str):
+            summary['failed'] += 1
+            if on_error:
+                on_error({'line': line, 'email': email, 'error': error})
+
+        batch: List[ImportRow] = []
+        emails = set()
+        for number, text in enumerate(lines, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = self.validate(number, text)
+            except RowError as e:
+                fail(number, getattr(e, 'email', None), str(e))
+                continue
+            if row.user['email'] in emails:
+                fail(number, row.user['email'], 'Duplicate email in this import')
+                continue
+            emails.add(row.user['email'])
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                summary['imported'] += self._write_batch(batch, fail)
+                batch = []
+        if batch:
+            summary['imported'] += self._write_batch(batch, fail)
+        return summary
+
+    def _write_batch(self, batch: List[ImportRow], fail: Callable[[int, Any, str], None]) -> int:
+        """Insert the rows whose email is not registered yet; returns how many were written"""
+        User = self.user_model
+        registered = {
+            email for (email,) in self.db.session.execute(
+                self.db.select(User.email).where(User.email.in_([row.user['email'] for row in batch]))
+            )
+        }
+        rows = []
+        for row in batch:
+            if row.user['email'] in registered:
+                fail(row.line, row.user['email'], 'User already exists')
+            else:
+                rows.append(row)
+
+        # Hash plain passwords for the whole batch at once, across the hashing pool
+        plain = [row for row in rows if row.password is not None]
+        for row, hashed in zip(plain, self.password_hasher.hash_many([row.password for row in plain])):
+            row.user['password_hash'] = hashed
+            row.password = None
+
+        try:
+            self._insert(rows)
+            return len(rows)
+        except IntegrityError:
+            self.db.session.rollback()
+
+        # Something registered concurrently: isolate the failing rows
+        written = 0
+        for row in rows:
+            try:
+                self._insert([row])
+                written += 1
+            except IntegrityError:
+                self.db.session.rollback()
+                fail(row.line, row.user['email'], 'User already exists')
+        return written
+
+    def _insert(self, rows: List[ImportRow]):
+        if not rows:
+            return
+        now = datetime.utcnow()
+        ids = dict(self.db.session.execute(
+            self.db.insert(self.user_model).returning(self.user_model.email, self.user_model.id),
+            [{**row.user, 'is_verified': False, 'created_at': now, 'updated_at': now} for row in rows]
+        ).all())
+        profiles = [
+            {**row.profile, 'user_id': ids[row.user['email']], 'created_at': now, 'updated_at': now}
+            for row in rows if row.profile is not None
+        ]
+        if profiles:
+            self.db.session.execute(self.db.insert(self.profile_model), profiles)
+        self.db.session.commit()
+
+    def export(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[str]:
+        """NDJSON lines of every user and profile, in user ID order"""
+        User, UserProfile = self.user_model, self.profile_model
+        columns = [getattr(User, field).label(field) for field in EXPORT_USER_FIELDS] + [UserProfile.id.label('profile_id')]
+        columns += [getattr(UserProfile, field).label(field) for field in (*PROFILE_FIELDS, 'is_complete')]
+        statement = self.db.select(*columns).outerjoin(UserProfile, UserProfile.user_id == User.id).order_by(User.id)
+        result = self.db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+        for row in result.mappings():
+            yield dumps(export_document(row)) + '\n'
+
+
+def export_csv(db: Any, statement: Any, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[str]:
+    """CSV text of a select statement's rows, a header line first, one chunk per batch"""
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    for rows in result.partitions():
+        writer.writerows([csv_cell(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def csv_cell(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Text a spreadsheet would run as a formula is quoted with a leading apostrophe
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_document(row: Any) -> Dict[str, Any]:
+    """Export object for one user row; the profile fields are left out when the user has none"""
+    document = {field: row[field] for field in EXPORT_USER_FIELDS}
+    if row['profile_id'] is not None:
+        document.update((field, row[field]) for field in (*PROFILE_FIELDS, 'is_complete'))
+    return document
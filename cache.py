@@ -0,0 +1,185 @@
+"""
+Per-user response cache for Roommatch read endpoints.
+
+Cached bodies are keyed by namespace, user and the user's current version
+token. Invalidating a user writes a fresh random token, so every cached
+response for that user becomes unreachable at once and simply ages out.
+Random tokens (rather than counters) mean an evicted or lost version key
+can never make an old entry valid again. The version tokens double as
+ETags, so a matching If-None-Match can be answered without touching the
+database or the cached body.
+
+Backends implement get_many/set/delete. MemoryCache is an in-process LRU
+with TTLs; RedisCache wraps any redis-py compatible client, so every
+worker shares versions and bodies (LocalRedis is an in-process stand-in
+with the same interface).
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+GLOBAL_VERSION_KEY = 'version:*'
+
+
+class CacheBackend:
+    """Interface for cache storage"""
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """Thread-safe in-process LRU cache with per-entry TTLs"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[Optional[float], bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or (entry[0] is not None and entry[0] <= now):
+                    self._entries.pop(key, None)
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisCache(CacheBackend):
+    """Backend over a redis-py compatible client (shared by all workers)"""
+
+    def __init__(self, client: Any, prefix: str = 'roommatch:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        return self.client.mget([self.prefix + key for key in keys])
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class LocalRedis:
+    """In-process stand-in for the subset of the redis-py client RedisCache uses"""
+
+    def __init__(self):
+        self._store = MemoryCache(max_entries=10 ** 9)
+
+    def mget(self, keys):
+        return self._store.get_many(list(keys))
+
+    def set(self, key, value, ex=None):
+        self._store.set(key, value if isinstance(value, bytes) else str(value).encode(), ex)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self._store.delete(key)
+        return len(keys)
+
+
+def is_shared_url(url: str) -> bool:
+    """Whether a backend URL points at a server every process shares, rather than at per-process state"""
+    return url.startswith(('redis://', 'rediss://', 'unix://'))
+
+
+def backend_from_url(url: str, max_entries: int = 10000) -> CacheBackend:
+    """Build a backend from 'memory', 'local-redis' or a redis:// URL"""
+    if url == 'memory':
+        return MemoryCache(max_entries)
+    if url == 'local-redis':
+        return RedisCache(LocalRedis())
+    if is_shared_url(url):
+        import redis  # Optional dependency, only needed for a shared cache
+        return RedisCache(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported cache URL: {url}')
+
+
+class ResponseCache:
+    """Versioned per-user cache of serialized responses"""
+
+    def __init__(self, backend: CacheBackend, ttl: int = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _version_key(user_id: Any) -> str:
+        return f'version:{user_id}'
+
+    def etag(self, namespace: str, user_id: Any, variant: str = '') -> str:
+        """Current (unquoted) ETag of a user's response, creating version tokens if missing"""
+        global_version, user_version = self.backend.get_many([GLOBAL_VERSION_KEY, self._version_key(user_id)])
+        if global_version is None:
+            global_version = self._bump(GLOBAL_VERSION_KEY)
+        if user_version is None:
+            user_version = self._bump(self._version_key(user_id))
+        digest = hashlib.sha1(
+            b'|'.join([namespace.encode(), variant.encode(), global_version, user_version])
+        ).hexdigest()[:20]
+        return f'{user_id}-{digest}'
+
+    def get(self, etag: str) -> Optional[bytes]:
+        """Body of the 200 response cached under etag, if any"""
+        return self.backend.get_many([f'response:{etag}'])[0]
+
+    def put(self, etag: str, body: bytes):
+        self.backend.set(f'response:{etag}', body, self.ttl)
+
+    def get_or_build(self, etag: str, build: Callable[[], Tuple[bytes, int]]) -> Tuple[bytes, int]:
+        """
+        Return (body, status) of the response cached under etag, building and
+        caching it on a miss. Only 200 responses are cached.
+        """
+        cached = self.get(etag)
+        if cached is not None:
+            return cached, 200
+
+        body, status = build()
+        if status == 200:
+            self.put(etag, body)
+        return body, status
+
+    def _bump(self, key: str) -> bytes:
+        token = uuid.uuid4().hex.encode()
+        self.backend.set(key, token)
+        return token
+
+    def invalidate(self, *user_ids: Any):
+        """Make every cached response for these users stale"""
+        for user_id in set(user_ids):
+            self._bump(self._version_key(user_id))
+
+    def invalidate_all(self):
+        """Make every cached response stale (e.g. after a bulk rebuild)"""
+        self._bump(GLOBAL_VERSION_KEY)
@@ -0,0 +1,219 @@
+"""
+In-process candidate retrieval index for Roommatch match generation.
+
+A pair of complete profiles can only score above the 0.6 match threshold
+when their budgets overlap or their location preferences are equal: without
+either, the best possible score is (0.4 + 0.1 + 0.1) / 1.0 = 0.6. Because the
+weights are accumulated in floating point, that best case actually evaluates
+to 0.6000000000000001, so profiles with identical lifestyle levels and
+pet/smoking preferences are also paired through a "twin" hash bucket.
+Profiles missing a budget or location drop those weights from the
+normalisation, so they are always returned.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Width of one budget bucket, in currency units
+DEFAULT_BUCKET_WIDTH = 100
+# Intervals spanning more buckets than this are kept in a linear side list
+MAX_BUCKET_SPAN = 200
+# Re-read window when syncing, covering transactions that commit out of order
+SYNC_OVERLAP = timedelta(seconds=60)
+# Smallest step of a stored updated_at (microseconds on SQLite and PostgreSQL)
+TIMESTAMP_RESOLUTION = timedelta(microseconds=1)
+
+# Profile attributes the index reads
+INDEX_FIELDS = (
+    'budget_min',
+    'budget_max',
+    'location_preference',
+    'cleanliness_level',
+    'social_level',
+    'noise_tolerance',
+    'pet_preference',
+    'smoking_preference',
+)
+
+TWIN_FIELDS = ('cleanliness_level', 'social_level', 'noise_tolerance', 'pet_preference', 'smoking_preference')
+
+
+class _Entry:
+    __slots__ = ('budget_min', 'budget_max', 'location', 'twin_key')
+
+    def __init__(self, profile: Any):
+        self.budget_min = profile.budget_min
+        self.budget_max = profile.budget_max
+        self.location = profile.location_preference.lower() if profile.location_preference else None
+        twin_key = tuple(getattr(profile, field) for field in TWIN_FIELDS)
+        self.twin_key = twin_key if all(twin_key) else None
+
+    @property
+    def is_wildcard(self) -> bool:
+        return not (self.budget_min and self.budget_max and self.location)
+
+    @property
+    def has_range(self) -> bool:
+        # Empty or inverted ranges can never overlap another budget
+        return bool(self.budget_min and self.budget_max) and self.budget_max > self.budget_min
+
+
+class CandidateIndex:
+    """Budget interval buckets plus location and twin hash buckets over complete profiles"""
+
+    def __init__(self, bucket_width: int = DEFAULT_BUCKET_WIDTH):
+        self.bucket_width = bucket_width
+        self.synced_at: Optional[datetime] = None
+        # Wall time the last applied read started, and the rows it applied that the next read can see again
+        self._read_at: Optional[datetime] = None
+        self._recent: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _Entry] = {}
+        self._budget_buckets: Dict[int, Set[int]] = {}
+        self._wide: Set[int] = set()
+        self._locations: Dict[str, Set[int]] = {}
+        self._twins: Dict[Tuple, Set[int]] = {}
+        self._wildcards: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def _bucket_range(self, entry: _Entry) -> range:
+        return range(int(entry.budget_min // self.bucket_width), int(entry.budget_max // self.bucket_width) + 1)
+
+    def update(self, user_id: int, profile: Any):
+        """Insert or replace the entry for a complete profile"""
+        entry = _Entry(profile)
+        with self._lock:
+            self._discard(user_id)
+            self._entries[user_id] = entry
+
+            if entry.is_wildcard:
+                self._wildcards.add(user_id)
+                return
+
+            self._locations.setdefault(entry.location, set()).add(user_id)
+            if entry.twin_key is not None:
+                self._twins.setdefault(entry.twin_key, set()).add(user_id)
+
+            if entry.has_range:
+                buckets = self._bucket_range(entry)
+                if len(buckets) > MAX_BUCKET_SPAN:
+                    self._wide.add(user_id)
+                else:
+                    for bucket in buckets:
+                        self._budget_buckets.setdefault(bucket, set()).add(user_id)
+
+    def remove(self, user_id: int):
+        """Drop a profile from the index (e.g. when it is no longer complete)"""
+        with self._lock:
+            self._discard(user_id)
+
+    def _discard(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+
+        if user_id in self._wildcards:
+            self._wildcards.discard(user_id)
+            return
+
+        _discard_member(self._locations, entry.location, user_id)
+        _discard_member(self._twins, entry.twin_key, user_id)
+        if user_id in self._wide:
+            self._wide.discard(user_id)
+        elif entry.has_range:
+            for bucket in self._bucket_range(entry):
+                _discard_member(self._budget_buckets, bucket, user_id)
+
+    def candidates(self, profile: Any) -> Optional[Set[int]]:
+        """
+        Return the user IDs that can possibly score above 0.6 against the
+        given profile, or None when the profile cannot be pruned at all
+        """
+        probe = _Entry(profile)
+        if probe.is_wildcard:
+            return None
+
+        with self._lock:
+            result = set(self._wildcards)
+            result.update(self._locations.get(probe.location, ()))
+            if probe.twin_key is not None:
+                result.update(self._twins.get(probe.twin_key, ()))
+
+            if probe.has_range:
+                buckets = self._bucket_range(probe)
+                if len(buckets) > min(MAX_BUCKET_SPAN, len(self._budget_buckets)):
+                    # Checking every entry is cheaper than walking the buckets
+                    seen = set(self._entries)
+                else:
+                    seen = set()
+                    for bucket in buckets:
+                        seen.update(self._budget_buckets.get(bucket, ()))
+                    seen.update(self._wide)
+                seen -= result
+                for user_id in seen:
+                    other = self._entries[user_id]
+                    if not other.has_range:
+                        continue
+                    overlap = min(probe.budget_max, other.budget_max) - max(probe.budget_min, other.budget_min)
+                    if overlap > 0:
+                        result.add(user_id)
+
+            return result
+
+    def sync(self, rows: Iterable[Any], read_at: Optional[datetime] = None):
+        """
+        Apply rows (user_id, is_complete, updated_at and INDEX_FIELDS)
+        changed since the last sync and advance the watermark; read_at is
+        the wall time the read returning them started
+        """
+        latest = self.synced_at
+        applied = {}
+        for row in rows:
+            if row.is_complete:
+                self.update(row.user_id, row)
+            else:
+                self.remove(row.user_id)
+            if row.updated_at is not None:
+                applied[row.user_id] = row.updated_at
+                if latest is None or row.updated_at > latest:
+                    latest = row.updated_at
+
+        with self._lock:
+            self.synced_at = latest or datetime.min
+            if read_at is not None:
+                self._read_at = max(self._read_at or read_at, read_at)
+            # Remember the applied rows the next read returns again, forgetting older ones
+            since = self.sync_since()
+            recent = {**self._recent, **applied}
+            self._recent = {user_id: updated_at for user_id, updated_at in recent.items()
+                            if since is not None and updated_at >= since}
+
+    def sync_since(self) -> Optional[datetime]:
+        """Lower bound on updated_at for the next incremental sync (None = full load)"""
+        if self.synced_at is None or self.synced_at == datetime.min:
+            return None
+        if self._read_at is None:
+            return self.synced_at - SYNC_OVERLAP
+        # Rows past the watermark, plus rows whose commit may have been pending at the last
+        # read: those carry an updated_at at most SYNC_OVERLAP older than the read
+        return min(self.synced_at + TIMESTAMP_RESOLUTION, self._read_at - SYNC_OVERLAP)
+
+    def unseen(self, rows: Iterable[Any]) -> List[Any]:
+        """Drop rows already applied by an earlier sync (the overlap window is read again every time)"""
+        recent = self._recent
+        return [row for row in rows if recent.get(row.user_id) != row.updated_at]
+
+
+def _discard_member(buckets: Dict[Any, Set[int]], key: Any, user_id: int):
+    """Remove user_id from buckets[key], dropping the bucket once empty"""
+    members = buckets.get(key) if key is not None else None
+    if members is not None:
+        members.discard(user_id)
+        if not members:
+            del buckets[key]
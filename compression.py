@@ -0,0 +1,92 @@
+"""
+gzip and Brotli compression of Roommatch API responses.
+
+Responses of at least min_size bytes are compressed when the client accepts
+it: Brotli (if the brotli package is installed) is preferred over gzip at
+equal quality values. Streamed responses, responses that already have a
+Content-Encoding and non-compressible types are left alone.
+
+A compressed body gets a weak ETag, since it is no longer byte-identical to
+the uncompressed one; If-None-Match uses weak comparison, so revalidation
+still answers 304. Bodies with an ETag are immutable for that ETag, so their
+compressed forms are kept in a small LRU and each cached response is only
+compressed once per encoding. Vary: Accept-Encoding is sent on every
+response that could have been compressed, and on 304s, so shared caches
+keep the encodings apart.
+"""
+
+import gzip
+from typing import Optional
+
+from flask import Flask, request
+
+from cache import MemoryCache
+
+try:
+    import brotli  # Optional dependency, preferred over gzip when installed
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+# Quality 4 compresses dynamic JSON better than gzip -6 in less time
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+# Compressed bodies kept per process, keyed by encoding and ETag
+COMPRESSED_CACHE_SIZE = 1024
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class Compressor:
+    """after_request hook compressing large responses"""
+
+    def __init__(self, min_size: int = DEFAULT_MIN_SIZE):
+        self.min_size = min_size
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self._compressed = MemoryCache(max_entries=COMPRESSED_CACHE_SIZE)
+
+    def init_app(self, app: Flask):
+        if self.min_size > 0:
+            app.after_request(self.compress_response)
+
+    def choose_encoding(self) -> Optional[str]:
+        """Best encoding the client accepts, or None"""
+        accepted = request.accept_encodings
+        # max keeps the first (preferred) encoding among equal qualities
+        best = max(self.encodings, key=lambda encoding: accepted[encoding])
+        return best if accepted[best] > 0 else None
+
+    def compress_response(self, response):
+        if response.status_code == 304:
+            # A 304 carries the Vary of the response it revalidates
+            response.vary.add('Accept-Encoding')
+            return response
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 206) or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        encoding = self.choose_encoding()
+        if encoding is None or len(body) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = f'{encoding}:{etag}' if etag else None
+        compressed = self._compressed.get_many([key])[0] if key else None
+        if compressed is None:
+            compressed = compress(body, encoding)
+            if key:
+                self._compressed.set(key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,102 @@
+"""
+Database engine configuration and read-replica routing for Roommatch.
+
+engine_options() turns pool and timeout settings into SQLAlchemy engine
+options; pooling knobs only apply to server databases, not SQLite. When a
+replica bind is configured, RoutingSession sends plain SELECTs of requests
+that opted in (see use_replica) to it. Writes, flushes and everything else
+stay on the primary. Users who changed data within the replication lag
+window are read from the primary, so they never see their own change
+missing (and a stale replica read is never cached under a fresh ETag).
+
+async_engine() builds the asyncio engine the ASGI routes (asgi.py) use for
+the same database, with the same pool settings.
+"""
+
+from typing import Any, Dict
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+
+# asyncio drivers by database backend; they are optional dependencies of the ASGI mode
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+
+def engine_options(url: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: int = 30,
+                   pool_recycle: int = 1800, pre_ping: bool = True, statement_timeout_ms: int = 0) -> Dict[str, Any]:
+    """SQLAlchemy engine options for a database URL"""
+    if url.startswith('sqlite'):
+        return {}
+
+    options: Dict[str, Any] = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pre_ping,
+    }
+    if statement_timeout_ms and url.startswith('postgres'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+
+def async_url(url: str) -> str:
+    """The same database URL using its asyncio driver"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver configured for {backend} databases')
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def async_engine(url: str, statement_timeout_ms: int = 0, **settings: Any):
+    """asyncio engine for a database URL, with the same options as engine_options()"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    options = engine_options(url, **settings)
+    if statement_timeout_ms and url.startswith('postgres'):
+        # asyncpg takes server settings instead of libpq options
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout_ms)}}
+    return create_async_engine(async_url(url), **options)
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica bind for requests that opted in"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_request_context() and g.get('use_replica')
+                and REPLICA_BIND in self._db.engines and (clause is None or clause.is_select)):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(enabled: bool = True):
+    """Route the current request's reads to the replica (when one is configured)"""
+    g.use_replica = enabled
+
+
+class RecentWrites:
+    """Remembers, in a cache backend, which users changed data within the lag window"""
+
+    ALL = 'recent-write:*'
+
+    def __init__(self, backend: Any, window: int = 5):
+        self.backend = backend
+        self.window = window
+
+    def mark(self, *user_ids: Any):
+        for user_id in set(user_ids):
+            self.backend.set(f'recent-write:{user_id}', b'1', self.window)
+
+    def mark_all(self):
+        self.backend.set(self.ALL, b'1', self.window)
+
+    def is_recent(self, user_id: Any) -> bool:
+        return any(value is not None for value in self.backend.get_many([self.ALL, f'recent-write:{user_id}']))
@@ -0,0 +1,21 @@
+"""
+Flask extensions used by Roommatch.
+
+They are created unbound, so importing the models or the extensions does
+not build an app, read configuration or create engines; create_app binds
+them to an app with init_app.
+"""
+
+from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+from flask_sqlalchemy import SQLAlchemy
+
+from database import RoutingSession
+from metrics import Instrumentation
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+jwt = JWTManager()
+cors = CORS()
+
+# Request latency, query and scoring metrics, served at /api/metrics (one registry per process)
+metrics = Instrumentation()
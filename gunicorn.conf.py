@@ -0,0 +1,43 @@
+"""
+Gunicorn settings for Roommatch.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+
+The app is loaded once, in the master, and its candidate caches (candidate
+index, profile store, ANN index) are loaded there before any worker is
+forked. Workers inherit them copy-on-write, so none of them imports the app
+or reads every profile again on boot or on its first request. Settings given
+on the command line override the ones here. With more than one worker the
+response cache must be shared (RESPONSE_CACHE_URL=redis://...), or the
+master refuses to start.
+"""
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+preload_app = True
+
+
+def _flask_app(server):
+    # The loaded WSGI app, or the Flask app behind the ASGI application
+    application = server.app.wsgi()
+    return getattr(application, 'flask_app', application)
+
+
+def when_ready(server):
+    from app import check_worker_backends, warm_up
+
+    app = _flask_app(server)
+    check_worker_backends(app, server.cfg.workers)
+    warm_up(app)
+    # Keep the garbage collector from touching (and so copying) the preloaded objects in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import after_fork
+
+    after_fork(_flask_app(server))
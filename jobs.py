@@ -0,0 +1,217 @@
+"""
+Background job queue with pollable status for Roommatch.
+
+Jobs run on a thread pool and their state (status, progress, result) lives
+in a pluggable JobStore. The SQLite store keeps jobs in a file so every
+worker process on a host can answer status polls, and so a job survives the
+request that created it. Submitting a job whose key matches a queued or
+running job returns the existing job instead of starting a duplicate.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# Active jobs not updated for this long are assumed lost (e.g. worker restart)
+STALE_AFTER = timedelta(minutes=10)
+
+
+def _new_job(kind: str, key: str, owner_id: Any) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'key': key,
+        'owner_id': owner_id,
+        'status': QUEUED,
+        'progress': 0.0,
+        'result': None,
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+class JobStore:
+    """Interface for job persistence backends"""
+
+    def create_or_get_active(self, kind: str, key: str, owner_id: Any) -> Tuple[Dict[str, Any], bool]:
+        """Atomically return the active job for key, or create one; the flag is True if created"""
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields):
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """Process-local job store, for tests and single-process deployments"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create_or_get_active(self, kind, key, owner_id):
+        with self._lock:
+            stale_before = datetime.utcnow() - STALE_AFTER
+            for job in self._jobs.values():
+                if job['key'] == key and job['status'] in ACTIVE_STATUSES and job['updated_at'] > stale_before:
+                    return dict(job), False
+            job = _new_job(kind, key, owner_id)
+            self._jobs[job['id']] = job
+            return dict(job), True
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=datetime.utcnow())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobStore(JobStore):
+    """Job store backed by a SQLite file, shared by all processes on a host"""
+
+    COLUMNS = ('id', 'kind', 'key', 'owner_id', 'status', 'progress', 'result', 'error', 'created_at', 'updated_at')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # The file and table are created on first use, so building the store touches nothing
+        if not self._ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, kind TEXT, key TEXT, owner_id TEXT, status TEXT, '
+                'progress REAL, result TEXT, error TEXT, created_at TEXT, updated_at TEXT)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_key_status ON jobs (key, status)')
+            self._ready = True
+        return conn
+
+    def _to_row(self, job: Dict[str, Any]) -> tuple:
+        row = dict(job)
+        row['result'] = json.dumps(row['result']) if row['result'] is not None else None
+        row['owner_id'] = json.dumps(row['owner_id'])
+        row['created_at'] = row['created_at'].isoformat()
+        row['updated_at'] = row['updated_at'].isoformat()
+        return tuple(row[column] for column in self.COLUMNS)
+
+    def _from_row(self, row: tuple) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job['owner_id'] = json.loads(job['owner_id'])
+        job['created_at'] = datetime.fromisoformat(job['created_at'])
+        job['updated_at'] = datetime.fromisoformat(job['updated_at'])
+        return job
+
+    def create_or_get_active(self, kind, key, owner_id):
+        conn = self._connect()
+        try:
+            # Take the write lock up front so concurrent submitters serialize
+            conn.execute('BEGIN IMMEDIATE')
+            stale_before = (datetime.utcnow() - STALE_AFTER).isoformat()
+            row = conn.execute(
+                f'SELECT {", ".join(self.COLUMNS)} FROM jobs '
+                'WHERE key = ? AND status IN (?, ?) AND updated_at > ? LIMIT 1',
+                (key, *ACTIVE_STATUSES, stale_before)
+            ).fetchone()
+            if row:
+                conn.execute('COMMIT')
+                return self._from_row(row), False
+
+            job = _new_job(kind, key, owner_id)
+            conn.execute(
+                f'INSERT INTO jobs ({", ".join(self.COLUMNS)}) VALUES ({", ".join("?" * len(self.COLUMNS))})',
+                self._to_row(job)
+            )
+            conn.execute('COMMIT')
+            return job, True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def update(self, job_id, **fields):
+        fields['updated_at'] = datetime.utcnow().isoformat()
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'])
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(f'SELECT {", ".join(self.COLUMNS)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._from_row(row) if row else None
+
+
+def store_from_url(url: str) -> JobStore:
+    """Build a job store from a 'memory' or 'sqlite:///path' URL"""
+    if url == 'memory':
+        return MemoryJobStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteJobStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported job store URL: {url}')
+
+
+class JobQueue:
+    """Runs submitted jobs on a thread pool and records their progress in a store"""
+
+    def __init__(self, store: JobStore, workers: int = 2, context: Optional[Callable[[], Any]] = None):
+        self.store = store
+        self._context = context or nullcontext
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def submit(self, kind: str, key: str, owner_id: Any, func: Callable, *args, **kwargs) -> Dict[str, Any]:
+        """
+        Queue func(*args, progress=callback, **kwargs) and return its job record.
+        An active job with the same key is returned as-is instead.
+        """
+        job, created = self.store.create_or_get_active(kind, key, owner_id)
+        if created:
+            self._executor.submit(self._run, job['id'], func, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def _run(self, job_id: str, func: Callable, args: tuple, kwargs: dict):
+        def progress(fraction: float):
+            self.store.update(job_id, progress=round(min(max(fraction, 0.0), 1.0), 3))
+
+        self.store.update(job_id, status=RUNNING)
+        try:
+            with self._context():
+                result = func(*args, progress=progress, **kwargs)
+            self.store.update(job_id, status=SUCCEEDED, progress=1.0, result=result)
+        except Exception as e:
+            logger.exception('Job %s failed', job_id)
+            self.store.update(job_id, status=FAILED, error=str(e))
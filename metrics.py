@@ -0,0 +1,323 @@
+"""
+Request, query and scoring metrics for Roommatch, in Prometheus text format.
+
+Instrumentation hooks into Flask (before request, after request and request
+teardown, which also runs when a view raises) and into SQLAlchemy engine
+cursor events. Every request records its latency per route template,
+and every statement its time per operation; statements issued while a
+request is active are also counted against that request. Requests slower
+than the slow-request threshold are logged with their query breakdown.
+Match generation reports the candidates it scored and how long scoring took,
+and the password hasher the latency and CPU time of each hash and verify.
+
+Metrics live in process memory, so each gunicorn worker exposes its own
+series; scrape every worker (or sum them) to see the whole deployment.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets, in seconds for durations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+CANDIDATE_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Statement kinds used as the operation label (anything else is 'other')
+OPERATIONS = ('select', 'insert', 'update', 'delete')
+# Distinct statements listed in a slow-request log line
+SLOW_LOG_STATEMENTS = 5
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of series keyed by label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name} expects labels {self.labels}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, Any], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][position] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(float(bound))}, cumulative
+            yield f'{self.name}_bucket', {**labels, 'le': '+Inf'}, count
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class Registry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """Queries issued while one request was being handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries: List[Tuple[str, float]] = []
+        self.status: Optional[int] = None
+
+    def breakdown(self, limit: int = SLOW_LOG_STATEMENTS) -> List[Tuple[str, int, float]]:
+        """(statement, executions, total seconds) of the most expensive statements"""
+        totals: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        for statement, seconds in self.queries:
+            totals[statement][0] += 1
+            totals[statement][1] += seconds
+        ordered = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        return [(statement, int(count), seconds) for statement, (count, seconds) in ordered[:limit]]
+
+
+def _operation(statement: str) -> str:
+    words = statement.split(None, 1)
+    operation = words[0].lower() if words else ''
+    return operation if operation in OPERATIONS else 'other'
+
+
+def _summarize(statement: str, width: int = 120) -> str:
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= width else statement[:width - 3] + '...'
+
+
+class Instrumentation:
+    """Request, database and match scoring metrics for one process"""
+
+    def __init__(self, slow_request_ms: float = 0):
+        self.slow_request_ms = slow_request_ms
+        self.registry = Registry()
+        self.request_seconds = self.registry.register(Histogram(
+            'roommatch_http_request_duration_seconds', 'Request latency by route.',
+            ('method', 'route', 'status')))
+        self.request_queries = self.registry.register(Histogram(
+            'roommatch_http_request_queries', 'Database queries issued per request.',
+            ('method', 'route'), buckets=QUERY_COUNT_BUCKETS))
+        self.request_query_seconds = self.registry.register(Counter(
+            'roommatch_http_request_query_seconds_total', 'Time spent in database queries, by route.',
+            ('method', 'route')))
+        self.query_seconds = self.registry.register(Histogram(
+            'roommatch_db_query_duration_seconds', 'Database statement latency by operation.',
+            ('operation',), buckets=QUERY_LATENCY_BUCKETS))
+        self.candidates_scored = self.registry.register(Counter(
+            'roommatch_candidates_scored_total', 'Candidate profiles scored by match generation.'))
+        self.scoring_seconds = self.registry.register(Counter(
+            'roommatch_scoring_seconds_total', 'Time spent scoring candidates in match generation.'))
+        self.generate_candidates = self.registry.register(Histogram(
+            'roommatch_generate_candidates', 'Candidates scored per match generation.',
+            buckets=CANDIDATE_BUCKETS))
+        self.scoring_rate = self.registry.register(Gauge(
+            'roommatch_scoring_pairs_per_second', 'Scoring throughput of the latest match generation.'))
+        self.rate_limited = self.registry.register(Counter(
+            'roommatch_rate_limited_total', 'Requests rejected by a rate limit, by endpoint.', ('endpoint',)))
+        self.coalesced = self.registry.register(Counter(
+            'roommatch_coalesced_requests_total', 'Requests answered with a concurrent identical call\'s result.',
+            ('operation',)))
+        self.waitlist_signups = self.registry.register(Counter(
+            'roommatch_waitlist_signups_total', 'Waitlist signups buffered, coalesced with a waiting one, or written.',
+            ('outcome',)))
+        self.password_hash_seconds = self.registry.register(Histogram(
+            'roommatch_password_hash_duration_seconds', 'Password hash and verify latency, including time queued.',
+            ('operation',)))
+        self.password_hash_cpu_seconds = self.registry.register(Counter(
+            'roommatch_password_hash_cpu_seconds_total', 'CPU time spent hashing and verifying passwords.',
+            ('operation',)))
+        self.password_hash_in_flight = self.registry.register(Gauge(
+            'roommatch_password_hash_in_flight', 'Password operations queued or running.', ('operation',)))
+        self.password_hash_rejected = self.registry.register(Counter(
+            'roommatch_password_hash_rejected_total', 'Password operations rejected because hashing was at capacity.',
+            ('operation',)))
+
+    def init_app(self, app: Flask, engines: Iterable[Any]):
+        """Time app's requests and the statements of every engine (SLOW_REQUEST_MS sets the slow-request threshold)"""
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', self.slow_request_ms)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._record_request)
+        for engine in engines:
+            self.watch_engine(engine)
+
+    def watch_engine(self, engine: Any):
+        """Time the statements of an engine (for an asyncio engine, pass its sync_engine)"""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    # Requests
+
+    def _start_request(self):
+        g.request_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _record_request(self, error: Optional[BaseException] = None):
+        # Teardown runs even when the view or an after_request hook raised, with no response to report
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return
+        status = 500 if error is not None or stats.status is None else stats.status
+        elapsed = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        query_seconds = sum(seconds for _, seconds in stats.queries)
+        self.request_seconds.observe(elapsed, method=request.method, route=route, status=status)
+        self.request_queries.observe(len(stats.queries), method=request.method, route=route)
+        self.request_query_seconds.inc(query_seconds, method=request.method, route=route)
+
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            logger.warning(
+                'Slow request %s %s -> %s in %.1f ms: %d queries in %.1f ms%s',
+                request.method, request.path, status, elapsed * 1000,
+                len(stats.queries), query_seconds * 1000,
+                ''.join(f'\n  {count} x {seconds * 1000:.1f} ms  {_summarize(statement)}'
+                        for statement, count, seconds in stats.breakdown())
+            )
+
+    # Database statements
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        elapsed = time.perf_counter() - started
+        self.query_seconds.observe(elapsed, operation=_operation(statement))
+        if has_request_context():
+            stats = g.get('request_stats')
+            if stats is not None:
+                stats.queries.append((statement, elapsed))
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+    # Match scoring
+
+    def record_scoring(self, candidates: int, seconds: float):
+        """Count one scoring pass over candidates that took seconds"""
+        self.candidates_scored.inc(candidates)
+        self.scoring_seconds.inc(seconds)
+        self.generate_candidates.observe(candidates)
+        if seconds > 0:
+            self.scoring_rate.set(candidates / seconds)
+
+    # Password hashing
+
+    def record_password_hashing(self, operation: str, seconds: float, cpu_seconds: float):
+        """Count one hash or verify that took seconds end to end and cpu_seconds in the pool"""
+        self.password_hash_seconds.observe(seconds, operation=operation)
+        self.password_hash_cpu_seconds.inc(cpu_seconds, operation=operation)
+
+    def render(self) -> str:
+        return self.registry.render()
@@ -0,0 +1,153 @@
+"""
+Schema migrations for Roommatch.
+
+db.create_all() only creates missing tables, so changes to existing tables
+are applied here. Migrations run in order, each in its own transaction, and
+the applied versions are recorded in a schema_version table. Every
+migration must be idempotent: a database created by create_all() already
+has the latest schema, and upgrading it only records the versions.
+"""
+
+import json
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration function under a version number"""
+    def register(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at VARCHAR(32))'
+    ))
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """Versions already applied to the database, in order"""
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return [row[0] for row in conn.execute(text('SELECT version FROM schema_version ORDER BY version'))]
+
+
+def current_version(engine: Engine) -> int:
+    versions = applied_versions(engine)
+    return versions[-1] if versions else 0
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[Tuple[int, str]]:
+    """Apply pending migrations up to target (default: all); returns those applied"""
+    done = set(applied_versions(engine))
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.utcnow().isoformat()}
+            )
+        applied.append((version, description))
+    return applied
+
+
+# Migrations
+
+JSON_PROFILE_COLUMNS = ('lifestyle_preferences', 'interests', 'deal_breakers')
+# Profile columns holding a JSON array; lifestyle_preferences holds an object
+JSON_LIST_COLUMNS = ('interests', 'deal_breakers')
+
+
+def _json_text(value: str, as_list: bool) -> Optional[str]:
+    """JSON document for a profile value stored as plain text: None if empty or null, text that is
+    not JSON as a JSON string, and anything but an array wrapped in one for the list columns"""
+    if value.strip() in ('', 'null'):
+        return None
+    try:
+        document = json.loads(value)
+    except ValueError:
+        document = value
+    if as_list and not isinstance(document, list):
+        document = [document]
+    return json.dumps(document)
+
+
+@migration(1, 'Store profile lifestyle_preferences, interests and deal_breakers as JSON')
+def json_profile_columns(conn: Connection):
+    if 'user_profile' not in inspect(conn).get_table_names():
+        return
+    columns = list(JSON_PROFILE_COLUMNS)
+    if conn.dialect.name == 'postgresql':
+        types = {column['name']: str(column['type']).upper() for column in inspect(conn).get_columns('user_profile')}
+        columns = [column for column in columns if types.get(column) != 'JSONB']
+
+    # Existing text is cleaned up row by row first, so that every value parses as JSON
+    for column in columns:
+        updates = []
+        for row_id, value in conn.execute(text(f'SELECT id, {column} FROM user_profile WHERE {column} IS NOT NULL')):
+            cleaned = _json_text(value, column in JSON_LIST_COLUMNS)
+            if cleaned != value:
+                updates.append({'id': row_id, 'value': cleaned})
+        if updates:
+            conn.execute(text(f'UPDATE user_profile SET {column} = :value WHERE id = :id'), updates)
+
+    # SQLite keeps JSON as text, so there the cleanup is the whole migration
+    if conn.dialect.name == 'postgresql':
+        for column in columns:
+            conn.execute(text(f'ALTER TABLE user_profile ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb'))
+
+
+@migration(2, 'Canonical match pair order and indexes for the match and profile query paths')
+def match_pair_order_and_indexes(conn: Connection):
+    tables = inspect(conn).get_table_names()
+    if 'match' in tables:
+        # A pair stored both ways keeps one row: the answered one, else the canonical one
+        conn.execute(text('DELETE FROM "match" WHERE user1_id = user2_id'))
+        conn.execute(text(
+            'DELETE FROM "match" WHERE user1_id > user2_id AND EXISTS ('
+            'SELECT 1 FROM "match" twin WHERE twin.user1_id = "match".user2_id AND twin.user2_id = "match".user1_id '
+            "AND (twin.status != 'pending' OR \"match\".status = 'pending'))"
+        ))
+        conn.execute(text(
+            'DELETE FROM "match" WHERE user1_id < user2_id AND EXISTS ('
+            'SELECT 1 FROM "match" twin WHERE twin.user1_id = "match".user2_id AND twin.user2_id = "match".user1_id)'
+        ))
+        conn.execute(text('UPDATE "match" SET user1_id = user2_id, user2_id = user1_id WHERE user1_id > user2_id'))
+
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_match_user1_score ON "match" (user1_id, compatibility_score, id)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_match_user2_score ON "match" (user2_id, compatibility_score, id)'))
+        # SQLite cannot add a CHECK constraint to an existing table; the canonical order is enforced by the app
+        if conn.dialect.name == 'postgresql':
+            checks = {check['name'] for check in inspect(conn).get_check_constraints('match')}
+            if 'ck_match_pair_order' not in checks:
+                conn.execute(text('ALTER TABLE "match" ADD CONSTRAINT ck_match_pair_order CHECK (user1_id < user2_id)'))
+
+    if 'user_profile' in tables:
+        complete = 'is_complete' if conn.dialect.name == 'postgresql' else 'is_complete = 1'
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_profile_user_id ON user_profile (user_id)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_profile_updated_at ON user_profile (updated_at)'))
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_user_profile_complete ON user_profile (user_id) WHERE {complete}'
+        ))
+
+
+@migration(3, 'Widen user.password_hash to 255 characters for scrypt hashes')
+def widen_password_hash(conn: Connection):
+    # SQLite does not enforce VARCHAR lengths
+    if conn.dialect.name != 'postgresql' or 'user' not in inspect(conn).get_table_names():
+        return
+    lengths = {column['name']: getattr(column['type'], 'length', None) for column in inspect(conn).get_columns('user')}
+    if lengths.get('password_hash') is not None and lengths['password_hash'] < 255:
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
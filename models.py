@@ -0,0 +1,116 @@
+"""
+Database models for Roommatch.
+"""
+
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import JSONB
+
+from extensions import db
+
+# JSON document column: JSONB on PostgreSQL, JSON text on SQLite (queryable with JSON1)
+JSONDocument = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+
+# Database Models
+
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    # Hashes carry their algorithm and parameters; scrypt ones are about 160 characters
+    password_hash = db.Column(db.String(255), nullable=False)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    phone = db.Column(db.String(20))
+    is_verified = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationship
+    profile = db.relationship('UserProfile', backref='user', uselist=False, cascade='all, delete-orphan')
+    sent_matches = db.relationship('Match', foreign_keys='Match.user1_id', backref='user1', lazy='dynamic')
+    received_matches = db.relationship('Match', foreign_keys='Match.user2_id', backref='user2', lazy='dynamic')
+
+
+class UserProfile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    # Basic Info
+    age = db.Column(db.Integer)
+    gender = db.Column(db.String(20))
+    occupation = db.Column(db.String(100))
+    education = db.Column(db.String(100))
+
+    # Living Preferences
+    budget_min = db.Column(db.Integer)
+    budget_max = db.Column(db.Integer)
+    location_preference = db.Column(db.String(200))
+    room_type = db.Column(db.String(50))  # single, shared, studio
+
+    # Lifestyle Preferences
+    lifestyle_preferences = db.Column(JSONDocument)  # JSON object
+
+    # Compatibility Factors
+    cleanliness_level = db.Column(db.Integer)  # 1-5 scale
+    social_level = db.Column(db.Integer)  # 1-5 scale
+    noise_tolerance = db.Column(db.Integer)  # 1-5 scale
+    pet_preference = db.Column(db.String(20))  # yes, no, maybe
+    smoking_preference = db.Column(db.String(20))  # yes, no, maybe
+
+    # Bio and Additional Info
+    bio = db.Column(db.Text)
+    interests = db.Column(JSONDocument)  # JSON array of strings
+    deal_breakers = db.Column(JSONDocument)  # JSON array of strings
+
+    # Profile Status
+    is_complete = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Lookups by user, change-feed syncs by updated_at, and scans of complete profiles only
+    __table_args__ = (
+        db.Index('ix_user_profile_user_id', 'user_id'),
+        db.Index('ix_user_profile_updated_at', 'updated_at'),
+        db.Index('ix_user_profile_complete', 'user_id',
+                 sqlite_where=db.text('is_complete = 1'), postgresql_where=db.text('is_complete')),
+    )
+
+
+# Match.status values; a response is stored as the user sent it
+MATCH_PENDING = 'pending'
+MATCH_ACCEPTED = 'accept'
+MATCH_REJECTED = 'reject'
+MATCH_RESPONSES = (MATCH_ACCEPTED, MATCH_REJECTED)
+
+
+class Match(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user1_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user2_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    compatibility_score = db.Column(db.Float, nullable=False)
+    match_reason = db.Column(db.Text)
+    status = db.Column(db.String(20), default=MATCH_PENDING)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Pairs are stored once, lower user ID first (see canonical_pair), so the
+    # unique constraint also covers the reverse pair; each side gets an index
+    # ordered like GET /api/matches
+    __table_args__ = (
+        db.UniqueConstraint('user1_id', 'user2_id', name='unique_match'),
+        db.CheckConstraint('user1_id < user2_id', name='ck_match_pair_order'),
+        db.Index('ix_match_user1_score', 'user1_id', 'compatibility_score', 'id'),
+        db.Index('ix_match_user2_score', 'user2_id', 'compatibility_score', 'id'),
+    )
+
+
+class Waitlist(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), nullable=False)  # Stored lowercased
+    name = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Signups are inserted with ON CONFLICT DO NOTHING against this index, so repeats are skipped
+    __table_args__ = (
+        db.Index('ix_waitlist_email', 'email', unique=True),
+    )
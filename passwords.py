@@ -0,0 +1,136 @@
+"""
+Password hashing service for Roommatch.
+
+Hashing and verification are CPU-bound, so they run on a dedicated process
+pool instead of the request thread. A bounded semaphore caps the number of
+operations in flight; when it is exhausted callers get HashingBusyError
+(surfaced as 503) instead of piling up behind the pool. Hashes made with an
+older algorithm or cost still verify, and needs_rehash() tells the caller
+to upgrade them after a successful login. Latency (including time queued
+for the pool), CPU time, rejections and operations in flight are recorded
+on the metrics.Instrumentation passed in, so /api/metrics exposes them.
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, List, Optional, Tuple
+
+import bcrypt
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Default cost per algorithm: bcrypt log rounds, PBKDF2 iterations, scrypt N
+DEFAULT_COSTS = {'bcrypt': 12, 'pbkdf2': 600000, 'scrypt': 32768}
+
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+
+class HashingBusyError(Exception):
+    """Raised when too many hashing operations are already queued"""
+
+
+def _hash_password(password: str, algorithm: str, cost: int) -> Tuple[str, float]:
+    """Hash a password; runs in a pool process and returns (hash, CPU seconds)"""
+    started = time.perf_counter()
+    if algorithm == 'bcrypt':
+        hashed = bcrypt.hashpw(password.encode()[:BCRYPT_MAX_BYTES], bcrypt.gensalt(cost)).decode()
+    elif algorithm == 'pbkdf2':
+        hashed = generate_password_hash(password, method=f'pbkdf2:sha256:{cost}')
+    elif algorithm == 'scrypt':
+        hashed = generate_password_hash(password, method=f'scrypt:{cost}:8:1')
+    else:
+        raise ValueError(f'Unsupported password hash algorithm: {algorithm}')
+    return hashed, time.perf_counter() - started
+
+
+def _verify_password(password: str, hashed: str) -> Tuple[bool, float]:
+    """Check a password against any supported hash format; returns (match, CPU seconds)"""
+    started = time.perf_counter()
+    if hashed.startswith('$2'):
+        matches = bcrypt.checkpw(password.encode()[:BCRYPT_MAX_BYTES], hashed.encode())
+    else:
+        matches = check_password_hash(hashed, password)
+    return matches, time.perf_counter() - started
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded process pool"""
+
+    def __init__(self, algorithm: str = 'bcrypt', cost: Optional[int] = None, workers: int = 2,
+                 max_pending: Optional[int] = None, queue_timeout: float = 5.0, metrics: Any = None):
+        if algorithm not in DEFAULT_COSTS:
+            raise ValueError(f'Unsupported password hash algorithm: {algorithm}')
+        self.algorithm = algorithm
+        self.cost = cost or DEFAULT_COSTS[algorithm]
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending or max(workers, 1) * 4)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self.metrics = metrics
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Spawned lazily, and with 'spawn' so workers never inherit request threads or DB connections
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, operation: str, func, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            if self.metrics is not None:
+                self.metrics.password_hash_rejected.inc(operation=operation)
+            raise HashingBusyError('Password hashing is at capacity, please retry')
+
+        if self.metrics is not None:
+            self.metrics.password_hash_in_flight.inc(operation=operation)
+        try:
+            if self.workers > 0:
+                result, cpu_seconds = self._pool().submit(func, *args).result()
+            else:
+                result, cpu_seconds = func(*args)
+        finally:
+            if self.metrics is not None:
+                self.metrics.password_hash_in_flight.inc(-1, operation=operation)
+            self._slots.release()
+
+        if self.metrics is not None:
+            self.metrics.record_password_hashing(operation, time.perf_counter() - started, cpu_seconds)
+        return result
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured algorithm and cost"""
+        return self._run('hash', _hash_password, password, self.algorithm, self.cost)
+
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash a batch of passwords across the whole pool (bulk imports; not bounded by max_pending)"""
+        if not passwords:
+            return []
+        args = (passwords, repeat(self.algorithm), repeat(self.cost))
+        if self.workers > 0:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            results = list(self._pool().map(_hash_password, *args, chunksize=chunksize))
+        else:
+            results = list(map(_hash_password, *args))
+
+        if self.metrics is not None:
+            self.metrics.password_hash_cpu_seconds.inc(sum(cpu_seconds for _, cpu_seconds in results), operation='hash')
+        return [hashed for hashed, _ in results]
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """Check a password against a hash made by any supported algorithm"""
+        return self._run('verify', _verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if the hash was made with a different algorithm or cost than configured"""
+        if self.algorithm == 'bcrypt':
+            return not (hashed.startswith('$2') and hashed[4:6] == f'{self.cost:02d}')
+        if self.algorithm == 'pbkdf2':
+            return not hashed.startswith(f'pbkdf2:sha256:{self.cost}$')
+        return not hashed.startswith(f'scrypt:{self.cost}:8:1$')
@@ -0,0 +1,91 @@
+"""
+Offline all-pairs compatibility scoring for Roommatch.
+
+Profiles are sorted by user ID and split into blocks of probe users; each
+block is scored against the candidate batch in a worker process. Every
+unordered pair is scored exactly once: a probe is paired with candidates
+that have a larger user ID, plus (for incremental runs) every unchanged
+profile, since unchanged-unchanged pairs do not need re-scoring.
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from scoring import MATCH_THRESHOLD, ProfileBatch, SCORING_FIELDS, score_batch
+
+# Lightweight stand-in for UserProfile that pickles cheaply to workers
+ProfileRow = namedtuple('ProfileRow', ('user_id',) + SCORING_FIELDS)
+
+# Scored pair: (lower user ID, higher user ID, score)
+ScoredPair = Tuple[int, int, float]
+
+_worker_state = {}
+
+
+def _init_worker(rows: Sequence[ProfileRow], changed: np.ndarray, threshold: float):
+    """Build the shared candidate batch once per worker process"""
+    _worker_state['rows'] = rows
+    _worker_state['batch'] = ProfileBatch.from_rows(rows)
+    _worker_state['changed'] = changed
+    _worker_state['threshold'] = threshold
+
+
+def _score_block(start: int, stop: int) -> Tuple[List[ScoredPair], int]:
+    """Score probes rows[start:stop] against their candidates; return matches and pairs scored"""
+    rows = _worker_state['rows']
+    batch = _worker_state['batch']
+    changed = _worker_state['changed']
+    threshold = _worker_state['threshold']
+
+    matches: List[ScoredPair] = []
+    pairs = 0
+    for position in range(start, stop):
+        if not changed[position]:
+            continue
+        # Later (higher-ID) profiles, plus earlier ones that did not change
+        candidates = np.flatnonzero(~changed[:position])
+        candidates = np.concatenate([candidates, np.arange(position + 1, len(rows))])
+        if not len(candidates):
+            continue
+
+        scores = score_batch(rows[position], batch.take(candidates))
+        pairs += len(candidates)
+
+        probe_id = rows[position].user_id
+        for index in np.flatnonzero(scores > threshold).tolist():
+            other_id = int(batch.user_ids[candidates[index]])
+            matches.append((min(probe_id, other_id), max(probe_id, other_id), float(scores[index])))
+    return matches, pairs
+
+
+def score_all_pairs(rows: Sequence[ProfileRow], changed_ids: Optional[Set[int]] = None,
+                    threshold: float = MATCH_THRESHOLD, workers: Optional[int] = None,
+                    block_size: int = 256) -> Iterator[Tuple[List[ScoredPair], int]]:
+    """
+    Yield (matches, pairs scored) per block of probe users as blocks finish.
+    changed_ids limits scoring to pairs touching those users (None = all pairs).
+    """
+    rows = sorted(rows, key=lambda row: row.user_id)
+    if changed_ids is None:
+        changed = np.ones(len(rows), dtype=bool)
+    else:
+        changed = np.array([row.user_id in changed_ids for row in rows], dtype=bool)
+
+    blocks = [(start, min(start + block_size, len(rows))) for start in range(0, len(rows), block_size)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(rows, changed, threshold)
+        for start, stop in blocks:
+            yield _score_block(start, stop)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(rows, changed, threshold)) as executor:
+        futures = [executor.submit(_score_block, start, stop) for start, stop in blocks]
+        for future in as_completed(futures):
+            yield future.result()
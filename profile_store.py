@@ -0,0 +1,213 @@
+"""
+Compact in-memory snapshot of complete profiles for the scoring hot path.
+
+Only the fields calculate_compatibility_score reads are kept, in growable
+NumPy columns (about 85 bytes per profile plus the ID lookup) instead of
+full SQLAlchemy instances with their text fields and identity-map
+overhead. Pet, smoking and location values are interned into one table of
+int32 codes shared with ProfileBatch, and interests, traits and deal-breakers are
+kept as vocabulary bitsets, so a ProfileBatch over any subset of the store
+is a cheap fancy-index rather than a re-encode.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from scoring import LIFESTYLE_FIELDS, MISSING_CODE, SCORING_FIELDS, ProfileBatch, as_float
+from vocabulary import decode, deal_breaker_bits, interest_bits, trait_bits
+
+# Rows applied per vectorized write when syncing
+WRITE_CHUNK = 4096
+
+
+class ProfileRecord:
+    """Scoring fields of one profile, materialized from the store on demand"""
+
+    __slots__ = ('user_id',) + SCORING_FIELDS
+
+    def __init__(self, user_id: int, **fields):
+        self.user_id = user_id
+        for field in SCORING_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    def __repr__(self) -> str:
+        return f'<ProfileRecord {self.user_id}>'
+
+
+class ProfileStore:
+    """Columnar store of complete profiles' scoring fields, keyed by user ID"""
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self.codes: Dict[str, int] = {}
+        self._values: List[Optional[str]] = [None]  # code -> value, code 0 is missing
+        self._positions: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.user_ids = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.budget_min = np.zeros(capacity, dtype=np.float64)
+        self.budget_max = np.zeros(capacity, dtype=np.float64)
+        self.lifestyle = {field: np.zeros(capacity, dtype=np.float64) for field in LIFESTYLE_FIELDS}
+        # One code table serves all three columns, so each must hold any code (one per distinct location)
+        self.pet = np.zeros(capacity, dtype=np.int32)
+        self.smoking = np.zeros(capacity, dtype=np.int32)
+        self.location = np.zeros(capacity, dtype=np.int32)
+        self.interests = np.zeros(capacity, dtype=np.uint64)
+        self.traits = np.zeros(capacity, dtype=np.uint64)
+        self.deal_breakers = np.zeros(capacity, dtype=np.uint64)
+
+    def _columns(self) -> Dict[str, np.ndarray]:
+        columns = {
+            'user_ids': self.user_ids, 'alive': self.alive,
+            'budget_min': self.budget_min, 'budget_max': self.budget_max,
+            'pet': self.pet, 'smoking': self.smoking, 'location': self.location,
+            'interests': self.interests, 'traits': self.traits, 'deal_breakers': self.deal_breakers,
+        }
+        columns.update(self.lifestyle)
+        return columns
+
+    def _reserve(self, extra: int):
+        """Grow every column (by doubling) so extra more rows fit"""
+        needed = self._size + extra
+        capacity = len(self.user_ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self._columns().items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            if name in self.lifestyle:
+                self.lifestyle[name] = grown
+            else:
+                setattr(self, name, grown)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._positions
+
+    def intern(self, value: Any) -> int:
+        """Return the small-int code for a categorical value, assigning one if new"""
+        if not value:
+            return MISSING_CODE
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def upsert(self, rows: Iterable[Any]):
+        """Insert or replace profiles from rows exposing user_id and SCORING_FIELDS"""
+        chunk: List[Any] = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == WRITE_CHUNK:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+
+    def _write(self, rows: List[Any]):
+        with self._lock:
+            self._reserve(sum(1 for row in rows if row.user_id not in self._positions))
+            positions = []
+            for row in rows:
+                position = self._positions.get(row.user_id)
+                if position is None:
+                    if self._free:
+                        position = self._free.pop()
+                    else:
+                        position = self._size
+                        self._size += 1
+                    self._positions[row.user_id] = position
+                positions.append(position)
+
+            index = np.array(positions, dtype=np.int64)
+            self.user_ids[index] = [row.user_id for row in rows]
+            self.alive[index] = True
+            self.budget_min[index] = [as_float(row.budget_min) for row in rows]
+            self.budget_max[index] = [as_float(row.budget_max) for row in rows]
+            for field in LIFESTYLE_FIELDS:
+                self.lifestyle[field][index] = [as_float(getattr(row, field)) for row in rows]
+            self.pet[index] = [self.intern(row.pet_preference) for row in rows]
+            self.smoking[index] = [self.intern(row.smoking_preference) for row in rows]
+            self.location[index] = [
+                self.intern(row.location_preference.lower() if row.location_preference else None)
+                for row in rows
+            ]
+            self.interests[index] = [interest_bits(row) for row in rows]
+            self.traits[index] = [trait_bits(row) for row in rows]
+            self.deal_breakers[index] = [deal_breaker_bits(row) for row in rows]
+
+    def remove(self, user_id: int):
+        """Drop a profile; its slot is reused by the next insert"""
+        with self._lock:
+            position = self._positions.pop(user_id, None)
+            if position is not None:
+                self.alive[position] = False
+                self._free.append(position)
+
+    def sync(self, rows: Iterable[Any]):
+        """Apply rows (user_id, is_complete and SCORING_FIELDS), removing incomplete profiles"""
+        complete = []
+        for row in rows:
+            if row.is_complete:
+                complete.append(row)
+            else:
+                self.remove(row.user_id)
+            if len(complete) == WRITE_CHUNK:
+                self.upsert(complete)
+                complete = []
+        self.upsert(complete)
+
+    def record(self, user_id: int) -> Optional[ProfileRecord]:
+        """Materialize one profile's scoring fields (location comes back lower-cased)"""
+        with self._lock:
+            position = self._positions.get(user_id)
+            if position is None:
+                return None
+            fields = {
+                'budget_min': self.budget_min[position].item() or None,
+                'budget_max': self.budget_max[position].item() or None,
+                'pet_preference': self._values[self.pet[position]],
+                'smoking_preference': self._values[self.smoking[position]],
+                'location_preference': self._values[self.location[position]],
+                'interests': decode(int(self.interests[position])) or None,
+                'deal_breakers': decode(int(self.deal_breakers[position])) or None,
+            }
+            for field in LIFESTYLE_FIELDS:
+                fields[field] = self.lifestyle[field][position].item() or None
+            return ProfileRecord(user_id, **fields)
+
+    def batch(self, user_ids: Optional[Iterable[int]] = None, exclude: Set[int] = frozenset()) -> ProfileBatch:
+        """
+        ProfileBatch over the given user IDs (None = every profile), ordered
+        by user ID; IDs not in the store and excluded IDs are skipped
+        """
+        with self._lock:
+            if user_ids is None:
+                positions = np.flatnonzero(self.alive[:self._size])
+                positions = positions[np.argsort(self.user_ids[positions], kind='stable')]
+                if exclude:
+                    positions = positions[~np.isin(self.user_ids[positions], list(exclude))]
+            else:
+                positions = np.array(
+                    [self._positions[user_id] for user_id in sorted(user_ids)
+                     if user_id in self._positions and user_id not in exclude],
+                    dtype=np.int64
+                )
+            return ProfileBatch.from_arrays(
+                self.codes, self.user_ids[positions], self.budget_min[positions],
+                self.budget_max[positions],
+                {field: column[positions] for field, column in self.lifestyle.items()},
+                self.pet[positions], self.smoking[positions], self.location[positions],
+                self.interests[positions], self.traits[positions], self.deal_breakers[positions]
+            )
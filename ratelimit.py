@@ -0,0 +1,197 @@
+"""
+Token-bucket rate limiting and request coalescing for expensive endpoints.
+
+A limit such as '5/minute' is a bucket of 5 tokens refilled at 5 per
+minute: a client may burst up to 5 requests, then one more every 12
+seconds. Buckets are keyed by endpoint and client: the JWT identity when
+the request carries one, otherwise the remote address (for login, together
+with the email being tried).
+
+MemoryBuckets keeps buckets in process memory, so each worker enforces the
+limit on its own (N workers let a client through N times as often); RedisBuckets keeps them in Redis, updated atomically by a
+Lua script, so the limit holds across every worker and host. A backend
+error lets the request through rather than failing it.
+
+SingleFlight coalesces concurrent identical calls within a process: the
+first caller runs the function and everyone who asks for the same key
+meanwhile waits for, and shares, its result.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+LIMIT_PATTERN = re.compile(r'(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?')
+
+
+class RateLimit:
+    """Bucket capacity and refill rate parsed from 'N/period'"""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> Optional['RateLimit']:
+        """Parse '10/minute' (or '10/5minutes'); empty or '0' disables the limit"""
+        if not text or text.strip() == '0':
+            return None
+        match = LIMIT_PATTERN.fullmatch(text.strip().lower())
+        if not match or int(match.group(1)) < 1:
+            raise ValueError(f'Invalid rate limit {text!r}, expected e.g. 10/minute')
+        count, multiplier, unit = match.groups()
+        return cls(int(count), PERIODS[unit] * int(multiplier or 1))
+
+    def __repr__(self) -> str:
+        return f'<RateLimit {self.capacity}/{self.period}s>'
+
+
+class BucketStore:
+    """Interface for token bucket storage"""
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        """Take one token; returns 0 when allowed, else the seconds until a token is available"""
+        raise NotImplementedError
+
+
+class MemoryBuckets(BucketStore):
+    """Thread-safe in-process buckets; the least recently used are dropped past max_keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# KEYS[1] bucket; ARGV capacity, refill rate per second, now (seconds); returns the wait as a string
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets(BucketStore):
+    """Buckets in Redis, shared by every worker (needs a redis-py client)"""
+
+    def __init__(self, client: Any, prefix: str = 'roommatch:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, limit):
+        # Wall-clock time, so every host refills at the same pace
+        return float(self._take(keys=[self.prefix + key], args=[limit.capacity, limit.rate, time.time()]))
+
+
+def buckets_from_url(url: str) -> BucketStore:
+    """Build a bucket store from 'memory' or a redis:// URL"""
+    if url == 'memory':
+        return MemoryBuckets()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis  # Optional dependency, only needed for shared limits
+        return RedisBuckets(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported rate limit URL: {url}')
+
+
+class RateLimiter:
+    """Checks named endpoint limits against a bucket store"""
+
+    def __init__(self, store: BucketStore, limits: Dict[str, Optional[RateLimit]]):
+        self.store = store
+        self.limits = limits
+
+    def check(self, endpoint: str, client: str) -> float:
+        """0 when the request may proceed, else the seconds to wait before retrying"""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return 0.0
+        try:
+            return self.store.take(f'{endpoint}:{client}', limit)
+        except Exception:
+            logger.exception('Rate limit check failed for %s; allowing the request', endpoint)
+            return 0.0
+
+    @staticmethod
+    def retry_after(wait: float) -> str:
+        """Retry-After header value (whole seconds, at least 1)"""
+        return str(max(1, math.ceil(wait)))
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its outcome"""
+
+    def __init__(self):
+        self._calls: Dict[Any, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Any, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller's run was reused"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
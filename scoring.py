@@ -0,0 +1,314 @@
+"""
+Vectorized compatibility scoring for Roommatch.
+
+Scores one profile against a whole batch of candidate profiles in a single
+NumPy pass. The arithmetic mirrors calculate_compatibility_score in app.py
+operation for operation, so both paths produce identical floats.
+Interests and deal-breakers are held as 64-bit vocabulary bitsets (see
+vocabulary.py), so deal-breaker checks and interest overlap are bitwise
+operations plus a popcount over the whole batch.
+"""
+
+import heapq
+import numpy as np
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from vocabulary import deal_breaker_bits, encode, habit_bits, interest_bits, trait_bits
+
+# Profile attributes read by the scoring function, in column order
+SCORING_FIELDS = (
+    'budget_min',
+    'budget_max',
+    'cleanliness_level',
+    'social_level',
+    'noise_tolerance',
+    'pet_preference',
+    'smoking_preference',
+    'location_preference',
+    'interests',
+    'deal_breakers',
+)
+
+LIFESTYLE_FIELDS = ('cleanliness_level', 'social_level', 'noise_tolerance')
+
+# Pairs must score strictly above this to become a Match
+MATCH_THRESHOLD = 0.6
+
+# Code reserved for missing/empty categorical values
+MISSING_CODE = 0
+# Code used for probe values the batch has never seen (never equal to a batch code)
+UNKNOWN_CODE = -1
+# Absorbs float rounding so upper bounds never fall below the exact score
+UPPER_BOUND_SLACK = 1e-9
+
+
+def as_float(value: Any) -> float:
+    """Convert a nullable numeric column to float, mapping None to 0 (falsy)"""
+    return float(value) if value else 0.0
+
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(bits: np.ndarray) -> np.ndarray:
+        """Number of set bits in each element of a uint64 array"""
+        return np.bitwise_count(bits).astype(np.int64)
+else:
+    _BYTE_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+    def popcount(bits: np.ndarray) -> np.ndarray:
+        """Number of set bits in each element of a uint64 array"""
+        return _BYTE_POPCOUNT[np.ascontiguousarray(bits).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class ProfileBatch:
+    """Columnar snapshot of candidate profiles used for batch scoring"""
+
+    def __init__(self, user_ids: Sequence[int], columns: Dict[str, List[Any]]):
+        self.codes: Dict[str, int] = {}
+
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.budget_min = np.array([as_float(v) for v in columns['budget_min']], dtype=np.float64)
+        self.budget_max = np.array([as_float(v) for v in columns['budget_max']], dtype=np.float64)
+        self.lifestyle = {
+            field: np.array([as_float(v) for v in columns[field]], dtype=np.float64)
+            for field in LIFESTYLE_FIELDS
+        }
+        self.pet = self._encode(columns['pet_preference'])
+        self.smoking = self._encode(columns['smoking_preference'])
+        self.location = self._encode(
+            [v.lower() if v else v for v in columns['location_preference']]
+        )
+        self.interests = np.array([encode(v) for v in columns['interests']], dtype=np.uint64)
+        self.traits = self.interests | np.array([
+            habit_bits(smoking, pet, cleanliness) for smoking, pet, cleanliness in zip(
+                columns['smoking_preference'], columns['pet_preference'], columns['cleanliness_level']
+            )
+        ], dtype=np.uint64)
+        self.deal_breakers = np.array([encode(v) for v in columns['deal_breakers']], dtype=np.uint64)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Any]]) -> 'ProfileBatch':
+        """Build a batch from (user_id, *SCORING_FIELDS) tuples"""
+        user_ids = []
+        columns: Dict[str, List[Any]] = {field: [] for field in SCORING_FIELDS}
+        for row in rows:
+            user_ids.append(row[0])
+            for field, value in zip(SCORING_FIELDS, row[1:]):
+                columns[field].append(value)
+        return cls(user_ids, columns)
+
+    @classmethod
+    def from_profiles(cls, profiles: Iterable[Any]) -> 'ProfileBatch':
+        """Build a batch from objects exposing user_id and the scoring attributes"""
+        return cls.from_rows(
+            (p.user_id, *(getattr(p, field) for field in SCORING_FIELDS)) for p in profiles
+        )
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @classmethod
+    def from_arrays(cls, codes: Dict[str, int], user_ids: np.ndarray, budget_min: np.ndarray,
+                    budget_max: np.ndarray, lifestyle: Dict[str, np.ndarray], pet: np.ndarray,
+                    smoking: np.ndarray, location: np.ndarray, interests: np.ndarray, traits: np.ndarray,
+                    deal_breakers: np.ndarray) -> 'ProfileBatch':
+        """Wrap already-encoded columns (location codes must be of lower-cased values)"""
+        batch = cls.__new__(cls)
+        batch.codes = codes
+        batch.user_ids = user_ids
+        batch.budget_min = budget_min
+        batch.budget_max = budget_max
+        batch.lifestyle = lifestyle
+        batch.pet = pet
+        batch.smoking = smoking
+        batch.location = location
+        batch.interests = interests
+        batch.traits = traits
+        batch.deal_breakers = deal_breakers
+        return batch
+
+    def take(self, indices: np.ndarray) -> 'ProfileBatch':
+        """Return a sub-batch of the given rows, sharing this batch's codes"""
+        return ProfileBatch.from_arrays(
+            self.codes, self.user_ids[indices], self.budget_min[indices], self.budget_max[indices],
+            {field: column[indices] for field, column in self.lifestyle.items()},
+            self.pet[indices], self.smoking[indices], self.location[indices],
+            self.interests[indices], self.traits[indices], self.deal_breakers[indices]
+        )
+
+    def _encode(self, values: Iterable[Any]) -> np.ndarray:
+        """Intern categorical strings into small integer codes"""
+        encoded = []
+        for value in values:
+            if not value:
+                encoded.append(MISSING_CODE)
+            else:
+                encoded.append(self.codes.setdefault(value, len(self.codes) + 1))
+        return np.array(encoded, dtype=np.int32)
+
+    def code_for(self, value: Any) -> int:
+        """Look up the code of a probe value against this batch's vocabulary"""
+        if not value:
+            return MISSING_CODE
+        return self.codes.get(value, UNKNOWN_CODE)
+
+
+def _budget_component(profile: Any, batch: ProfileBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """Budget points and weight (30%) for every profile in the batch"""
+    n = len(batch)
+    if not (profile.budget_min and profile.budget_max):
+        return np.zeros(n), np.zeros(n)
+
+    min1 = float(profile.budget_min)
+    max1 = float(profile.budget_max)
+    has_budget = (batch.budget_min != 0) & (batch.budget_max != 0)
+
+    budget_overlap = np.minimum(max1, batch.budget_max) - np.maximum(min1, batch.budget_min)
+    budget_range = np.maximum(max1 - min1, batch.budget_max - batch.budget_min)
+    overlapping = has_budget & (budget_overlap > 0)
+
+    budget_score = np.divide(budget_overlap, budget_range, out=np.zeros(n), where=overlapping)
+    return np.where(overlapping, budget_score * 0.3, 0.0), np.where(has_budget, 0.3, 0.0)
+
+
+def _lifestyle_score(profile: Any, batch: ProfileBatch) -> np.ndarray:
+    """Mean lifestyle factor similarity, before the 40% weight is applied"""
+    lifestyle_score = np.zeros(len(batch), dtype=np.float64)
+    for field in LIFESTYLE_FIELDS:
+        val1 = getattr(profile, field)
+        val2 = batch.lifestyle[field]
+        if val1:
+            factor_score = 1 - np.abs(float(val1) - val2) / 4
+            lifestyle_score += np.where(val2 != 0, factor_score, 0.0)
+
+    # Interest overlap (Jaccard) is one more factor when both profiles list interests
+    interests = np.uint64(interest_bits(profile))
+    if not interests:
+        lifestyle_score /= len(LIFESTYLE_FIELDS)
+        return lifestyle_score
+
+    both = batch.interests != 0
+    shared = popcount(batch.interests & interests)
+    union = popcount(batch.interests | interests)
+    lifestyle_score += np.divide(shared, union, out=np.zeros(len(batch)), where=both)
+    lifestyle_score /= np.where(both, len(LIFESTYLE_FIELDS) + 1, len(LIFESTYLE_FIELDS))
+    return lifestyle_score
+
+
+def _preference_component(value: Any, column: np.ndarray, batch: ProfileBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """Pet/smoking points and weight (10%): full credit when equal, half credit for 'maybe'"""
+    if not value:
+        return np.zeros(len(batch)), np.zeros(len(batch))
+
+    present = column != MISSING_CODE
+    if value == 'maybe':
+        half = np.full(column.shape, 0.05)
+    else:
+        half = np.where(column == batch.code_for('maybe'), 0.05, 0.0)
+    points = np.where(column == batch.code_for(value), 0.1, half)
+    return np.where(present, points, 0.0), np.where(present, 0.1, 0.0)
+
+
+def _location_component(profile: Any, batch: ProfileBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """Location points and weight (10%)"""
+    if not profile.location_preference:
+        return np.zeros(len(batch)), np.zeros(len(batch))
+
+    present = batch.location != MISSING_CODE
+    same = batch.location == batch.code_for(profile.location_preference.lower())
+    return np.where(present & same, 0.1, 0.0), np.where(present, 0.1, 0.0)
+
+
+def compatible_mask(profile: Any, batch: ProfileBatch) -> np.ndarray:
+    """False where either side's deal-breakers match the other's traits"""
+    mask = np.ones(len(batch), dtype=bool)
+    deal_breakers = deal_breaker_bits(profile)
+    if deal_breakers:
+        mask &= (batch.traits & np.uint64(deal_breakers)) == 0
+    traits = trait_bits(profile)
+    if traits:
+        mask &= (batch.deal_breakers & np.uint64(traits)) == 0
+    return mask
+
+
+def exclude_deal_breakers(profile: Any, batch: ProfileBatch) -> ProfileBatch:
+    """Sub-batch of the candidates compatible with profile's (and their own) deal-breakers"""
+    mask = compatible_mask(profile, batch)
+    return batch if mask.all() else batch.take(np.flatnonzero(mask))
+
+
+def score_batch(profile: Any, batch: ProfileBatch) -> np.ndarray:
+    """Calculate compatibility scores between one profile and every profile in a batch"""
+    # Components are accumulated in the same order as calculate_compatibility_score
+    score = np.zeros(len(batch), dtype=np.float64)
+    total_weight = np.zeros(len(batch), dtype=np.float64)
+
+    # Budget compatibility (30% weight)
+    points, weight = _budget_component(profile, batch)
+    score += points
+    total_weight += weight
+
+    # Lifestyle compatibility (40% weight)
+    score += _lifestyle_score(profile, batch) * 0.4
+    total_weight += 0.4
+
+    # Pet and smoking preference compatibility (10% weight each)
+    for value, column in ((profile.pet_preference, batch.pet), (profile.smoking_preference, batch.smoking)):
+        points, weight = _preference_component(value, column, batch)
+        score += points
+        total_weight += weight
+
+    # Location preference (10% weight)
+    points, weight = _location_component(profile, batch)
+    score += points
+    total_weight += weight
+
+    # Normalize score
+    score = np.divide(score, total_weight, out=score.copy(), where=total_weight > 0)
+
+    # Cap at 1.0; deal-breakers score 0
+    return np.where(compatible_mask(profile, batch), np.minimum(score, 1.0), 0.0)
+
+
+def upper_bound_batch(profile: Any, batch: ProfileBatch) -> np.ndarray:
+    """
+    Upper bound on score_batch computed from the budget and location
+    components only, assuming full lifestyle, pet and smoking credit
+    (0 for candidates excluded by deal-breakers)
+    """
+    budget_points, budget_weight = _budget_component(profile, batch)
+    location_points, location_weight = _location_component(profile, batch)
+    _, pet_weight = _preference_component(profile.pet_preference, batch.pet, batch)
+    _, smoking_weight = _preference_component(profile.smoking_preference, batch.smoking, batch)
+
+    optimistic = 0.4 + pet_weight + smoking_weight
+    bound = (budget_points + location_points + optimistic) / (budget_weight + location_weight + optimistic)
+    return np.where(compatible_mask(profile, batch), np.minimum(bound, 1.0) + UPPER_BOUND_SLACK, 0.0)
+
+
+def top_k(profile: Any, batch: ProfileBatch, k: int, threshold: float = MATCH_THRESHOLD,
+          block_size: int = 4096) -> List[Tuple[int, float]]:
+    """
+    Return (batch index, score) for the k best candidates scoring above
+    threshold, best first. Candidates are scored in blocks in decreasing
+    order of their upper bound, stopping once no remaining bound can beat
+    the current k-th best score.
+    """
+    bounds = upper_bound_batch(profile, batch)
+    order = np.argsort(-bounds, kind='stable')
+    heap: List[Tuple[float, int]] = []  # min-heap of (score, -index)
+
+    for start in range(0, len(order), block_size):
+        block = order[start:start + block_size]
+        floor = heap[0][0] if len(heap) == k else threshold
+        if bounds[block[0]] < floor or bounds[block[0]] <= threshold:
+            break
+
+        scores = score_batch(profile, batch.take(block))
+        keep = (scores > threshold) & (scores >= floor)
+        for index, score in zip(block[keep].tolist(), scores[keep].tolist()):
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -index))
+            elif (score, -index) > heap[0]:
+                heapq.heapreplace(heap, (score, -index))
+
+    return [(-neg_index, score) for score, neg_index in sorted(heap, reverse=True)]
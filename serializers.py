@@ -0,0 +1,115 @@
+"""
+JSON serialization for Roommatch API responses.
+
+FastJSONProvider replaces Flask's JSON provider, so jsonify, request.get_json
+and every response builder go through it. It encodes with orjson when that
+package is installed (several times faster than the standard library,
+notably on long match lists) and falls back to the json module otherwise.
+Both backends produce the same documents: keys sorted, datetimes in ISO 8601
+(as isoformat() writes them) and other types as Flask's default provider
+handles them.
+
+Serializer builds the dict conversion for one model or row shape up front
+(a single attrgetter call per object, or itemgetter for result rows),
+replacing dicts built field by field in each view.
+"""
+
+import json
+import operator
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # Optional dependency, the fast path
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# A serialized field: the attribute name, or (key, attribute) to rename it
+Field = Union[str, Tuple[str, str]]
+
+
+def _default(value: Any) -> Any:
+    """Encode values neither backend handles natively"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+def _stdlib_default(value: Any) -> Any:
+    # date is handled before Flask's default, which would write an HTTP date
+    if isinstance(value, date):
+        return value.isoformat()
+    return _default(value)
+
+
+def dumps_bytes(value: Any) -> bytes:
+    """Compact UTF-8 JSON with sorted keys"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # orjson refuses integers past 64 bits, which the json module writes; anything
+            # neither backend can encode raises again below
+            pass
+    return json.dumps(value, default=_stdlib_default, sort_keys=True, ensure_ascii=False,
+                      separators=(',', ':')).encode()
+
+
+def dumps(value: Any) -> str:
+    """dumps_bytes as text"""
+    return dumps_bytes(value).decode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using dumps_bytes (orjson when available)"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            # Custom json.dumps options (e.g. indent) keep the standard library
+            kwargs.setdefault('default', _stdlib_default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        return self._app.response_class(dumps_bytes(self._prepare_response_obj(args, kwargs)),
+                                        mimetype=self.mimetype)
+
+
+class Serializer:
+    """Turns objects or rows of one shape into dicts of the given fields (attribute names or (key, attribute))"""
+
+    def __init__(self, fields: Sequence[Field]):
+        self.keys = tuple(field if isinstance(field, str) else field[0] for field in fields)
+        self.attributes = tuple(field if isinstance(field, str) else field[1] for field in fields)
+        self._getter = self._values(operator.attrgetter(*self.attributes))
+
+    def _values(self, getter: Callable[[Any], Any]) -> Callable[[Any], Tuple]:
+        # attrgetter/itemgetter return a bare value, not a 1-tuple, for a single field
+        return (lambda obj: (getter(obj),)) if len(self.keys) == 1 else getter
+
+    def __call__(self, obj: Any) -> Dict[str, Any]:
+        return dict(zip(self.keys, self._getter(obj)))
+
+    def many(self, rows: Sequence[Any]) -> List[Dict[str, Any]]:
+        """
+        Serialize a list of objects; result rows (which all share their
+        columns) are read by position, several times faster than by name
+        """
+        if not rows:
+            return []
+        columns = getattr(rows[0], '_fields', None)
+        if columns is None:
+            getter = self._getter
+        else:
+            getter = self._values(operator.itemgetter(*(columns.index(name) for name in self.attributes)))
+        keys = self.keys
+        return [dict(zip(keys, getter(row))) for row in rows]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+ANN candidate retrieval tests for Roommatch
+Checks the recall of the IVF shortlist against exact retrieval on a seeded
+population, and that retraining runs on the background worker while
+queries and updates carry on against the previous lists
+Run with: python -m pytest test_ann_index.py
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+from test_matching import AppTestCase, add_user
+
+import ann_index
+import app as roommatch
+from ann_index import AnnIndex
+from benchmarks.ann_recall import run
+from profile_store import ProfileRecord
+
+
+def record(user_id: int, budget: int) -> ProfileRecord:
+    return ProfileRecord(user_id, budget_min=budget, budget_max=budget + 400, cleanliness_level=3, social_level=3,
+                         noise_tolerance=3, pet_preference='no', smoking_preference='no')
+
+
+class RecallTests(unittest.TestCase):
+    """The shortlist of the probed lists finds nearly all of the exact matches"""
+
+    def test_recall_against_exact_retrieval(self):
+        results = run(size=6000, seed=7, samples=50, probes=[4, 16, 1000], k=20)
+        four, sixteen, every_list = results['ann']
+
+        self.assertGreaterEqual(sixteen['recall'], 0.85)
+        self.assertGreaterEqual(sixteen['recall_at_k'], 0.9)
+        self.assertLess(sixteen['mean_shortlist'], results['exact']['mean_shortlist'])
+        self.assertLess(four['recall'], sixteen['recall'])
+        # Probing every list considers everyone, so nothing is missed
+        self.assertEqual((every_list['recall'], every_list['recall_at_k']), (1.0, 1.0))
+
+
+class TrainingTests(unittest.TestCase):
+    """k-means runs without the index lock, and the new lists are swapped in whole"""
+
+    def setUp(self):
+        self.index = AnnIndex(probes=2, lists=4)
+        for user_id in range(1, 41):
+            self.index.update(user_id, record(user_id, 500 + 100 * (user_id % 4)))
+        patcher = mock.patch.object(ann_index, 'MIN_TRAINING_SIZE', 20)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_updates_during_training_reach_the_new_lists(self):
+        self.index.train()
+        before = self.index.centroids
+        started, release = threading.Event(), threading.Event()
+        kmeans = ann_index.kmeans
+
+        def slow_kmeans(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return kmeans(*args, **kwargs)
+
+        with mock.patch.object(ann_index, 'kmeans', slow_kmeans):
+            thread = threading.Thread(target=self.index.train)
+            thread.start()
+            started.wait(5)
+
+            # Queries and updates carry on against the previous lists
+            self.assertFalse(self.index.needs_training())
+            self.assertIsNotNone(self.index.candidates(record(0, 600)))
+            self.index.update(1, record(1, 3000))
+            self.index.update(100, record(100, 3000))
+            self.index.remove(2)
+            self.assertIs(self.index.centroids, before)
+
+            release.set()
+            thread.join()
+
+        self.assertIsNot(self.index.centroids, before)
+        self.assertEqual(self.index.trained_size, 40)
+        members = set().union(*self.index._members)
+        self.assertEqual(members, set(range(1, 41)) - {2} | {100})
+        # Users moved while training sit in the list nearest their new vector
+        nearest = self.index.candidates(record(0, 3000), probes=1)
+        self.assertTrue({1, 100} <= nearest)
+
+    def test_failed_training_keeps_the_previous_lists(self):
+        self.index.train()
+        before = self.index.centroids
+        with mock.patch.object(ann_index, 'kmeans', side_effect=MemoryError):
+            with self.assertRaises(MemoryError):
+                self.index.train()
+        self.assertIs(self.index.centroids, before)
+        for user_id in range(41, 100):
+            self.index.update(user_id, record(user_id, 800))
+        self.assertTrue(self.index.needs_training())
+
+
+class BackgroundRetrainingTests(AppTestCase):
+    """Profile syncs in ANN mode leave k-means to the ann-training worker"""
+
+    def setUp(self):
+        patcher = mock.patch.object(ann_index, 'MIN_TRAINING_SIZE', 20)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with mock.patch.dict('os.environ', {'MATCH_RETRIEVAL': 'ann'}):
+            super().setUp()
+        for user_id in range(1, 31):
+            add_user(user_id, cleanliness_level=1 + user_id % 5)
+        roommatch.db.session.commit()
+
+    def test_sync_queues_the_training(self):
+        index = roommatch.ann_retrieval()
+        threads = []
+        train = AnnIndex.train
+
+        def record_thread(self):
+            threads.append(threading.current_thread().name)
+            train(self)
+
+        with mock.patch.object(AnnIndex, 'train', record_thread):
+            roommatch.sync_profile_snapshots()
+            roommatch.ann_trainer.join()
+        self.assertEqual(threads, ['ann-training'])
+        self.assertTrue(index.is_trained)
+        self.assertEqual(len(index), 30)
+
+        response = self.client.post('/api/matches/generate', headers=self.auth(1))
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point tests for Roommatch
+Drives asgi.application with a fake scope, receive and send: request
+bodies arriving in several messages (with or without a Content-Length),
+bodies the app never reads, and the 413 for a declared length over
+MAX_CONTENT_LENGTH, which is answered before any of the body is received
+Run with: python -m pytest test_asgi.py
+"""
+
+import asyncio
+import json
+import unittest
+
+from test_matching import add_user
+
+import asgi
+from app import User, db
+
+REGISTRATION = {'email': 'new@example.com', 'password': 'correct horse', 'first_name': 'New', 'last_name': 'User'}
+
+
+class FakeClient:
+    """Sends one ASGI HTTP request, its body split into messages, and collects the response"""
+
+    def __init__(self, method: str, path: str, chunks=(), headers=()):
+        self.scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'query_string': b'',
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+            'client': ('10.0.0.1', 50000), 'server': ('test', 80),
+        }
+        chunks = list(chunks) or [b'']
+        self.messages = [{'type': 'http.request', 'body': chunk, 'more_body': n < len(chunks) - 1}
+                         for n, chunk in enumerate(chunks)]
+        self.received = 0
+        self.sent = []
+
+    async def receive(self):
+        if self.received == len(self.messages):
+            return {'type': 'http.disconnect'}
+        self.received += 1
+        return self.messages[self.received - 1]
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def run(self) -> 'FakeClient':
+        asyncio.run(asgi.application(self.scope, self.receive, self.send))
+        return self
+
+    @property
+    def status(self) -> int:
+        return self.sent[0]['status']
+
+    def json(self):
+        return json.loads(b''.join(message.get('body', b'') for message in self.sent[1:]))
+
+
+class AsgiApplicationTests(unittest.TestCase):
+    """The Flask fallback reads request bodies as the app asks for them"""
+
+    def setUp(self):
+        self.context = asgi.app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        self.addCleanup(self.context.pop)
+        self.addCleanup(asgi.app.config.update, MAX_CONTENT_LENGTH=asgi.app.config['MAX_CONTENT_LENGTH'])
+
+    def post(self, path: str, body: bytes, parts: int = 3, length: bool = True) -> FakeClient:
+        size = -(-len(body) // parts)
+        headers = [('Content-Type', 'application/json')]
+        if length:
+            headers.append(('Content-Length', str(len(body))))
+        return FakeClient('POST', path, [body[n:n + size] for n in range(0, len(body), size)], headers).run()
+
+    def test_body_in_several_messages(self):
+        body = json.dumps(REGISTRATION).encode()
+        client = self.post('/api/auth/register', body, parts=4)
+        self.assertEqual(client.status, 201, client.json())
+        self.assertEqual(client.received, 4)
+        self.assertEqual(client.sent[-1], {'type': 'http.response.body', 'body': b''})
+        self.assertEqual(User.query.one().email, 'new@example.com')
+
+    def test_body_without_content_length(self):
+        add_user(1)
+        db.session.commit()
+        body = json.dumps({'email': 'user1@roommatch.com', 'password': 'wrong'}).encode()
+        client = self.post('/api/auth/login', body, length=False)
+        self.assertEqual((client.status, client.json()), (401, {'error': 'Invalid credentials'}))
+
+    def test_unread_body_is_never_received(self):
+        client = FakeClient('GET', '/api/health').run()
+        self.assertEqual((client.status, client.json()['status']), (200, 'healthy'))
+
+        client = FakeClient('POST', '/api/health', [b'x' * 100, b'y' * 100]).run()
+        self.assertEqual(client.status, 405)
+        self.assertEqual(client.received, 0)
+
+    def test_declared_length_over_the_limit_gets_413(self):
+        asgi.app.config['MAX_CONTENT_LENGTH'] = 64
+        client = self.post('/api/auth/register', json.dumps(REGISTRATION).encode())
+        self.assertEqual((client.status, client.json()), (413, {'error': 'Request body too large'}))
+        self.assertEqual(client.received, 0)
+        self.assertEqual(User.query.count(), 0)
+
+        # The WSGI app answers the same way
+        response = asgi.app.test_client().post('/api/auth/register', json=REGISTRATION)
+        self.assertEqual(response.status_code, 413)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Bulk import and export tests for Roommatch
+Posts NDJSON to /api/admin/users/import through the test client and checks
+that every invalid line is reported with its line number while the valid
+ones are still written
+Run with: python -m pytest test_bulk.py
+"""
+
+import json
+import unittest
+
+from test_matching import AppTestCase, add_user
+
+from app import User, UserProfile, db
+
+ADMIN = {'X-Admin-Token': 'admin-secret'}
+HASH = 'pbkdf2:sha256:600000$salt$' + '0' * 64
+
+
+def ndjson(*rows) -> str:
+    return ''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows)
+
+
+def row(email: str, **fields) -> dict:
+    return {'email': email, 'first_name': 'Bulk', 'last_name': 'User', 'password_hash': HASH, **fields}
+
+
+class ImportTests(AppTestCase):
+    """Each NDJSON line is validated on its own; bad lines never stop the import"""
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['ADMIN_API_TOKEN'] = 'admin-secret'
+
+    def post(self, body: str, query: str = '', headers: dict = ADMIN):
+        return self.client.post(f'/api/admin/users/import{query}', data=body, headers=headers,
+                                content_type='application/x-ndjson')
+
+    def run_import(self, body: str, query: str = '') -> dict:
+        response = self.post(body, query)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()
+
+    def test_invalid_lines_are_reported_by_line_number(self):
+        add_user(1)
+        db.session.commit()
+        summary = self.run_import(ndjson(
+            row('a@example.com', age=30, budget_min=500, budget_max=900),
+            '{"email": "broken"',
+            '["not", "an", "object"]',
+            row('b@example.com', favourite_colour='blue'),
+            {'email': 'c@example.com', 'first_name': 'No', 'password_hash': HASH},
+            row('d@example.com', age='thirty'),
+            row('e@example.com', cleanliness_level=6),
+            row('f@example.com', budget_min=900, budget_max=500),
+            row('g@example.com', smoking_preference='sometimes'),
+            row('h@example.com', password_hash='md5$abc'),
+            row('i@example.com', password='secret'),
+            row('j@example.com', interests=['music', 3]),
+            row('k@example.com', social_level=True),
+            row('a@example.com'),
+            row('user1@roommatch.com'),
+            '',
+            row('no-at-sign'),
+            row('l@example.com', first_name='x' * 500),
+        ))
+
+        errors = {error['line']: error['error'] for error in summary['errors']}
+        self.assertEqual((summary['imported'], summary['failed']), (1, 16))
+        self.assertFalse(summary['errors_truncated'])
+        self.assertTrue(errors[2].startswith('Invalid JSON'))
+        self.assertEqual(errors[3], 'Each line must be a JSON object')
+        self.assertEqual(errors[4], 'Unknown fields: favourite_colour')
+        self.assertEqual(errors[5], 'last_name is required')
+        self.assertEqual(errors[6], 'age must be of type int')
+        self.assertEqual(errors[7], 'cleanliness_level must be between 1 and 5')
+        self.assertEqual(errors[8], 'budget_min must not exceed budget_max')
+        self.assertEqual(errors[9], 'smoking_preference must be one of yes, no, maybe')
+        self.assertEqual(errors[10], 'password_hash must be a bcrypt, pbkdf2 or scrypt hash')
+        self.assertEqual(errors[11], 'Exactly one of password and password_hash is required')
+        self.assertEqual(errors[12], 'interests must be a list of strings')
+        self.assertEqual(errors[13], 'social_level must be of type int')
+        self.assertEqual(errors[14], 'Duplicate email in this import')
+        self.assertEqual(errors[15], 'User already exists')
+        # Line 16 is blank and skipped
+        self.assertEqual(errors[17], 'email is invalid')
+        self.assertEqual(errors[18], 'first_name is longer than 50 characters')
+        self.assertEqual(next(e for e in summary['errors'] if e['line'] == 4)['email'], 'b@example.com')
+
+        user = User.query.filter_by(email='a@example.com').one()
+        self.assertEqual((user.profile.age, user.profile.budget_max, user.profile.is_complete), (30, 900, False))
+
+    def test_rows_are_written_across_batches(self):
+        rows = [row(f'user{n}@example.com') for n in range(7)]
+        rows[3] = row('user3@example.com', age=-1)
+        complete = {'age': 25, 'gender': 'female', 'budget_min': 800, 'budget_max': 1200,
+                    'location_preference': 'Downtown', 'cleanliness_level': 4, 'social_level': 3,
+                    'noise_tolerance': 3}
+        rows[5] = row('user5@example.com', **complete)
+
+        summary = self.run_import(ndjson(*rows), '?batch_size=2')
+        self.assertEqual((summary['imported'], summary['failed']), (6, 1))
+        self.assertEqual(summary['errors'][0]['line'], 4)
+        self.assertEqual(User.query.count(), 6)
+        # Only rows with profile fields get a profile, complete when every required field is set
+        self.assertEqual([profile.is_complete for profile in UserProfile.query], [True])
+
+    def test_plain_passwords_are_hashed(self):
+        self.run_import(ndjson({'email': 'p@example.com', 'first_name': 'Plain', 'last_name': 'Text',
+                                'password': 'correct horse'}))
+        self.assertNotIn('correct horse', User.query.one().password_hash)
+
+        response = self.client.post('/api/auth/login', json={'email': 'p@example.com', 'password': 'correct horse'})
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+    def test_admin_token_and_batch_size(self):
+        body = ndjson(row('a@example.com'))
+        self.assertEqual(self.post(body, headers={}).status_code, 403)
+        self.assertEqual(self.post(body, headers={'X-Admin-Token': 'wrong'}).status_code, 403)
+        self.assertEqual(self.post(body, '?batch_size=0').status_code, 400)
+        self.assertEqual(User.query.count(), 0)
+
+    def test_export_round_trips(self):
+        self.run_import(ndjson(row('a@example.com', age=30, interests=['music']), row('b@example.com')))
+        response = self.client.get('/api/admin/users/export', headers=ADMIN)
+        self.assertEqual(response.status_code, 200)
+        documents = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        self.assertEqual([document['email'] for document in documents], ['a@example.com', 'b@example.com'])
+        self.assertEqual((documents[0]['age'], documents[0]['interests']), (30, ['music']))
+        self.assertNotIn('age', documents[1])
+        self.assertFalse(any('password_hash' in document for document in documents))
+
+
+if __name__ == '__main__':
+    unittest.main()
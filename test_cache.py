@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Response cache tests for Roommatch
+Checks the ETag / If-None-Match handling of GET /api/profile and
+/api/matches through the test client, and that writes make the cached
+responses of every affected user stale
+Two apps over one shared backend stand in for two workers over one Redis
+Run with: python -m pytest test_cache.py
+"""
+
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from flask_jwt_extended import create_access_token
+
+from test_matching import AppTestCase, add_user
+
+import app as roommatch
+from app import Match, db
+from cache import LocalRedis, MemoryCache, ResponseCache
+
+PROFILE = {
+    'age': 25, 'gender': 'female', 'budget_min': 800, 'budget_max': 1200, 'location_preference': 'Downtown',
+    'cleanliness_level': 4, 'social_level': 3, 'noise_tolerance': 3, 'pet_preference': 'no',
+    'smoking_preference': 'no',
+}
+
+
+class ConditionalGetTests(AppTestCase):
+    """Cached reads carry an ETag and revalidate with 304 until a write changes them"""
+
+    def setUp(self):
+        super().setUp()
+        for user_id in range(1, 4):
+            add_user(user_id)
+        db.session.add(Match(user1_id=1, user2_id=2, compatibility_score=0.8))
+        db.session.commit()
+
+    def get(self, path: str, user_id: int = 1, etag: str = None):
+        headers = self.auth(user_id)
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.client.get(path, headers=headers)
+
+    def test_if_none_match_gets_304(self):
+        for path in ('/api/profile', '/api/matches'):
+            response = self.get(path)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+
+            revalidated = self.get(path, etag=etag)
+            self.assertEqual((revalidated.status_code, revalidated.data), (304, b''))
+            self.assertEqual(revalidated.headers['ETag'], etag)
+            # A weakened ETag (e.g. by a compressing proxy) still matches
+            self.assertEqual(self.get(path, etag=f'W/{etag}').status_code, 304)
+            self.assertEqual(self.get(path, etag='"stale"').status_code, 200)
+
+    def test_etag_varies_by_endpoint_user_and_query(self):
+        etags = {
+            self.get('/api/profile').headers['ETag'],
+            self.get('/api/matches').headers['ETag'],
+            self.get('/api/matches?limit=1').headers['ETag'],
+            self.get('/api/matches', user_id=2).headers['ETag'],
+        }
+        self.assertEqual(len(etags), 4)
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        first = self.get('/api/profile')
+        with mock.patch.object(roommatch, 'render_profile') as render:
+            second = self.get('/api/profile')
+        render.assert_not_called()
+        self.assertEqual((second.status_code, second.data), (200, first.data))
+
+    def test_profile_write_invalidates_the_user_and_their_matches(self):
+        profile_etag = self.get('/api/profile').headers['ETag']
+        matches_etags = {user_id: self.get('/api/matches', user_id).headers['ETag'] for user_id in (1, 2, 3)}
+
+        response = self.client.put('/api/profile', json={**PROFILE, 'bio': 'Early riser'}, headers=self.auth(1))
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+        fresh = self.get('/api/profile', etag=profile_etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.get_json()['profile']['bio'], 'Early riser')
+        # User 2's match list embeds user 1's profile; user 3 has no match with user 1
+        self.assertEqual(self.get('/api/matches', 2, etag=matches_etags[2]).status_code, 200)
+        self.assertEqual(self.get('/api/matches', 3, etag=matches_etags[3]).status_code, 304)
+
+    def test_match_response_invalidates_both_users(self):
+        etags = {user_id: self.get('/api/matches', user_id).headers['ETag'] for user_id in (1, 2, 3)}
+
+        response = self.client.post('/api/matches/1/respond', json={'response': 'accept'}, headers=self.auth(2))
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+        for user_id in (1, 2):
+            fresh = self.get('/api/matches', user_id, etag=etags[user_id])
+            self.assertEqual(fresh.status_code, 200)
+            self.assertEqual(fresh.get_json()['matches'][0]['status'], 'accept')
+        self.assertEqual(self.get('/api/matches', 3, etag=etags[3]).status_code, 304)
+
+    def test_error_responses_are_not_cached(self):
+        self.assertEqual(self.get('/api/matches?limit=0').status_code, 400)
+        with mock.patch.object(roommatch, 'render_matches', wraps=roommatch.render_matches) as render:
+            response = self.get('/api/matches?limit=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response.headers)
+        render.assert_called_once()
+
+
+class SharedCacheTests(unittest.TestCase):
+    """Workers sharing one cache backend see each other's invalidations"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory.name}/roommatch.db',
+                  'RESPONSE_CACHE_URL': 'local-redis'}
+        # Every app gets a client of the same server, like workers pointed at one Redis
+        with mock.patch('cache.LocalRedis', return_value=LocalRedis()):
+            self.apps = [roommatch.create_app(config) for _ in range(2)]
+
+        with self.apps[0].app_context():
+            db.create_all()
+            add_user(1)
+            db.session.commit()
+            self.headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+        for app in self.apps:
+            self.addCleanup(self.dispose, app)
+
+    @staticmethod
+    def dispose(app):
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+    def test_write_through_one_app_changes_the_etag_seen_by_the_other(self):
+        writer, reader = (app.test_client() for app in self.apps)
+        etag = reader.get('/api/profile', headers=self.headers).headers['ETag']
+        self.assertEqual(reader.get('/api/profile', headers={**self.headers, 'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(writer.get('/api/profile', headers=self.headers).headers['ETag'], etag)
+
+        response = writer.put('/api/profile', json={**PROFILE, 'bio': 'Night owl'}, headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+        fresh = reader.get('/api/profile', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh.headers['ETag'], etag)
+        self.assertEqual(fresh.get_json()['profile']['bio'], 'Night owl')
+
+    def test_per_process_cache_is_refused_with_several_workers(self):
+        app = self.apps[0]
+        for url in ('memory', 'local-redis'):
+            app.config['RESPONSE_CACHE_URL'] = url
+            roommatch.check_worker_backends(app, 1)
+            with self.assertRaises(RuntimeError):
+                roommatch.check_worker_backends(app, 4)
+        app.config['RESPONSE_CACHE_URL'] = 'redis://cache:6379/0'
+        roommatch.check_worker_backends(app, 4)
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """Version tokens make every cached response of an invalidated user unreachable"""
+
+    def test_invalidate(self):
+        cache = ResponseCache(MemoryCache())
+        etags = [cache.etag('profile', 1), cache.etag('matches', 1), cache.etag('profile', 2)]
+        for etag in etags:
+            cache.put(etag, b'{}')
+        self.assertEqual(etags[0], cache.etag('profile', 1))
+
+        cache.invalidate(1)
+        self.assertNotEqual(cache.etag('profile', 1), etags[0])
+        self.assertNotEqual(cache.etag('matches', 1), etags[1])
+        self.assertEqual(cache.etag('profile', 2), etags[2])
+
+        cache.invalidate_all()
+        self.assertNotEqual(cache.etag('profile', 2), etags[2])
+
+    def test_get_or_build_caches_only_200(self):
+        cache = ResponseCache(MemoryCache())
+        build = mock.Mock(side_effect=[(b'error', 500), (b'ok', 200)])
+        self.assertEqual(cache.get_or_build('1-a', build), (b'error', 500))
+        self.assertEqual(cache.get_or_build('1-a', build), (b'ok', 200))
+        self.assertEqual(cache.get_or_build('1-a', build), (b'ok', 200))
+        self.assertEqual(build.call_count, 2)
+
+    def test_memory_cache_expiry_and_eviction(self):
+        backend = MemoryCache(max_entries=2)
+        backend.set('a', b'1')
+        backend.set('b', b'2', ttl=0.01)
+        backend.get_many(['a'])
+        backend.set('c', b'3')
+        # 'b' was the least recently used entry
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), [b'1', None, b'3'])
+
+        backend.set('d', b'4', ttl=0.01)
+        time.sleep(0.02)
+        self.assertEqual(backend.get_many(['d']), [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
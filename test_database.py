@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Database configuration tests for Roommatch
+Checks the engine options built from the pool settings, the recent-writes
+window, and that with a read replica the read-only endpoints query it while
+writes, and the reads of users who just wrote, stay on the primary. The
+primary and the replica are two SQLite files; Redis is an in-process fake
+Run with: python -m pytest test_database.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JOB_STORE_URL', 'memory')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from flask_jwt_extended import create_access_token
+
+import app as roommatch
+from app import UserProfile, db
+from cache import LocalRedis, MemoryCache
+from database import REPLICA_BIND, RecentWrites, async_url, engine_options
+from test_matching import add_user
+
+PROFILE = {
+    'age': 25, 'gender': 'female', 'budget_min': 800, 'budget_max': 1200, 'location_preference': 'Downtown',
+    'cleanliness_level': 4, 'social_level': 3, 'noise_tolerance': 3,
+}
+
+
+class EngineOptionsTests(unittest.TestCase):
+    """Pool settings apply to server databases only; statement timeouts to PostgreSQL only"""
+
+    def test_sqlite_gets_no_pool_options(self):
+        self.assertEqual(engine_options('sqlite:///roommatch.db', pool_size=20), {})
+        self.assertEqual(engine_options('sqlite://', statement_timeout_ms=500), {})
+
+    def test_postgres_pool_and_statement_timeout(self):
+        options = engine_options('postgresql://db/roommatch', pool_size=20, max_overflow=0, pool_timeout=5,
+                                 pool_recycle=600, pre_ping=False, statement_timeout_ms=2500)
+        self.assertEqual(options, {
+            'pool_size': 20, 'max_overflow': 0, 'pool_timeout': 5, 'pool_recycle': 600, 'pool_pre_ping': False,
+            'connect_args': {'options': '-c statement_timeout=2500'},
+        })
+        self.assertNotIn('connect_args', engine_options('postgresql://db/roommatch'))
+        self.assertNotIn('connect_args', engine_options('mysql://db/roommatch', statement_timeout_ms=2500))
+
+    def test_settings_come_from_the_config(self):
+        app = roommatch.create_app({'SQLALCHEMY_DATABASE_URI': 'postgresql://db/roommatch',
+                                    'DATABASE_POOL_SIZE': 3, 'DATABASE_STATEMENT_TIMEOUT': 100})
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        self.assertEqual((options['pool_size'], options['max_overflow']), (3, 10))
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=100'})
+
+    def test_async_url(self):
+        self.assertEqual(async_url('sqlite:///roommatch.db'), 'sqlite+aiosqlite:///roommatch.db')
+        self.assertEqual(async_url('postgresql://user:secret@db/roommatch'),
+                         'postgresql+asyncpg://user:secret@db/roommatch')
+        with self.assertRaises(ValueError):
+            async_url('mysql://db/roommatch')
+
+
+class RecentWritesTests(unittest.TestCase):
+    """Users stay recent for the lag window after a write, or all of them after mark_all"""
+
+    def test_window(self):
+        recent = RecentWrites(MemoryCache(), window=0.05)
+        recent.mark(1, 2)
+        self.assertEqual([recent.is_recent(user_id) for user_id in (1, 2, 3)], [True, True, False])
+        time.sleep(0.06)
+        self.assertFalse(recent.is_recent(1))
+
+        recent.mark_all()
+        self.assertTrue(recent.is_recent(3))
+
+
+class ReplicaRoutingTests(unittest.TestCase):
+    """Read-only endpoints read the replica, except for users who wrote within the lag window"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.config = {
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory.name}/primary.db',
+            'DATABASE_REPLICA_URL': f'sqlite:///{directory.name}/replica.db',
+            'RECENT_WRITES_URL': 'redis://cache:6379/0',
+        }
+        self.app = self.create_app()
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.dispose)
+
+        # The replica has user 1's profile as it was before the last change reached it
+        db.create_all()
+        db.metadata.create_all(db.engines[REPLICA_BIND])
+        add_user(1, bio='current')
+        db.session.commit()
+        with db.engines[REPLICA_BIND].begin() as connection:
+            for table in db.metadata.sorted_tables:
+                rows = [dict(row._mapping) for row in db.session.execute(table.select())]
+                if rows:
+                    connection.execute(table.insert(), rows)
+            connection.execute(UserProfile.__table__.update().values(bio='stale'))
+        self.headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+
+    def create_app(self, **config):
+        server = LocalRedis()
+        redis = types.SimpleNamespace(Redis=types.SimpleNamespace(from_url=lambda url: server))
+        with mock.patch.dict(sys.modules, {'redis': redis}):
+            return roommatch.create_app({**self.config, **config})
+
+    def dispose(self):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.context.pop()
+        # The replica bind's (empty) metadata is registered on the shared db object, which other apps reuse
+        db.metadatas.pop(REPLICA_BIND, None)
+
+    def bio(self) -> str:
+        response = self.client.get('/api/profile', headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()['profile']['bio']
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.bio(), 'stale')
+
+    def test_writer_reads_the_primary_within_the_lag_window(self):
+        response = self.client.put('/api/profile', json={**PROFILE, 'bio': 'updated'}, headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual(self.bio(), 'updated')
+
+        # The write went to the primary only
+        with db.engines[REPLICA_BIND].connect() as connection:
+            self.assertEqual(connection.execute(db.select(UserProfile.bio)).scalar(), 'stale')
+
+        # Once the window has passed, reads return to the replica
+        roommatch.recent_writes.backend.delete('recent-write:1')
+        roommatch.response_cache.invalidate(1)
+        self.assertEqual(self.bio(), 'stale')
+
+    def test_replica_needs_a_shared_recent_writes_store(self):
+        for url in ('memory', 'local-redis'):
+            with self.assertRaises(ValueError):
+                self.create_app(RECENT_WRITES_URL=url)
+
+
+if __name__ == '__main__':
+    unittest.main()
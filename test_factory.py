@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Application factory tests for Roommatch
+Checks that apps built by create_app keep their settings, databases and
+services apart, the flask schema commands, and that after_fork gives a
+forked worker its own connection pools, threads and process pools
+Run with: python -m pytest test_factory.py
+"""
+
+import os
+import select
+import signal
+import tempfile
+import time
+import unittest
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JOB_STORE_URL', 'memory')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from flask_jwt_extended import create_access_token
+
+import app as roommatch
+import migrations
+from app import User, db
+from test_matching import add_user
+
+# Services that own threads or process pools, rebuilt by after_fork
+WORKER_SERVICES = ('password_hasher', 'ann_trainer', 'match_worker', 'match_jobs', 'waitlist_buffer')
+# In-process caches, which a forked worker keeps
+CACHE_SERVICES = ('candidate_index', 'profile_store', 'response_cache', 'rate_limiter')
+
+
+class TwoAppsTests(unittest.TestCase):
+    """Two apps in one process share nothing but the extension objects"""
+
+    def setUp(self):
+        self.first = roommatch.create_app({'RATE_LIMIT_GENERATE': '1/minute'})
+        self.second = roommatch.create_app({'JWT_SECRET_KEY': 'another-secret'})
+        for flask_app in (self.first, self.second):
+            with flask_app.app_context():
+                db.create_all()
+
+    def test_settings_databases_and_services_are_separate(self):
+        self.assertNotEqual(self.first.config['RATE_LIMIT_GENERATE'], self.second.config['RATE_LIMIT_GENERATE'])
+        for name in WORKER_SERVICES + CACHE_SERVICES:
+            self.assertIsNot(getattr(self.first.extensions['roommatch'], name),
+                             getattr(self.second.extensions['roommatch'], name), name)
+
+        with self.first.app_context():
+            add_user(1)
+            db.session.commit()
+            roommatch.sync_profile_snapshots()
+            # The module's service proxies resolve to the current app's services
+            self.assertIs(roommatch.candidate_index._get_current_object(),
+                          self.first.extensions['roommatch'].candidate_index)
+            token = create_access_token(identity=1)
+        with self.second.app_context():
+            self.assertEqual(User.query.count(), 0)
+            self.assertNotIn(1, roommatch.candidate_index)
+
+        # Tokens are signed with each app's own key
+        headers = {'Authorization': f'Bearer {token}'}
+        self.assertEqual(self.first.test_client().get('/api/profile', headers=headers).status_code, 200)
+        self.assertEqual(self.second.test_client().get('/api/profile', headers=headers).status_code, 422)
+
+        # Rate limits are per app
+        self.assertEqual(self.first.test_client().post('/api/matches/generate', headers=headers).status_code, 200)
+        self.assertEqual(self.first.test_client().post('/api/matches/generate', headers=headers).status_code, 429)
+
+
+class SchemaCliTests(unittest.TestCase):
+    """flask schema upgrade brings a database to the latest version once; version reports it"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.app = roommatch.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory.name}/roommatch.db'})
+        self.runner = self.app.test_cli_runner()
+
+    def invoke(self, *args) -> str:
+        result = self.runner.invoke(args=['schema', *args])
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result.output
+
+    def test_upgrade_is_idempotent(self):
+        head = migrations.MIGRATIONS[-1][0]
+        self.assertEqual(self.invoke('version'), '0\n')
+
+        output = self.invoke('upgrade', '--to', '1')
+        self.assertEqual(output.splitlines(), [f'Applied 1: {migrations.MIGRATIONS[0][1]}', 'Schema at version 1'])
+
+        output = self.invoke('upgrade').splitlines()
+        self.assertEqual(output[-1], f'Schema at version {head}')
+        self.assertEqual([line.split(':')[0] for line in output[:-1]],
+                         [f'Applied {version}' for version, description, func in migrations.MIGRATIONS[1:]])
+
+        self.assertEqual(self.invoke('upgrade'), f'Schema at version {head}\n')
+        self.assertEqual(self.invoke('version'), f'{head}\n')
+        with self.app.app_context():
+            self.assertIn('user_profile', db.inspect(db.engine).get_table_names())
+
+
+class AfterForkTests(unittest.TestCase):
+    """after_fork replaces inherited pools and threads, and keeps the caches"""
+
+    def setUp(self):
+        self.app = roommatch.create_app()
+        self.services = self.app.extensions['roommatch']
+
+    def test_worker_services_are_rebuilt(self):
+        with self.app.app_context():
+            pools = {bind: engine.pool for bind, engine in db.engines.items()}
+        before = {name: getattr(self.services, name) for name in WORKER_SERVICES + CACHE_SERVICES}
+
+        roommatch.after_fork(self.app)
+
+        with self.app.app_context():
+            for bind, engine in db.engines.items():
+                self.assertIsNot(engine.pool, pools[bind])
+        for name in WORKER_SERVICES:
+            self.assertIsNot(getattr(self.services, name), before[name], name)
+        for name in CACHE_SERVICES:
+            self.assertIs(getattr(self.services, name), before[name], name)
+
+    def test_jobs_run_in_a_forked_worker(self):
+        # The parent's job threads exist (idle) when it forks, as in a gunicorn master
+        job = self.services.match_jobs.submit('test', 'parent', 1, lambda progress: 'parent')
+        self.assertEqual(self.wait(job['id']), 'parent')
+
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover - runs in the child
+            try:
+                os.close(read_end)
+                roommatch.after_fork(self.app)
+                job = self.services.match_jobs.submit('test', 'child', 1, lambda progress: 'child')
+                os.write(write_end, (self.wait(job['id']) or 'timeout').encode())
+            finally:
+                os._exit(0)
+
+        os.close(write_end)
+        try:
+            ready, _, _ = select.select([read_end], [], [], 10)
+            result = os.read(read_end, 100).decode() if ready else 'no answer'
+        finally:
+            os.close(read_end)
+            if not ready:
+                os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.assertEqual(result, 'child')
+
+    def wait(self, job_id: str, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.services.match_jobs.get(job_id)
+            if job['status'] == 'succeeded':
+                return job['result']
+            time.sleep(0.01)
+        return None
+
+
+if __name__ == '__main__':
+    unittest.main()
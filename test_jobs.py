@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Background match generation job tests for Roommatch
+Submits POST /api/matches/generate?async=1 through the test client and
+polls /api/matches/jobs/<id>, with generation held on an event where a
+test needs a job to stay in flight
+Run with: python -m pytest test_jobs.py
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from test_matching import AppTestCase, add_user
+
+import app as roommatch
+from app import db
+
+
+class GenerateJobTests(AppTestCase):
+    """Asynchronous generation runs as a pollable job, coalesced per user and k"""
+
+    def setUp(self):
+        super().setUp()
+        for user_id in range(1, 4):
+            add_user(user_id)
+        db.session.commit()
+
+    def submit(self, user_id: int = 1, query: str = '') -> dict:
+        response = self.client.post(f'/api/matches/generate?async=1{query}', headers=self.auth(user_id))
+        self.assertEqual(response.status_code, 202, response.get_json())
+        return response.get_json()
+
+    def wait(self, job: dict, user_id: int = 1) -> dict:
+        deadline = time.monotonic() + 10
+        while True:
+            response = self.client.get(job['status_url'], headers=self.auth(user_id))
+            self.assertEqual(response.status_code, 200, response.get_json())
+            status = response.get_json()
+            if status['status'] in ('succeeded', 'failed') or time.monotonic() > deadline:
+                return status
+            time.sleep(0.01)
+
+    def test_job_result_is_polled_by_its_owner_only(self):
+        job = self.submit()
+        self.assertEqual(job['status'], 'queued')
+
+        status = self.wait(job)
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['progress'], 1.0)
+        self.assertEqual(sorted(match['user_id'] for match in status['result']['new_matches']), [2, 3])
+
+        response = self.client.get(job['status_url'], headers=self.auth(2))
+        self.assertEqual(response.status_code, 404)
+
+    def test_failed_job_reports_its_error(self):
+        with mock.patch.object(roommatch, 'generate_matches_for_user', side_effect=ValueError('scoring failed')):
+            status = self.wait(self.submit())
+        self.assertEqual((status['status'], status['error']), ('failed', 'scoring failed'))
+
+    def test_jobs_in_flight_are_coalesced_per_k(self):
+        release = threading.Event()
+
+        def held(user_id, k=None, progress=None):
+            release.wait(10)
+            return {'user_id': user_id, 'k': k}
+
+        with mock.patch.object(roommatch, 'generate_matches_for_user', held):
+            first = self.submit(query='&k=5')
+            self.assertEqual(self.submit(query='&k=5')['job_id'], first['job_id'])
+            other_k = self.submit(query='&k=10')
+            all_matches = self.submit()
+            other_user = self.submit(user_id=2, query='&k=5')
+            self.assertEqual(len({job['job_id'] for job in (first, other_k, all_matches, other_user)}), 4)
+
+            release.set()
+            self.assertEqual(self.wait(other_k)['result'], {'user_id': 1, 'k': 10})
+            self.assertEqual(self.wait(all_matches)['result'], {'user_id': 1, 'k': None})
+
+        # Once the job has finished, the same request starts a new one
+        self.assertNotEqual(self.submit(query='&k=5')['job_id'], first['job_id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Match generation tests for Roommatch
+Runs the profile sync and the match paths against an in-memory SQLite
+database, each test in a fresh app
+Run with: python -m pytest test_matching.py
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JOB_STORE_URL', 'memory')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from flask_jwt_extended import create_access_token
+
+import app as roommatch
+from app import Match, User, UserProfile, db
+from candidate_index import CandidateIndex
+from profile_store import ProfileRecord, ProfileStore
+
+
+def add_user(user_id: int, **profile):
+    """Add a user with a complete profile (fields in profile override the defaults)"""
+    fields = {
+        'age': 25, 'gender': 'female', 'budget_min': 800, 'budget_max': 1200, 'location_preference': 'Downtown',
+        'cleanliness_level': 4, 'social_level': 3, 'noise_tolerance': 3, 'pet_preference': 'no',
+        'smoking_preference': 'no', 'is_complete': True,
+    }
+    fields.update(profile)
+    db.session.add(User(id=user_id, email=f'user{user_id}@roommatch.com', password_hash='x',
+                        first_name='Test', last_name=f'User{user_id}'))
+    db.session.add(UserProfile(user_id=user_id, **fields))
+
+
+class AppTestCase(unittest.TestCase):
+    """Fresh app, services and in-memory database per test"""
+
+    def setUp(self):
+        self.app = roommatch.create_app()
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def auth(self, user_id: int) -> dict:
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+
+class ProfileSyncTests(AppTestCase):
+    """Incremental profile syncs apply each profile version once"""
+
+    def applied_rows(self) -> int:
+        with mock.patch.object(CandidateIndex, 'sync', autospec=True, side_effect=CandidateIndex.sync) as sync:
+            roommatch.sync_profile_snapshots()
+        return sum(len(call.args[1]) for call in sync.call_args_list)
+
+    def test_rows_in_the_overlap_window_are_applied_once(self):
+        for user_id in range(1, 4):
+            add_user(user_id)
+        db.session.commit()
+
+        self.assertEqual(self.applied_rows(), 3)
+        self.assertEqual(self.applied_rows(), 0)
+
+        profile = UserProfile.query.filter_by(user_id=2).first()
+        profile.budget_max = 1500
+        db.session.commit()
+        self.assertEqual(self.applied_rows(), 1)
+        self.assertEqual(roommatch.profile_store.record(2).budget_max, 1500)
+
+    def test_late_commit_with_an_older_timestamp_is_picked_up(self):
+        add_user(1)
+        db.session.commit()
+        self.assertEqual(self.applied_rows(), 1)
+
+        # A transaction that stamped its row before the last sync, but committed after it
+        add_user(2, updated_at=datetime.utcnow() - timedelta(seconds=30))
+        db.session.commit()
+        self.assertEqual(self.applied_rows(), 1)
+        self.assertIn(2, roommatch.candidate_index)
+
+
+class ProfileStoreTests(unittest.TestCase):
+    """The columnar profile store keeps every categorical code it hands out"""
+
+    def test_pet_and_smoking_codes_past_int16(self):
+        store = ProfileStore()
+        store.upsert(ProfileRecord(user_id, location_preference=f'City {user_id}') for user_id in range(1, 33001))
+        store.upsert([ProfileRecord(40000, pet_preference='yes', smoking_preference='maybe',
+                                    location_preference='Downtown')])
+        record = store.record(40000)
+        self.assertEqual((record.pet_preference, record.smoking_preference), ('yes', 'maybe'))
+
+
+class AssignMatchesTests(AppTestCase):
+    """flask matches assign respects capacity, counting accepted matches"""
+
+    def assign(self, *args):
+        result = self.app.test_cli_runner().invoke(args=['matches', 'assign', '--workers', '1', *args])
+        self.assertEqual(result.exit_code, 0, result.output)
+        db.session.expire_all()
+
+    def pending_pairs(self):
+        return {(match.user1_id, match.user2_id) for match in Match.query.filter_by(status='pending')}
+
+    def test_accepted_match_uses_up_a_slot(self):
+        for user_id in range(1, 5):
+            add_user(user_id)
+        db.session.add(Match(user1_id=1, user2_id=2, compatibility_score=0.9))
+        db.session.commit()
+        response = self.client.post('/api/matches/1/respond', json={'response': 'accept'}, headers=self.auth(1))
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+        self.assign('--capacity', '1')
+        self.assertEqual(self.pending_pairs(), {(3, 4)})
+
+        # With a second slot, users 1 and 2 get one pending match each, on top of the accepted one
+        self.assign('--capacity', '2')
+        held = [user_id for match in Match.query for user_id in (match.user1_id, match.user2_id)]
+        self.assertEqual((held.count(1), held.count(2)), (2, 2))
+        self.assertLessEqual(max(held.count(3), held.count(4)), 2)
+        self.assertEqual(Match.query.filter_by(user1_id=1, user2_id=2).one().status, 'accept')
+
+
+class RefreshMatchesTests(AppTestCase):
+    """A scoring change to a profile re-scores that user's pending matches in the background"""
+
+    PROFILE = {
+        'age': 25, 'gender': 'female', 'budget_min': 800, 'budget_max': 1200, 'location_preference': 'Downtown',
+        'cleanliness_level': 4, 'social_level': 3, 'noise_tolerance': 3, 'pet_preference': 'no',
+        'smoking_preference': 'no',
+    }
+
+    def setUp(self):
+        super().setUp()
+        for user_id in (1, 2, 4, 5, 6):
+            add_user(user_id)
+        # User 3 can no longer match user 1; user 6 has no match with them yet
+        add_user(3, budget_min=2000, budget_max=3000, location_preference='Uptown', smoking_preference='yes')
+        for user1_id, user2_id, status in ((1, 2, 'pending'), (1, 3, 'pending'), (1, 4, 'accept'),
+                                           (1, 5, 'reject'), (2, 3, 'pending')):
+            db.session.add(Match(user1_id=user1_id, user2_id=user2_id, compatibility_score=0.123, status=status))
+        db.session.commit()
+
+    def update_profile(self, **changes):
+        response = self.client.put('/api/profile', json={**self.PROFILE, **changes}, headers=self.auth(1))
+        self.assertEqual(response.status_code, 200, response.get_json())
+        roommatch.match_worker.join()
+        db.session.expire_all()
+
+    def matches(self) -> dict:
+        return {(match.user1_id, match.user2_id): (match.status, match.compatibility_score) for match in Match.query}
+
+    def test_scoring_change_rescores_and_retires_pending_matches(self):
+        self.update_profile(noise_tolerance=4)
+        matches = self.matches()
+
+        status, score = matches[(1, 2)]
+        self.assertEqual(status, 'pending')
+        self.assertGreater(score, roommatch.MATCH_THRESHOLD)
+        self.assertNotIn((1, 3), matches)
+        # A new match with user 6, who had none with user 1
+        self.assertEqual(matches[(1, 6)][0], 'pending')
+        # Answered matches and other users' pairs are left as they were
+        self.assertEqual(matches[(1, 4)], ('accept', 0.123))
+        self.assertEqual(matches[(1, 5)], ('reject', 0.123))
+        self.assertEqual(matches[(2, 3)], ('pending', 0.123))
+
+    def test_incomplete_profile_removes_its_pending_matches(self):
+        self.update_profile(age=None)
+        self.assertEqual(self.matches(), {(1, 4): ('accept', 0.123), (1, 5): ('reject', 0.123),
+                                          (2, 3): ('pending', 0.123)})
+
+    def test_only_scoring_changes_enqueue_work(self):
+        worker = self.app.extensions['roommatch'].match_worker
+        with mock.patch.object(worker, 'submit') as submit:
+            self.update_profile(bio='Early riser', occupation='Nurse')
+            submit.assert_not_called()
+
+            self.update_profile(cleanliness_level=5)
+            submit.assert_called_once_with(('refresh', 1), roommatch.refresh_user_matches, 1)
+
+
+class GenerateTopKTests(AppTestCase):
+    """POST /api/matches/generate?k= stores only the k best new matches, best first"""
+
+    def setUp(self):
+        super().setUp()
+        add_user(1)
+        # Users 2 and 5 tie for the best score, then 3, then 4; user 6 is below the threshold
+        for user_id, cleanliness in ((2, 4), (3, 3), (4, 2), (5, 4)):
+            add_user(user_id, cleanliness_level=cleanliness)
+        add_user(6, budget_min=2000, budget_max=3000, location_preference='Uptown', smoking_preference='yes')
+        db.session.commit()
+
+    def generate(self, query: str = '') -> list:
+        response = self.client.post(f'/api/matches/generate{query}', headers=self.auth(1))
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()['new_matches']
+
+    def test_best_first_with_ties_by_user_id(self):
+        matches = self.generate('?k=3')
+        self.assertEqual([match['user_id'] for match in matches], [2, 5, 3])
+        scores = [match['compatibility_score'] for match in matches]
+        self.assertEqual(scores[0], scores[1])
+        self.assertGreater(scores[1], scores[2])
+
+        # Stored pairs are excluded from the next round, which picks up the rest above the threshold
+        self.assertEqual([match['user_id'] for match in self.generate('?k=3')], [4])
+        self.assertEqual(self.generate('?k=3'), [])
+        self.assertEqual(Match.query.count(), 4)
+
+    def test_k_larger_than_the_candidates_matches_a_full_generate(self):
+        by_k = {match['user_id']: match['compatibility_score'] for match in self.generate('?k=100')}
+        Match.query.delete()
+        db.session.commit()
+        full = {match['user_id']: match['compatibility_score'] for match in self.generate()}
+        self.assertEqual(by_k, full)
+        self.assertNotIn(6, full)
+
+    def test_invalid_k(self):
+        for query in ('?k=0', '?k=-1', '?k=many'):
+            response = self.client.post(f'/api/matches/generate{query}', headers=self.auth(1))
+            self.assertEqual(response.status_code, 400, query)
+
+
+class MatchListTests(AppTestCase):
+    """GET /api/matches pages through both sides of a user's pairs with a keyset cursor"""
+
+    def setUp(self):
+        super().setUp()
+        for user_id in range(1, 10):
+            add_user(user_id)
+        # User 5 is user2_id of the pairs with 1-4 and user1_id of those with 6-9, with tied scores across both
+        scores = {1: 0.7, 2: 0.9, 3: 0.8, 4: 0.9, 6: 0.8, 7: 0.9, 8: 0.65, 9: 0.8}
+        for other_id, score in scores.items():
+            db.session.add(Match(user1_id=min(5, other_id), user2_id=max(5, other_id), compatibility_score=score,
+                                 status='accept' if other_id in (3, 7) else 'pending'))
+        db.session.commit()
+        self.expected = [(match.compatibility_score, match.id, match.user2_id if match.user1_id == 5 else match.user1_id)
+                         for match in Match.query]
+        self.expected.sort(reverse=True)
+
+    def get(self, query: str = ''):
+        return self.client.get(f'/api/matches{query}', headers=self.auth(5))
+
+    def pages(self, query: str = '') -> list:
+        pages, cursor = [], ''
+        while True:
+            response = self.get(f'?limit=3{query}{cursor}')
+            self.assertEqual(response.status_code, 200, response.get_json())
+            page = response.get_json()
+            pages.append([match['user']['id'] for match in page['matches']])
+            if page['next_cursor'] is None:
+                return pages
+            cursor = f"&cursor={page['next_cursor']}"
+
+    def test_pages_cover_every_match_once_best_first(self):
+        self.assertEqual(self.pages(), [[7, 4, 2], [9, 6, 3], [1, 8]])
+        self.assertEqual(sum(self.pages(), []), [user_id for score, match_id, user_id in self.expected])
+
+        first = self.get().get_json()
+        self.assertEqual(len(first['matches']), 8)
+        self.assertIsNone(first['next_cursor'])
+
+    def test_status_filter_pages(self):
+        self.assertEqual(self.pages('&status=pending'), [[4, 2, 9], [6, 1, 8]])
+        self.assertEqual(self.pages('&status=accept'), [[7, 3]])
+
+    def test_interest_filter_pages(self):
+        # Only the other user's interests count, so user 5's own list never matches
+        for user_id, interests in ((2, ['hiking', 'cooking']), (3, ['hiking']), (4, ['gaming']), (5, ['hiking']),
+                                   (8, ['cooking', 'hiking'])):
+            UserProfile.query.filter_by(user_id=user_id).one().interests = interests
+        db.session.commit()
+
+        self.assertEqual(self.pages('&interest=hiking'), [[2, 3, 8]])
+        self.assertEqual(self.pages('&interest=hiking&status=pending'), [[2, 8]])
+        self.assertEqual(self.pages('&interest=hik'), [[]])
+
+    def test_exact_page_boundary_has_no_empty_last_page(self):
+        Match.query.filter(Match.compatibility_score < 0.8).delete()
+        db.session.commit()
+        self.assertEqual(self.pages(), [[7, 4, 2], [9, 6, 3]])
+
+    def test_invalid_limit_and_cursor(self):
+        for query in ('?limit=0', '?limit=-5', '?limit=201', '?cursor=not-a-cursor', '?cursor=WzFd'):
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.get_json())
+        self.assertEqual(self.get('?limit=200').status_code, 200)
+
+
+class RebuildMatchesTests(AppTestCase):
+    """flask matches rebuild keeps stored matches in step with the scores"""
+
+    def rebuild(self, *args):
+        result = self.app.test_cli_runner().invoke(args=['matches', 'rebuild', '--workers', '1', *args])
+        self.assertEqual(result.exit_code, 0, result.output)
+        db.session.expire_all()
+
+    def pairs(self, status='pending'):
+        return {(match.user1_id, match.user2_id) for match in Match.query.filter_by(status=status)}
+
+    def test_pending_matches_that_no_longer_qualify_are_removed(self):
+        for user_id in range(1, 5):
+            add_user(user_id, updated_at=datetime.utcnow() - timedelta(hours=1))
+        db.session.commit()
+        self.rebuild()
+        self.assertEqual(len(self.pairs()), 6)
+        Match.query.filter_by(user1_id=1, user2_id=4).one().status = 'accept'
+        db.session.commit()
+
+        # User 4 now smokes, which user 1 and user 2 will not live with
+        changed_at = datetime.utcnow() - timedelta(minutes=1)
+        for user_id in (1, 2):
+            UserProfile.query.filter_by(user_id=user_id).one().deal_breakers = ['smoking']
+        UserProfile.query.filter_by(user_id=4).one().smoking_preference = 'yes'
+        db.session.commit()
+
+        self.rebuild('--since', changed_at.strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEqual(self.pairs(), {(1, 2), (1, 3), (2, 3), (3, 4)})
+        self.assertEqual(self.pairs('accept'), {(1, 4)})
+
+        # Without --since every pair is in scope, including ones with a profile no longer complete
+        UserProfile.query.filter_by(user_id=3).one().is_complete = False
+        db.session.commit()
+        self.rebuild()
+        self.assertEqual(self.pairs(), {(1, 2)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Metrics tests for Roommatch
+Checks the Prometheus rendering of counters and histograms, that requests
+are recorded with their route, status and queries (including requests whose
+view raised), the scoring counters of match generation, and that
+/api/metrics needs METRICS_TOKEN
+Run with: python -m pytest test_metrics.py
+"""
+
+import unittest
+
+from test_matching import AppTestCase, add_user
+
+from app import db, metrics
+from metrics import Counter, Histogram
+
+
+def sample(metric, name: str, **labels) -> float:
+    """Current value of one series of a metric (0 if it has none yet)"""
+    return next((value for sample_name, sample_labels, value in metric.samples()
+                 if sample_name == name and sample_labels == labels), 0)
+
+
+class RenderTests(unittest.TestCase):
+    """Series render in the Prometheus text format"""
+
+    def test_counter(self):
+        counter = Counter('test_total', 'Things.', ('kind',))
+        counter.inc(kind='a')
+        counter.inc(2.5, kind='a')
+        counter.inc(kind='b"')
+        self.assertEqual(counter.render(), [
+            '# HELP test_total Things.', '# TYPE test_total counter',
+            'test_total{kind="a"} 3.5', 'test_total{kind="b\\""} 1',
+        ])
+        with self.assertRaises(ValueError):
+            counter.inc(other='a')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.render()[2:], [
+            'test_seconds_bucket{le="0.1"} 1', 'test_seconds_bucket{le="1.0"} 3', 'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 4.25', 'test_seconds_count 4',
+        ])
+
+
+class RequestMetricsTests(AppTestCase):
+    """Each request is recorded once, by route template and status"""
+
+    def setUp(self):
+        super().setUp()
+        self.app.add_url_rule('/api/test/fail', 'fail', self.fail_view)
+        add_user(1)
+        db.session.commit()
+
+    @staticmethod
+    def fail_view():
+        raise RuntimeError('view failed')
+
+    def requests(self, route: str, status: int, method: str = 'GET') -> float:
+        return sample(metrics.request_seconds, 'roommatch_http_request_duration_seconds_count',
+                      method=method, route=route, status=str(status))
+
+    def test_route_status_and_queries(self):
+        before = (self.requests('/api/health', 200), self.requests('/api/profile', 200),
+                  sample(metrics.request_queries, 'roommatch_http_request_queries_sum',
+                         method='GET', route='/api/profile'))
+        self.client.get('/api/health')
+        self.client.get('/api/profile', headers=self.auth(1))
+        self.client.get('/api/no-such-route')
+
+        self.assertEqual(self.requests('/api/health', 200), before[0] + 1)
+        self.assertEqual(self.requests('/api/profile', 200), before[1] + 1)
+        self.assertGreater(sample(metrics.request_queries, 'roommatch_http_request_queries_sum',
+                                  method='GET', route='/api/profile'), before[2])
+        self.assertGreaterEqual(self.requests('unmatched', 404), 1)
+
+    def test_unhandled_exceptions_count_as_500(self):
+        before = self.requests('/api/test/fail', 500)
+        self.assertEqual(self.client.get('/api/test/fail').status_code, 500)
+        self.assertEqual(self.requests('/api/test/fail', 500), before + 1)
+
+        # When exceptions propagate (debug and testing), no after_request hook runs, but teardown still does
+        self.app.config['PROPAGATE_EXCEPTIONS'] = True
+        with self.assertRaises(RuntimeError):
+            self.client.get('/api/test/fail')
+        self.assertEqual(self.requests('/api/test/fail', 500), before + 2)
+
+    def test_slow_requests_are_logged(self):
+        metrics.slow_request_ms = 1e-6
+        self.addCleanup(setattr, metrics, 'slow_request_ms', 0)
+        with self.assertLogs('metrics', 'WARNING') as logs:
+            self.client.get('/api/profile', headers=self.auth(1))
+        self.assertIn('Slow request GET /api/profile -> 200', logs.output[0])
+
+    def test_generation_counts_scored_candidates(self):
+        for user_id in range(2, 6):
+            add_user(user_id)
+        db.session.commit()
+        before = sample(metrics.candidates_scored, 'roommatch_candidates_scored_total')
+        response = self.client.post('/api/matches/generate', headers=self.auth(1))
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual(sample(metrics.candidates_scored, 'roommatch_candidates_scored_total'), before + 4)
+
+
+class MetricsEndpointTests(AppTestCase):
+    """/api/metrics is served only to scrapers sending METRICS_TOKEN"""
+
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+
+        self.app.config['METRICS_TOKEN'] = 'scrape-secret'
+        for header in ({}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'scrape-secret'}):
+            self.assertEqual(self.client.get('/api/metrics', headers=header).status_code, 403, header)
+
+        self.client.get('/api/health')
+        response = self.client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE roommatch_http_request_duration_seconds histogram', text)
+        self.assertIn('roommatch_http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}',
+                      text)
+
+
+if __name__ == '__main__':
+    unittest.main()
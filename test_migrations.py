@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Schema migration tests for Roommatch
+Upgrades a database with the original schema, where the profile lists were
+stored as plain text, and checks that the API serves the migrated rows;
+checks that password_hash is widened on PostgreSQL only
+Run with: python -m pytest test_migrations.py
+"""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JOB_STORE_URL', 'memory')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import String, create_engine, text
+
+import app as roommatch
+import migrations
+from app import User, db
+
+# The tables as the original app created them
+ORIGINAL_SCHEMA = (
+    'CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(128), '
+    'first_name VARCHAR(50), last_name VARCHAR(50), phone VARCHAR(20), is_verified BOOLEAN, '
+    'created_at DATETIME, updated_at DATETIME)',
+    'CREATE TABLE user_profile (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), '
+    'age INTEGER, gender VARCHAR(20), occupation VARCHAR(100), education VARCHAR(100), budget_min INTEGER, '
+    'budget_max INTEGER, location_preference VARCHAR(200), room_type VARCHAR(50), cleanliness_level INTEGER, '
+    'social_level INTEGER, noise_tolerance INTEGER, pet_preference VARCHAR(20), smoking_preference VARCHAR(20), '
+    'lifestyle_preferences TEXT, interests TEXT, deal_breakers TEXT, bio TEXT, is_complete BOOLEAN, '
+    'created_at DATETIME, updated_at DATETIME)',
+    'CREATE TABLE "match" (id INTEGER PRIMARY KEY, user1_id INTEGER NOT NULL, user2_id INTEGER NOT NULL, '
+    'compatibility_score FLOAT NOT NULL, match_reason TEXT, status VARCHAR(20), created_at DATETIME, '
+    'CONSTRAINT unique_match UNIQUE (user1_id, user2_id))',
+)
+
+# user_id -> (lifestyle_preferences, interests, deal_breakers) as the original app stored them
+STORED_LISTS = {
+    1: ('{"early_riser": true}', '["hiking", "cooking"]', '["smoking"]'),
+    2: ('', 'null', None),
+    3: ('tidy', 'hiking, cooking', '"pets"'),
+}
+
+
+class JsonProfileMigrationTests(unittest.TestCase):
+    """Migration 1 turns the text profile lists of an existing database into JSON"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        url = f'sqlite:///{directory.name}/roommatch.db'
+
+        engine = create_engine(url)
+        now = datetime.utcnow()
+        with engine.begin() as conn:
+            for statement in ORIGINAL_SCHEMA:
+                conn.execute(text(statement))
+            for user_id, (lifestyle, interests, deal_breakers) in STORED_LISTS.items():
+                conn.execute(text(
+                    'INSERT INTO user (id, email, password_hash, first_name, last_name, is_verified, created_at, '
+                    "updated_at) VALUES (:id, :email, 'x', 'Test', 'User', 0, :now, :now)"
+                ), {'id': user_id, 'email': f'user{user_id}@roommatch.com', 'now': now})
+                conn.execute(text(
+                    'INSERT INTO user_profile (user_id, age, gender, budget_min, budget_max, location_preference, '
+                    'cleanliness_level, social_level, noise_tolerance, lifestyle_preferences, interests, '
+                    'deal_breakers, is_complete, created_at, updated_at) VALUES (:id, 25, \'female\', 800, 1200, '
+                    "'Downtown', 4, 3, 3, :lifestyle, :interests, :deal_breakers, 1, :now, :now)"
+                ), {'id': user_id, 'lifestyle': lifestyle, 'interests': interests, 'deal_breakers': deal_breakers,
+                    'now': now})
+            conn.execute(text(
+                "INSERT INTO \"match\" (user1_id, user2_id, compatibility_score, status, created_at) VALUES "
+                "(1, 2, 0.8, 'pending', :now), (1, 3, 0.7, 'pending', :now)"
+            ), {'now': now})
+        engine.dispose()
+
+        self.app = roommatch.create_app({'SQLALCHEMY_DATABASE_URI': url})
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.dispose)
+
+    def dispose(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.context.pop()
+
+    def stored(self, user_id: int) -> tuple:
+        with db.engine.connect() as conn:
+            return tuple(conn.execute(text(
+                'SELECT lifestyle_preferences, interests, deal_breakers FROM user_profile WHERE user_id = :id'
+            ), {'id': user_id}).one())
+
+    def get(self, path: str, user_id: int) -> dict:
+        response = self.client.get(path, headers={'Authorization': f'Bearer {create_access_token(identity=user_id)}'})
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()
+
+    def test_text_lists_become_json(self):
+        applied = roommatch.upgrade_database()
+        self.assertEqual([version for version, description in applied],
+                         [version for version, description, func in migrations.MIGRATIONS])
+
+        self.assertEqual(self.stored(1), STORED_LISTS[1])
+        self.assertEqual(self.stored(2), (None, None, None))
+        # Text that is not JSON is kept as a string, in a list for the list columns
+        self.assertEqual(self.stored(3), ('"tidy"', '["hiking, cooking"]', '["pets"]'))
+
+        profiles = {user_id: self.get('/api/profile', user_id)['profile'] for user_id in STORED_LISTS}
+        self.assertEqual((profiles[1]['interests'], profiles[1]['deal_breakers']), (['hiking', 'cooking'], ['smoking']))
+        self.assertEqual(profiles[1]['lifestyle_preferences'], {'early_riser': True})
+        self.assertEqual((profiles[2]['interests'], profiles[2]['deal_breakers']), (None, None))
+        self.assertEqual((profiles[3]['interests'], profiles[3]['deal_breakers']), (['hiking, cooking'], ['pets']))
+
+        # The interest filter queries the migrated values
+        matches = self.get('/api/matches?interest=hiking', 2)['matches']
+        self.assertEqual([match['user']['id'] for match in matches], [1])
+
+        self.assertEqual(roommatch.upgrade_database(), [])
+        self.assertEqual(self.stored(3), ('"tidy"', '["hiking, cooking"]', '["pets"]'))
+
+
+class PasswordHashMigrationTests(unittest.TestCase):
+    """Migration 3 widens user.password_hash on PostgreSQL, where VARCHAR lengths are enforced"""
+
+    def run_migration(self, dialect: str, length: int) -> list:
+        conn = mock.Mock(dialect=SimpleNamespace(name=dialect))
+        inspector = mock.Mock()
+        inspector.get_table_names.return_value = ['user', 'user_profile', 'match']
+        inspector.get_columns.return_value = [{'name': 'id', 'type': mock.Mock(spec=[])},
+                                              {'name': 'password_hash', 'type': String(length)}]
+        with mock.patch.object(migrations, 'inspect', return_value=inspector):
+            migrations.widen_password_hash(conn)
+        return [str(call.args[0]) for call in conn.execute.call_args_list]
+
+    def test_postgres_column_is_widened_once(self):
+        self.assertEqual(self.run_migration('postgresql', 128),
+                         ['ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'])
+        self.assertEqual(self.run_migration('postgresql', 255), [])
+        self.assertEqual(self.run_migration('sqlite', 128), [])
+
+    def test_model_fits_the_longest_hashes(self):
+        self.assertEqual(User.__table__.c.password_hash.type.length, 255)
+        # A default scrypt hash, the longest supported format
+        self.assertLessEqual(len(roommatch.PasswordHasher('scrypt', workers=0).hash('correct horse')), 255)
+
+
+if __name__ == '__main__':
+    unittest.main()
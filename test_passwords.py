@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Password hashing tests for Roommatch
+Checks that needs_rehash reads the algorithm and cost of stored hashes, that
+a login upgrades an outdated hash, and that a login arriving while every
+hashing slot is taken gets a 503 instead of queueing
+Run with: python -m pytest test_passwords.py
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+from test_matching import AppTestCase, add_user
+
+import app as roommatch
+import passwords
+from app import User, db
+from passwords import HashingBusyError, PasswordHasher, _hash_password
+
+PASSWORD = 'correct horse'
+
+
+class NeedsRehashTests(unittest.TestCase):
+    """Hashes made with another algorithm or cost need upgrading"""
+
+    def test_bcrypt_cost_is_read_from_the_hash(self):
+        hasher = PasswordHasher('bcrypt', cost=5, workers=0)
+        current, _ = _hash_password(PASSWORD, 'bcrypt', 5)
+        older, _ = _hash_password(PASSWORD, 'bcrypt', 4)
+        self.assertTrue(current.startswith('$2b$05$'))
+        self.assertFalse(hasher.needs_rehash(current))
+        self.assertTrue(hasher.needs_rehash(older))
+        # A two-digit cost is compared whole, not by its first digit
+        self.assertTrue(PasswordHasher('bcrypt', cost=10, workers=0).needs_rehash(current.replace('$05$', '$01$')))
+        self.assertTrue(hasher.needs_rehash(_hash_password(PASSWORD, 'pbkdf2', 1000)[0]))
+
+    def test_werkzeug_methods(self):
+        hasher = PasswordHasher('pbkdf2', cost=1000, workers=0)
+        self.assertFalse(hasher.needs_rehash(hasher.hash(PASSWORD)))
+        self.assertTrue(hasher.needs_rehash(_hash_password(PASSWORD, 'pbkdf2', 2000)[0]))
+        self.assertTrue(hasher.needs_rehash(_hash_password(PASSWORD, 'bcrypt', 4)[0]))
+        self.assertTrue(PasswordHasher('scrypt', cost=1024, workers=0).needs_rehash(hasher.hash(PASSWORD)))
+
+    def test_busy_hasher_raises(self):
+        hasher = PasswordHasher('bcrypt', cost=4, workers=0, max_pending=1, queue_timeout=0.01)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_verify(*args):
+            started.set()
+            release.wait(5)
+            return True, 0.0
+
+        with mock.patch.object(passwords, '_verify_password', slow_verify):
+            thread = threading.Thread(target=hasher.verify, args=(PASSWORD, 'x'))
+            thread.start()
+            started.wait(5)
+            with self.assertRaises(HashingBusyError):
+                hasher.hash(PASSWORD)
+            release.set()
+            thread.join()
+        self.assertTrue(hasher.verify(PASSWORD, hasher.hash(PASSWORD)))
+
+
+class LoginHashingTests(AppTestCase):
+    """Logins upgrade outdated hashes, and are refused with 503 while hashing is at capacity"""
+
+    def setUp(self):
+        self.env = mock.patch.dict('os.environ', {'PASSWORD_HASH_COST': '5', 'PASSWORD_HASH_MAX_PENDING': '1'})
+        self.env.start()
+        self.addCleanup(self.env.stop)
+        super().setUp()
+        roommatch.password_hasher.queue_timeout = 0.01
+        add_user(1)
+        db.session.commit()
+
+    def set_hash(self, hashed: str):
+        db.session.get(User, 1).password_hash = hashed
+        db.session.commit()
+
+    def stored_hash(self) -> str:
+        db.session.expire_all()
+        return db.session.get(User, 1).password_hash
+
+    def login(self, password: str = PASSWORD):
+        return self.client.post('/api/auth/login', json={'email': 'user1@roommatch.com', 'password': password})
+
+    def test_outdated_hash_is_upgraded(self):
+        for algorithm, cost in (('bcrypt', 4), ('pbkdf2', 1000)):
+            self.set_hash(_hash_password(PASSWORD, algorithm, cost)[0])
+            self.assertEqual(self.login().status_code, 200)
+            upgraded = self.stored_hash()
+            self.assertTrue(upgraded.startswith('$2b$05$'), upgraded)
+
+            # A current hash is left alone
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(self.stored_hash(), upgraded)
+
+    def test_failed_login_keeps_the_hash(self):
+        outdated = _hash_password(PASSWORD, 'bcrypt', 4)[0]
+        self.set_hash(outdated)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.stored_hash(), outdated)
+
+    def test_login_while_hashing_is_at_capacity(self):
+        self.set_hash(_hash_password(PASSWORD, 'bcrypt', 5)[0])
+        started, release = threading.Event(), threading.Event()
+        verify = passwords._verify_password
+
+        def slow_verify(*args):
+            started.set()
+            release.wait(5)
+            return verify(*args)
+
+        hasher = roommatch.password_hasher._get_current_object()
+        with mock.patch.object(passwords, '_verify_password', slow_verify):
+            thread = threading.Thread(target=hasher.verify, args=(PASSWORD, self.stored_hash()))
+            thread.start()
+            started.wait(5)
+            response = self.login()
+            release.set()
+            thread.join()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertIn('capacity', response.get_json()['error'])
+        self.assertEqual(self.login().status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Query plan regression tests for Roommatch
+Runs the match and profile query paths against SQLite and checks with
+EXPLAIN QUERY PLAN that they are served by indexes, not full table scans
+Run with: python -m pytest test_query_plans.py
+"""
+
+import os
+import re
+import unittest
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JOB_STORE_URL', 'memory')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from sqlalchemy import create_engine, event, text
+
+import app as roommatch
+import migrations
+from app import Match, User, UserProfile, db
+
+app = roommatch.create_app()
+
+# EXPLAIN QUERY PLAN detail of a full table scan (older SQLite versions say "SCAN TABLE")
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(match|user_profile)$')
+
+
+def query_plans(func):
+    """Run func and return the EXPLAIN QUERY PLAN details of every SELECT it issued"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    connection = db.session.connection()
+    return [
+        [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+        for statement, parameters in statements
+    ]
+
+
+class QueryPlanTests(unittest.TestCase):
+    """The match and profile query paths use their indexes"""
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        for user_id in range(1, 5):
+            db.session.add(User(id=user_id, email=f'user{user_id}@roommatch.com', password_hash='x',
+                                first_name='Test', last_name=f'User{user_id}'))
+            db.session.add(UserProfile(user_id=user_id, age=25, gender='female', budget_min=800, budget_max=1200,
+                                       location_preference='Downtown', cleanliness_level=4, social_level=3,
+                                       noise_tolerance=3, is_complete=True))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def assertIndexed(self, plans, *indexes):
+        details = [detail for plan in plans for detail in plan]
+        self.assertTrue(plans, 'no SELECT was issued')
+        for detail in details:
+            self.assertIsNone(FULL_SCAN.match(detail), f'full table scan: {details}')
+        for index in indexes:
+            self.assertTrue(any(index in detail for detail in details), f'{index} not used: {details}')
+
+    def test_match_list_walks_an_index_per_side(self):
+        plans = query_plans(lambda: db.session.execute(roommatch.match_list_query(1, 51)).all())
+        self.assertIndexed(plans, 'ix_match_user1_score', 'ix_match_user2_score', 'ix_user_profile_user_id')
+        self.assertIn('MERGE (UNION ALL)', plans[0])
+
+    def test_match_list_cursor_seeks_within_the_index(self):
+        plans = query_plans(lambda: db.session.execute(
+            roommatch.match_list_query(1, 51, status='pending', cursor=(0.75, 10))
+        ).all())
+        self.assertIndexed(plans, 'ix_match_user1_score (user1_id=? AND compatibility_score<?)',
+                           'ix_match_user2_score (user2_id=? AND compatibility_score<?)')
+
+    def test_user_matches_and_counterparts_use_indexes(self):
+        self.assertIndexed(query_plans(lambda: roommatch.user_matches_query(1).all()), 'ix_match_user2_score')
+        self.assertIndexed(query_plans(lambda: roommatch.get_matched_user_ids(1)), 'ix_match_user2_score')
+
+    def test_profile_lookup_uses_user_id_index(self):
+        plans = query_plans(lambda: UserProfile.query.filter_by(user_id=1).first())
+        self.assertIndexed(plans, 'ix_user_profile_user_id')
+
+    def test_complete_profile_scan_uses_partial_index(self):
+        plans = query_plans(
+            lambda: db.session.query(UserProfile.user_id).filter(UserProfile.is_complete == True).all()
+        )
+        self.assertIndexed(plans, 'ix_user_profile_complete')
+
+    def test_profile_sync_uses_updated_at_index(self):
+        roommatch.sync_profile_snapshots()
+        self.assertIndexed(query_plans(roommatch.sync_profile_snapshots), 'ix_user_profile_updated_at')
+
+    def test_pair_probe_is_a_single_unique_index_search(self):
+        user1_id, user2_id = roommatch.canonical_pair(3, 1)
+        plans = query_plans(lambda: Match.query.filter_by(user1_id=user1_id, user2_id=user2_id).first())
+        self.assertIndexed(plans, 'sqlite_autoindex_match_1 (user1_id=? AND user2_id=?)')
+
+    def test_matches_are_stored_lower_user_id_first(self):
+        roommatch.generate_matches_for_user(3)
+        pairs = db.session.query(Match.user1_id, Match.user2_id).all()
+        self.assertTrue(pairs)
+        self.assertTrue(all(user1_id < user2_id for user1_id, user2_id in pairs))
+
+        # The reverse pair hits the same unique key, so it is skipped rather than duplicated
+        user1_id, user2_id = pairs[0]
+        db.session.execute(roommatch.insert_ignoring_conflicts(Match), [{
+            'user1_id': user1_id, 'user2_id': user2_id, 'compatibility_score': 1.0, 'match_reason': 'reverse'
+        }])
+        self.assertEqual(Match.query.count(), len(pairs))
+
+
+class MatchPairMigrationTests(unittest.TestCase):
+    """Migration 2 canonicalizes stored pairs and adds the indexes to an existing database"""
+
+    def test_upgrade_from_original_schema(self):
+        engine = create_engine('sqlite://')
+        with engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE "match" (id INTEGER PRIMARY KEY, user1_id INTEGER NOT NULL, user2_id INTEGER NOT NULL, '
+                'compatibility_score FLOAT NOT NULL, match_reason TEXT, status VARCHAR(20), created_at DATETIME, '
+                'CONSTRAINT unique_match UNIQUE (user1_id, user2_id))'
+            ))
+            conn.execute(text(
+                'CREATE TABLE user_profile (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+                'lifestyle_preferences TEXT, interests TEXT, deal_breakers TEXT, is_complete BOOLEAN, updated_at DATETIME)'
+            ))
+            conn.execute(text(
+                "INSERT INTO \"match\" (id, user1_id, user2_id, compatibility_score, status, created_at) VALUES "
+                "(1, 1, 2, 0.7, 'pending', :now), (2, 2, 1, 0.7, 'accept', :now), "
+                "(3, 4, 3, 0.8, 'pending', :now), (4, 5, 6, 0.9, 'pending', :now)"
+            ), {'now': datetime.utcnow()})
+
+        migrations.upgrade(engine)
+
+        with engine.connect() as conn:
+            rows = conn.execute(text('SELECT id, user1_id, user2_id, status FROM "match" ORDER BY id')).all()
+            indexes = {row[1] for row in conn.execute(text("SELECT type, name FROM sqlite_master WHERE type = 'index'"))}
+        # The answered copy of 1-2 survives, 4-3 is flipped, 5-6 is untouched
+        self.assertEqual([tuple(row) for row in rows], [(2, 1, 2, 'accept'), (3, 3, 4, 'pending'), (4, 5, 6, 'pending')])
+        self.assertTrue({'ix_match_user1_score', 'ix_match_user2_score', 'ix_user_profile_user_id',
+                         'ix_user_profile_updated_at', 'ix_user_profile_complete'} <= indexes)
+        self.assertEqual(migrations.upgrade(engine), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Rate limiting and request coalescing tests for Roommatch
+Checks the token buckets on their own and through the test client (429
+with Retry-After once a client's burst is spent), and that SingleFlight
+callers with the same key share one run
+Run with: python -m pytest test_ratelimit.py
+"""
+
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from test_matching import AppTestCase, add_user
+
+import app as roommatch
+from app import db
+from ratelimit import MemoryBuckets, RateLimit, RateLimiter, SingleFlight
+
+
+class Clock:
+    """Stand-in for time.monotonic that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RateLimitTests(unittest.TestCase):
+    """Limits parse from 'N/period' and buckets refill at capacity per period"""
+
+    def test_parse(self):
+        limit = RateLimit.parse('10/minute')
+        self.assertEqual((limit.capacity, limit.period), (10, 60))
+        limit = RateLimit.parse(' 3 / 5 hours ')
+        self.assertEqual((limit.capacity, limit.period), (3, 18000))
+        self.assertIsNone(RateLimit.parse(''))
+        self.assertIsNone(RateLimit.parse('0'))
+        for text in ('ten/minute', '10/fortnight', '0/minute', '10'):
+            with self.assertRaises(ValueError):
+                RateLimit.parse(text)
+
+    def test_burst_then_refill(self):
+        clock = Clock()
+        buckets = MemoryBuckets()
+        limit = RateLimit.parse('3/minute')
+        with mock.patch('ratelimit.time.monotonic', clock):
+            self.assertEqual([buckets.take('a', limit) for _ in range(3)], [0.0, 0.0, 0.0])
+            self.assertAlmostEqual(buckets.take('a', limit), 20.0)
+            # Other keys have their own bucket
+            self.assertEqual(buckets.take('b', limit), 0.0)
+
+            clock.now += 10
+            self.assertAlmostEqual(buckets.take('a', limit), 10.0)
+            clock.now += 10
+            self.assertEqual(buckets.take('a', limit), 0.0)
+
+            # Refills stop at the capacity
+            clock.now += 3600
+            self.assertEqual([buckets.take('a', limit) for _ in range(3)], [0.0, 0.0, 0.0])
+            self.assertGreater(buckets.take('a', limit), 0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        buckets = MemoryBuckets(max_keys=2)
+        limit = RateLimit.parse('1/hour')
+        for key in ('a', 'b', 'c'):
+            buckets.take(key, limit)
+        # 'a' was dropped, so it starts over with a full bucket
+        self.assertEqual(buckets.take('a', limit), 0.0)
+        self.assertGreater(buckets.take('c', limit), 0)
+
+    def test_limiter(self):
+        limiter = RateLimiter(MemoryBuckets(), {'login': RateLimit.parse('1/minute'), 'open': None})
+        self.assertEqual(limiter.check('login', 'ip:1'), 0.0)
+        self.assertGreater(limiter.check('login', 'ip:1'), 0)
+        self.assertEqual(limiter.check('open', 'ip:1'), 0.0)
+        self.assertEqual(limiter.check('unknown', 'ip:1'), 0.0)
+        self.assertEqual([RateLimiter.retry_after(wait) for wait in (0.2, 1.0, 11.5)], ['1', '1', '12'])
+
+        # A failing store lets requests through
+        broken = mock.Mock()
+        broken.take.side_effect = ConnectionError('store unavailable')
+        with self.assertLogs('ratelimit', 'ERROR'):
+            self.assertEqual(RateLimiter(broken, {'login': RateLimit.parse('1/minute')}).check('login', 'ip:1'), 0.0)
+
+
+class RateLimitedRouteTests(AppTestCase):
+    """Limited routes answer 429 with Retry-After per client"""
+
+    def setUp(self):
+        with mock.patch.dict(os.environ, {'RATE_LIMIT_GENERATE': '2/minute', 'RATE_LIMIT_LOGIN': '3/minute'}):
+            super().setUp()
+        for user_id in range(1, 3):
+            add_user(user_id)
+        db.session.commit()
+
+    def test_generate_is_limited_per_user(self):
+        statuses = [self.client.post('/api/matches/generate', headers=self.auth(1)).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+        response = self.client.post('/api/matches/generate', headers=self.auth(1))
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response.headers['Retry-After']) <= 30)
+        self.assertIn('error', response.get_json())
+
+        self.assertEqual(self.client.post('/api/matches/generate', headers=self.auth(2)).status_code, 200)
+
+    def login(self, email: str, **options):
+        return self.client.post('/api/auth/login', json={'email': email, 'password': 'wrong'}, **options).status_code
+
+    def test_login_is_limited_per_email_and_address(self):
+        # The email is normalized, so changing its case or padding does not reset the bucket
+        statuses = [self.login(email) for email in ('user1@roommatch.com', 'User1@Roommatch.com ',
+                                                    'user1@roommatch.com', 'USER1@roommatch.com')]
+        self.assertEqual(statuses[3], 429)
+        self.assertNotIn(429, statuses[:3])
+
+        self.assertNotEqual(self.login('user2@roommatch.com'), 429)
+        self.assertNotEqual(self.login('user1@roommatch.com', environ_base={'REMOTE_ADDR': '10.0.0.2'}), 429)
+
+    def test_forwarded_addresses_need_proxy_fix(self):
+        def forwarded(address: str) -> dict:
+            return {'headers': {'X-Forwarded-For': address}}
+
+        for _ in range(3):
+            self.login('user1@roommatch.com', **forwarded('203.0.113.1'))
+        # Without PROXY_FIX_X_FOR the header is ignored: every request comes from the proxy
+        self.assertEqual(self.login('user1@roommatch.com', **forwarded('203.0.113.2')), 429)
+
+        with mock.patch.dict(os.environ, {'RATE_LIMIT_LOGIN': '3/minute', 'PROXY_FIX_X_FOR': '1'}):
+            app = roommatch.create_app()
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        statuses = [client.post('/api/auth/login', json={'email': 'user1@roommatch.com', 'password': 'wrong'},
+                                headers={'X-Forwarded-For': '198.51.100.7, 203.0.113.1'}).status_code
+                    for _ in range(4)]
+        self.assertEqual(statuses[3], 429)
+        other = client.post('/api/auth/login', json={'email': 'user1@roommatch.com', 'password': 'wrong'},
+                            headers={'X-Forwarded-For': '203.0.113.2'})
+        self.assertNotEqual(other.status_code, 429)
+
+    def test_per_process_limits_warn_with_several_workers(self):
+        self.app.config['RESPONSE_CACHE_URL'] = 'redis://cache:6379/0'
+        with self.assertLogs('app', 'WARNING') as logs:
+            roommatch.check_worker_backends(self.app, 4)
+        self.assertIn('4 times', logs.output[0])
+        with self.assertNoLogs('app', 'WARNING'):
+            roommatch.check_worker_backends(self.app, 1)
+
+    def test_concurrent_identical_generates_share_one_run(self):
+        release = threading.Event()
+        calls = []
+
+        def held(user_id, k=None, progress=None):
+            calls.append((user_id, k))
+            release.wait(10)
+            return {'new_matches': [], 'k': k}
+
+        headers = self.auth(1)
+        responses = []
+
+        def post():
+            responses.append(self.client.post('/api/matches/generate?k=5', headers=headers))
+
+        with mock.patch.object(roommatch, 'generate_matches_for_user', held):
+            threads = [threading.Thread(target=post) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            # Let the second request reach the in-flight call before the first finishes
+            time.sleep(0.2)
+            release.set()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(calls, [(1, 5)])
+        self.assertEqual([(response.status_code, response.get_json()) for response in responses],
+                         [(200, {'new_matches': [], 'k': 5})] * 2)
+
+
+class SingleFlightTests(unittest.TestCase):
+    """Concurrent callers of one key share a single run and its outcome"""
+
+    def run_concurrently(self, flight: SingleFlight, key, function, callers: int = 4) -> tuple:
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(flight.do(key, function))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def test_callers_share_the_result(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(10)
+            return 'result'
+
+        threads, outcomes = self.run_concurrently(flight, 'key', slow)
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes), [('result', False)] + [('result', True)] * 3)
+        # The next call, once nothing is in flight, runs again
+        self.assertEqual(flight.do('key', lambda: 'again'), ('again', False))
+
+    def test_callers_share_the_error(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing():
+            release.wait(10)
+            raise ValueError('scan failed')
+
+        threads, outcomes = self.run_concurrently(flight, 'key', failing, callers=3)
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(outcomes), 3)
+        self.assertEqual(len({id(error) for error in outcomes}), 1)
+        self.assertIsInstance(outcomes[0], ValueError)
+
+    def test_different_keys_run_separately(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        threads, outcomes = self.run_concurrently(flight, ('generate', 1, 5), lambda: release.wait(10) and 'a', callers=1)
+        time.sleep(0.1)
+        # Runs while the first key is still in flight
+        self.assertEqual(flight.do(('generate', 1, None), lambda: 'b'), ('b', False))
+        release.set()
+        threads[0].join(10)
+        self.assertEqual(outcomes, [('a', False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
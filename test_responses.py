@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Response encoding tests for Roommatch
+Checks that the orjson and json module backends of FastJSONProvider write
+the same documents, and the gzip/Brotli negotiation of the compressor: the
+encoding chosen from Accept-Encoding, the minimum size, and Vary on
+compressed and 304 responses
+Run with: python -m pytest test_responses.py
+"""
+
+import contextlib
+import decimal
+import gzip
+import json
+import types
+import unittest
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+from flask import Flask, jsonify
+
+from test_matching import AppTestCase, add_user
+
+import compression
+import serializers
+from app import db
+from compression import Compressor
+
+DOCUMENT = {
+    'naive': datetime(2024, 1, 2, 3, 4, 5, 123456), 'whole_seconds': datetime(2024, 1, 2, 3, 4, 5),
+    'utc': datetime(2024, 1, 2, tzinfo=timezone.utc),
+    'offset': datetime(2024, 1, 2, tzinfo=timezone(timedelta(hours=-5))),
+    'day': date(2024, 2, 29), 'id': uuid.UUID(int=5), 'amount': decimal.Decimal('1.10'),
+    'nested': [{'z': 1, 'a': [1.5, None, True, 'café']}], 'by_id': {2: 'b', 1: 'a'}, 'huge': 2 ** 70,
+}
+EXPECTED = {
+    'naive': '2024-01-02T03:04:05.123456', 'whole_seconds': '2024-01-02T03:04:05',
+    'utc': '2024-01-02T00:00:00+00:00', 'offset': '2024-01-02T00:00:00-05:00',
+    'day': '2024-02-29', 'id': '00000000-0000-0000-0000-000000000005', 'amount': '1.10',
+    'nested': [{'a': [1.5, None, True, 'café'], 'z': 1}], 'by_id': {'1': 'a', '2': 'b'}, 'huge': 2 ** 70,
+}
+
+
+class SerializerTests(unittest.TestCase):
+    """Both JSON backends write the same bytes for the same document"""
+
+    def without_orjson(self):
+        return mock.patch.object(serializers, 'orjson', None)
+
+    def test_backends_agree(self):
+        fast = serializers.dumps_bytes(DOCUMENT)
+        with self.without_orjson():
+            fallback = serializers.dumps_bytes(DOCUMENT)
+        self.assertEqual(json.loads(fast), EXPECTED)
+        self.assertEqual(fast, fallback)
+        self.assertEqual(fast, json.dumps(EXPECTED, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode())
+
+    def test_unencodable_values_raise(self):
+        for backend in (contextlib.nullcontext(), self.without_orjson()):
+            with backend, self.assertRaises(TypeError):
+                serializers.dumps_bytes({'value': object()})
+
+    def test_provider(self):
+        app = Flask(__name__)
+        app.json = serializers.FastJSONProvider(app)
+        with app.test_request_context():
+            fast = jsonify(DOCUMENT).get_data()
+            with self.without_orjson():
+                self.assertEqual(jsonify(DOCUMENT).get_data(), fast)
+                self.assertEqual(app.json.loads(fast), EXPECTED)
+            self.assertEqual(app.json.loads(fast), EXPECTED)
+            # Options only the json module has still apply
+            self.assertEqual(app.json.dumps({'b': 1, 'a': DOCUMENT['day']}, indent=1),
+                             '{\n "b": 1,\n "a": "2024-02-29"\n}')
+
+
+class EncodingNegotiationTests(unittest.TestCase):
+    """The best accepted encoding wins, Brotli on ties; q=0 refuses one"""
+
+    def choose(self, accept_encoding: str, brotli: bool = False):
+        fake = types.SimpleNamespace(compress=lambda body, quality: body) if brotli else None
+        with mock.patch.object(compression, 'brotli', fake):
+            compressor = Compressor()
+        with Flask(__name__).test_request_context(headers={'Accept-Encoding': accept_encoding}):
+            return compressor.choose_encoding()
+
+    def test_gzip_only(self):
+        for accept_encoding, expected in (('gzip', 'gzip'), ('gzip, deflate, br', 'gzip'), ('*', 'gzip'),
+                                          ('br', None), ('identity', None), ('', None), ('gzip;q=0', None),
+                                          ('*;q=0.5, gzip;q=0', None), ('*;q=0.1, identity', 'gzip')):
+            self.assertEqual(self.choose(accept_encoding), expected, accept_encoding)
+
+    def test_brotli_preferred_on_ties(self):
+        for accept_encoding, expected in (('gzip, br', 'br'), ('gzip;q=1, br;q=0.5', 'gzip'), ('br;q=0, gzip', 'gzip'),
+                                          ('*', 'br'), ('br', 'br'), ('identity;q=1, br;q=0', None)):
+            self.assertEqual(self.choose(accept_encoding, brotli=True), expected, accept_encoding)
+
+
+class CompressedResponseTests(AppTestCase):
+    """Responses from COMPRESSION_MIN_SIZE bytes up are compressed, and every variant says Vary"""
+
+    def setUp(self):
+        super().setUp()
+        add_user(1, bio='Quiet, tidy and fond of plants. ' * 20)
+        db.session.commit()
+
+    def get(self, accept_encoding: str = 'gzip', **headers):
+        return self.client.get('/api/profile', headers={**self.auth(1), 'Accept-Encoding': accept_encoding, **headers})
+
+    def test_minimum_size(self):
+        size = len(self.get('identity').get_data())
+        compressor = Compressor(min_size=size)
+        for min_size, compressed in ((size, True), (size + 1, False)):
+            compressor.min_size = min_size
+            with self.app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+                response = self.app.response_class(b'x' * size, mimetype='application/json')
+                response = compressor.compress_response(response)
+            self.assertEqual(response.headers.get('Content-Encoding') == 'gzip', compressed, min_size)
+            self.assertIn('Accept-Encoding', response.vary)
+
+        # The app's compressor, with the default COMPRESSION_MIN_SIZE
+        self.assertGreaterEqual(size, 1024)
+        response = self.get()
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(response.get_data())), size)
+
+    def test_vary_on_every_variant(self):
+        plain = self.get('identity')
+        compressed = self.get('gzip')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(json.loads(gzip.decompress(compressed.get_data())), plain.get_json())
+        for response in (plain, compressed):
+            self.assertIn('Accept-Encoding', response.vary)
+
+        # Revalidation with the (weakened) ETag of the compressed response
+        etag = compressed.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        not_modified = self.get('gzip', **{'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn('Accept-Encoding', not_modified.vary)
+        self.assertEqual(not_modified.get_data(), b'')
+
+        # Small responses are not compressed, but still vary
+        small = self.client.get('/api/health', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', small.headers)
+        self.assertIn('Accept-Encoding', small.vary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Scoring equivalence tests for Roommatch
+Checks that the vectorized scorer (scoring.score_batch, over a ProfileBatch
+or the columnar ProfileStore) returns exactly the floats of
+calculate_compatibility_score, including on the edge cases of its inputs,
+and how deal-breakers and shared interests move a score
+Run with: python -m pytest test_scoring.py
+"""
+
+import os
+import random
+import unittest
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JOB_STORE_URL', 'memory')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from app import calculate_compatibility_score
+from profile_store import ProfileRecord, ProfileStore
+from scoring import MATCH_THRESHOLD, ProfileBatch, exclude_deal_breakers, score_batch, top_k
+from vocabulary import TERMS
+
+BUDGETS = [(None, None), (800, None), (None, 1200), (0, 1000), (800, 1200), (1000, 1000), (1500, 900),
+           (600.5, 950.25), (1200, 2400), (400, 800)]
+LEVELS = [None, 0, 1, 2, 3, 4, 5]
+PREFERENCES = [None, '', 'yes', 'no', 'maybe']
+LOCATIONS = [None, '', 'Downtown', 'downtown', 'DOWNTOWN', 'Uptown', 'Suburbs']
+TERM_LISTS = [None, [], ['cooking'], ['music', 'Gaming', 'not a term']] + [None] * 4
+
+
+def random_profile(rng: random.Random, user_id: int) -> ProfileRecord:
+    """Profile drawn from every edge case of each scoring field"""
+    budget_min, budget_max = rng.choice(BUDGETS)
+    return ProfileRecord(
+        user_id,
+        budget_min=budget_min,
+        budget_max=budget_max,
+        cleanliness_level=rng.choice(LEVELS),
+        social_level=rng.choice(LEVELS),
+        noise_tolerance=rng.choice(LEVELS),
+        pet_preference=rng.choice(PREFERENCES),
+        smoking_preference=rng.choice(PREFERENCES),
+        location_preference=rng.choice(LOCATIONS),
+        interests=rng.choice(TERM_LISTS + [rng.sample(TERMS, rng.randint(1, 6))]),
+        deal_breakers=rng.choice([None, [], ['smoking'], ['pets', 'messy'], rng.sample(TERMS, 2)]),
+    )
+
+
+class ScoreEquivalenceTests(unittest.TestCase):
+    """score_batch matches calculate_compatibility_score exactly"""
+
+    def assertSameScores(self, probe, candidates, batch):
+        scores = score_batch(probe, batch).tolist()
+        for candidate, score in zip(candidates, scores):
+            expected = calculate_compatibility_score(probe, candidate)
+            self.assertEqual(score, expected, f'user {probe.user_id} vs user {candidate.user_id}')
+            self.assertEqual(score > MATCH_THRESHOLD, expected > MATCH_THRESHOLD)
+
+    def test_random_pairs_over_every_edge_case(self):
+        rng = random.Random(0)
+        candidates = [random_profile(rng, user_id) for user_id in range(1, 401)]
+        batch = ProfileBatch.from_profiles(candidates)
+        for probe in candidates[:150]:
+            self.assertSameScores(probe, candidates, batch)
+
+    def test_profile_store_batches_score_the_same(self):
+        rng = random.Random(1)
+        candidates = [random_profile(rng, user_id) for user_id in range(1, 301)]
+        store = ProfileStore(capacity=16)
+        store.upsert(candidates)
+        batch = store.batch()
+        # The store hands candidates back in user ID order, with location lower-cased
+        stored = [store.record(user_id) for user_id in batch.user_ids.tolist()]
+        for probe in candidates[:100]:
+            self.assertSameScores(probe, stored, batch)
+
+    def test_threshold_boundary(self):
+        # No budget overlap and different locations: the best case is (0.4 + 0.1 + 0.1) / 1.0,
+        # which accumulates to 0.6000000000000001 and so (just) clears the threshold on both paths
+        probe = ProfileRecord(1, budget_min=500, budget_max=700, cleanliness_level=3, social_level=3,
+                              noise_tolerance=3, pet_preference='no', smoking_preference='no',
+                              location_preference='Downtown')
+        twin = ProfileRecord(2, budget_min=900, budget_max=1100, cleanliness_level=3, social_level=3,
+                             noise_tolerance=3, pet_preference='no', smoking_preference='no',
+                             location_preference='Uptown')
+        # One lifestyle step apart falls below it
+        near = ProfileRecord(3, budget_min=900, budget_max=1100, cleanliness_level=4, social_level=3,
+                             noise_tolerance=3, pet_preference='no', smoking_preference='no',
+                             location_preference='Uptown')
+        scores = score_batch(probe, ProfileBatch.from_profiles([twin, near])).tolist()
+        self.assertEqual(scores, [calculate_compatibility_score(probe, twin), calculate_compatibility_score(probe, near)])
+        self.assertGreater(scores[0], MATCH_THRESHOLD)
+        self.assertLess(scores[1], MATCH_THRESHOLD)
+
+
+def complete_profile(user_id: int, **fields) -> ProfileRecord:
+    """Profile with every scoring field set (fields override the defaults)"""
+    defaults = {'budget_min': 800, 'budget_max': 1200, 'cleanliness_level': 4, 'social_level': 3,
+                'noise_tolerance': 3, 'pet_preference': 'no', 'smoking_preference': 'no',
+                'location_preference': 'Downtown'}
+    return ProfileRecord(user_id, **{**defaults, **fields})
+
+
+class DealBreakerAndInterestTests(unittest.TestCase):
+    """Deal-breakers rule a pair out from either side; shared interests raise a score"""
+
+    def scores(self, profile1, profile2) -> tuple:
+        """Score of the pair from each side, by both scorers"""
+        return tuple(
+            score
+            for probe, candidate in ((profile1, profile2), (profile2, profile1))
+            for score in (calculate_compatibility_score(probe, candidate),
+                          score_batch(probe, ProfileBatch.from_profiles([candidate])).tolist()[0])
+        )
+
+    def test_deal_breaker_scores_zero_both_ways(self):
+        cases = [
+            # Against a habit implied by a structured answer, and through an alias
+            (complete_profile(1, deal_breakers=['Smokers']), complete_profile(2, smoking_preference='yes')),
+            (complete_profile(1, deal_breakers=['messy']), complete_profile(2, cleanliness_level=2)),
+            # Against a listed interest
+            (complete_profile(1, deal_breakers=['parties']), complete_profile(2, interests=['Partying'])),
+        ]
+        for profile1, profile2 in cases:
+            self.assertGreater(calculate_compatibility_score(complete_profile(1), profile2), 0)
+            self.assertEqual(self.scores(profile1, profile2), (0.0,) * 4, profile1.deal_breakers)
+            batch = ProfileBatch.from_profiles([profile2, complete_profile(3)])
+            self.assertEqual(exclude_deal_breakers(profile1, batch).user_ids.tolist(), [3])
+            self.assertEqual(exclude_deal_breakers(profile2, ProfileBatch.from_profiles([profile1])).user_ids.tolist(),
+                             [])
+
+    def test_unknown_terms_are_ignored(self):
+        plain = self.scores(complete_profile(1, interests=['cooking']), complete_profile(2, interests=['cooking']))
+        unknown = self.scores(complete_profile(1, interests=['cooking', 'pineapple pizza'],
+                                               deal_breakers=['pineapple pizza', 'mondays']),
+                              complete_profile(2, interests=['cooking', 'Pineapple Pizza', 'mondays']))
+        self.assertEqual(unknown, plain)
+        self.assertGreater(plain[0], 0)
+
+    def test_interest_overlap_raises_the_score(self):
+        # Lifestyle levels that differ, so the interest factor can lift the lifestyle mean
+        probe = complete_profile(1, cleanliness_level=2, interests=['hiking', 'cooking', 'music'])
+        candidates = {
+            'none': complete_profile(2, interests=['gaming']),
+            'some': complete_profile(3, interests=['Hike', 'gaming']),
+            'all': complete_profile(4, interests=['music', 'cooking', 'hiking']),
+        }
+        scores = {name: self.scores(probe, candidate) for name, candidate in candidates.items()}
+        for name in scores:
+            self.assertEqual(len(set(scores[name])), 1, name)
+        self.assertLess(scores['none'][0], scores['some'][0])
+        self.assertLess(scores['some'][0], scores['all'][0])
+
+
+class TopKTests(unittest.TestCase):
+    """top_k returns the k best scores above the threshold, ties going to the lower index"""
+
+    def expected(self, probe, batch, k):
+        scores = score_batch(probe, batch).tolist()
+        ranked = sorted((index for index, score in enumerate(scores) if score > MATCH_THRESHOLD),
+                        key=lambda index: (-scores[index], index))
+        return [(index, scores[index]) for index in ranked[:k]]
+
+    def test_matches_a_full_sort(self):
+        rng = random.Random(2)
+        candidates = [random_profile(rng, user_id) for user_id in range(1, 501)]
+        batch = ProfileBatch.from_profiles(candidates)
+        for probe in candidates[:40]:
+            for k in (1, 5, 50, 1000):
+                # Small blocks so the upper-bound pruning cuts in between them
+                self.assertEqual(top_k(probe, batch, k, block_size=16), self.expected(probe, batch, k))
+
+    def test_ties_keep_the_lower_index(self):
+        probe = ProfileRecord(1, budget_min=800, budget_max=1200, cleanliness_level=4, social_level=3,
+                              noise_tolerance=3, pet_preference='no', smoking_preference='no')
+        twins = [ProfileRecord(user_id, budget_min=800, budget_max=1200, cleanliness_level=4, social_level=3,
+                               noise_tolerance=3, pet_preference='no', smoking_preference='no')
+                 for user_id in range(2, 12)]
+        batch = ProfileBatch.from_profiles(twins)
+        self.assertEqual([index for index, score in top_k(probe, batch, 3, block_size=4)], [0, 1, 2])
+        self.assertEqual(top_k(probe, batch, 3), self.expected(probe, batch, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Write-behind buffer tests for Roommatch
+Checks when WriteBehindBuffer flushes (a full batch, or interval seconds
+after a batch's first row), that repeated keys coalesce, and that failed
+flushes keep their rows, that open buffers are closed at exit without
+being kept alive; then the waitlist signup route that uses it, through
+the test client
+Run with: python -m pytest test_writebehind.py
+"""
+
+import gc
+import os
+import threading
+import time
+import unittest
+import weakref
+from unittest import mock
+
+from test_matching import AppTestCase
+
+import app as roommatch
+from app import Waitlist, db
+import writebehind
+from writebehind import BufferFullError, WriteBehindBuffer
+
+
+class Recorder:
+    """Flush function that records each batch and signals when one arrives"""
+
+    def __init__(self, failures: int = 0):
+        self.batches = []
+        self.failures = failures
+        self.flushed = threading.Event()
+
+    def __call__(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('database unavailable')
+        self.batches.append(rows)
+        self.flushed.set()
+
+
+class WriteBehindBufferTests(unittest.TestCase):
+    """Rows wait for a full batch or the interval, whichever comes first"""
+
+    def buffer(self, recorder: Recorder, **options) -> WriteBehindBuffer:
+        buffer = WriteBehindBuffer('test', recorder, **{'interval': 60, 'max_batch': 3, **options})
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def test_full_batch_is_flushed_at_once(self):
+        recorder = Recorder()
+        buffer = self.buffer(recorder)
+        for n in range(2):
+            buffer.add(n, n)
+        self.assertFalse(recorder.flushed.wait(0.1))
+
+        buffer.add(2, 2)
+        self.assertTrue(recorder.flushed.wait(5))
+        self.assertEqual(recorder.batches, [[0, 1, 2]])
+        self.assertEqual(len(buffer), 0)
+
+    def test_partial_batch_is_flushed_after_the_interval(self):
+        recorder = Recorder()
+        buffer = self.buffer(recorder, interval=0.2, max_batch=100)
+        started = time.monotonic()
+        buffer.add('a', 'a')
+        buffer.add('b', 'b')
+
+        self.assertTrue(recorder.flushed.wait(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(recorder.batches, [['a', 'b']])
+
+    def test_repeated_keys_coalesce(self):
+        recorder = Recorder()
+        buffer = self.buffer(recorder)
+        self.assertTrue(buffer.add('a@example.com', 1))
+        self.assertFalse(buffer.add('a@example.com', 2))
+        self.assertTrue(buffer.add('b@example.com', 3))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(recorder.batches, [[1, 3]])
+
+        # Once flushed, the key is buffered again (the insert skips rows already stored)
+        self.assertTrue(buffer.add('a@example.com', 4))
+
+    def test_manual_flush_writes_in_batches(self):
+        recorder = Recorder()
+        buffer = self.buffer(recorder, max_pending=100)
+        # Filled directly, bypassing add(), so no flush thread takes the full batches first
+        with buffer._lock:
+            buffer._rows.update((n, n) for n in range(7))
+            buffer._first_added = time.monotonic()
+        self.assertEqual(buffer.flush(), 7)
+        self.assertEqual(recorder.batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_full_buffer_rejects_rows(self):
+        buffer = self.buffer(Recorder(), max_batch=10, max_pending=2)
+        buffer.add('a', 'a')
+        buffer.add('b', 'b')
+        with self.assertRaises(BufferFullError):
+            buffer.add('c', 'c')
+        # A waiting key still coalesces instead of raising
+        self.assertFalse(buffer.add('a', 'a'))
+
+    def test_failed_flush_keeps_its_rows(self):
+        recorder = Recorder(failures=1)
+        buffer = self.buffer(recorder, max_batch=10)
+        buffer.add('a', 'a1')
+        buffer.add('b', 'b1')
+        with self.assertRaises(ConnectionError):
+            buffer.flush()
+        self.assertEqual(len(buffer), 2)
+
+        # The failed rows are retried ahead of newer ones, and keep their key
+        self.assertFalse(buffer.add('a', 'a2'))
+        buffer.add('c', 'c1')
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(recorder.batches, [['a1', 'b1', 'c1']])
+
+    def test_flush_thread_retries_after_a_failure(self):
+        recorder = Recorder(failures=1)
+        buffer = self.buffer(recorder, interval=0.05, max_batch=10)
+        with self.assertLogs('writebehind', 'ERROR'):
+            buffer.add('a', 'a')
+            self.assertTrue(recorder.flushed.wait(5))
+        self.assertEqual(recorder.batches, [['a']])
+
+    def test_write_through_and_close(self):
+        recorder = Recorder()
+        self.buffer(recorder, interval=0).add('a', 'a')
+        self.assertEqual(recorder.batches, [['a']])
+
+        buffer = self.buffer(recorder)
+        buffer.add('b', 'b')
+        buffer.close()
+        self.assertEqual(recorder.batches, [['a'], ['b']])
+        # Rows added after close are written straight away
+        buffer.add('c', 'c')
+        self.assertEqual(recorder.batches, [['a'], ['b'], ['c']])
+
+    def test_open_buffers_are_closed_at_exit(self):
+        recorder = Recorder()
+        with mock.patch.object(writebehind, '_open_buffers', weakref.WeakSet()):
+            buffer = self.buffer(recorder)
+            buffer.add('a', 'a')
+            self.buffer(recorder).close()
+            writebehind.close_open_buffers()
+            self.assertEqual(recorder.batches, [['a']])
+            self.assertEqual(len(writebehind._open_buffers), 0)
+
+    def test_unused_buffer_is_collected(self):
+        recorder = Recorder()
+        buffer = WriteBehindBuffer('test', recorder, interval=0.01, max_batch=10)
+        buffer.add('a', 'a')
+        self.assertTrue(recorder.flushed.wait(5))
+        # The flush thread ends once nothing is waiting, and the next row starts another
+        thread = buffer._thread
+        if thread is not None:
+            thread.join(5)
+        self.assertIsNone(buffer._thread)
+        buffer.add('b', 'b')
+        buffer.flush()
+        self.assertEqual(recorder.batches, [['a'], ['b']])
+
+        reference = weakref.ref(buffer)
+        del buffer
+        for _ in range(50):
+            gc.collect()
+            if reference() is None:
+                break
+            time.sleep(0.02)
+        self.assertIsNone(reference())
+
+
+class WaitlistTests(AppTestCase):
+    """Waitlist signups are buffered, deduplicated by email and stored on flush"""
+
+    def setUp(self):
+        with mock.patch.dict(os.environ, {'WAITLIST_FLUSH_INTERVAL': '60', 'WAITLIST_MAX_PENDING': '3'}):
+            super().setUp()
+        self.addCleanup(roommatch.waitlist_buffer.close)
+
+    def join(self, email: str, name: str = None):
+        return self.client.post('/api/waitlist', json={'email': email, 'name': name})
+
+    def test_signups_are_coalesced_and_stored_on_flush(self):
+        for email in ('a@example.com', ' A@Example.com ', 'b@example.com'):
+            self.assertEqual(self.join(email).status_code, 200)
+        self.assertEqual(len(roommatch.waitlist_buffer), 2)
+        self.assertEqual(Waitlist.query.count(), 0)
+
+        roommatch.waitlist_buffer.flush()
+        self.assertEqual(sorted(row.email for row in Waitlist.query), ['a@example.com', 'b@example.com'])
+
+        # An email already stored is skipped by the batch insert
+        self.join('a@example.com')
+        roommatch.waitlist_buffer.flush()
+        self.assertEqual(Waitlist.query.count(), 2)
+
+    def test_full_buffer_answers_503(self):
+        for n in range(3):
+            self.assertEqual(self.join(f'user{n}@example.com').status_code, 200)
+        response = self.join('late@example.com')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+
+    def test_invalid_signups(self):
+        for payload in ({}, {'email': 'no-at-sign'}, {'email': 42}, {'email': 'a@example.com', 'name': 7}):
+            self.assertEqual(self.client.post('/api/waitlist', json=payload).status_code, 400, payload)
+        self.assertEqual(len(roommatch.waitlist_buffer), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
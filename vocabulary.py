@@ -0,0 +1,112 @@
+"""
+Managed vocabulary for interests and deal-breakers.
+
+Free-text interests and deal-breakers are normalized (lower-cased, aliases
+resolved) onto a fixed list of terms, and a profile's terms are encoded as a
+64-bit mask with one bit per term. Terms outside the vocabulary are kept in
+the profile but ignored for matching.
+
+A profile's traits are its interests plus tags implied by its structured
+answers (a 'yes' smoking or pet preference, cleanliness level 1-2). Two
+profiles are incompatible when either one's deal-breakers intersect the
+other's traits, which is a single AND per pair.
+"""
+
+from typing import Any, Iterable, List, Optional
+
+# Bitsets are one unsigned 64-bit word
+BITSET_WIDTH = 64
+
+# Bit i stands for TERMS[i]; only ever append, never reorder
+TERMS = (
+    # Interests
+    'coding', 'hiking', 'cooking', 'movies', 'music', 'reading', 'gaming', 'sports',
+    'fitness', 'yoga', 'travel', 'art', 'photography', 'dancing', 'gardening', 'writing',
+    'running', 'cycling', 'swimming', 'board games', 'parties', 'nightlife', 'outdoors', 'fashion',
+    'volunteering', 'meditation', 'baking', 'concerts', 'theater', 'podcasts', 'tv', 'anime',
+    'languages', 'camping', 'climbing', 'skiing', 'basketball', 'football', 'soccer', 'tennis',
+    # Habits that commonly appear as deal-breakers
+    'smoking', 'vaping', 'pets', 'messy', 'loud', 'late nights', 'guests', 'drinking',
+)
+
+ALIASES = {
+    'programming': 'coding', 'hike': 'hiking', 'cook': 'cooking', 'film': 'movies', 'films': 'movies',
+    'movie': 'movies', 'books': 'reading', 'games': 'gaming', 'video games': 'gaming',
+    'gym': 'fitness', 'working out': 'fitness', 'workout': 'fitness', 'traveling': 'travel',
+    'travelling': 'travel', 'dance': 'dancing', 'party': 'parties', 'partying': 'parties',
+    'loud parties': 'parties', 'smoker': 'smoking', 'smokers': 'smoking', 'cigarettes': 'smoking',
+    'vape': 'vaping', 'pet': 'pets', 'animals': 'pets', 'dogs': 'pets', 'cats': 'pets',
+    'messy roommates': 'messy', 'mess': 'messy', 'untidy': 'messy', 'dirty': 'messy',
+    'noise': 'loud', 'noisy': 'loud', 'loud music': 'loud', 'night owl': 'late nights',
+    'late night': 'late nights', 'overnight guests': 'guests', 'visitors': 'guests',
+    'alcohol': 'drinking',
+}
+
+BITS = {term: 1 << position for position, term in enumerate(TERMS)}
+assert len(TERMS) <= BITSET_WIDTH
+
+
+def normalize(term: Any) -> Optional[str]:
+    """Map a free-text term to its vocabulary term, or None if it has none"""
+    if not isinstance(term, str):
+        return None
+    term = ' '.join(term.lower().split())
+    term = ALIASES.get(term, term)
+    return term if term in BITS else None
+
+
+def encode(terms: Optional[Iterable[Any]]) -> int:
+    """Bitset of the vocabulary terms in a list (anything else is ignored)"""
+    bits = 0
+    if isinstance(terms, (list, tuple)):
+        for term in terms:
+            term = normalize(term)
+            if term:
+                bits |= BITS[term]
+    return bits
+
+
+def decode(bits: int) -> List[str]:
+    """Vocabulary terms set in a bitset, in vocabulary order"""
+    return [term for term in TERMS if bits & BITS[term]]
+
+
+def popcount(bits: int) -> int:
+    return bin(bits).count('1')
+
+
+def interest_bits(profile: Any) -> int:
+    return encode(getattr(profile, 'interests', None))
+
+
+def deal_breaker_bits(profile: Any) -> int:
+    return encode(getattr(profile, 'deal_breakers', None))
+
+
+def habit_bits(smoking_preference: Any, pet_preference: Any, cleanliness_level: Any) -> int:
+    """Traits implied by a profile's structured answers"""
+    bits = 0
+    if smoking_preference == 'yes':
+        bits |= BITS['smoking']
+    if pet_preference == 'yes':
+        bits |= BITS['pets']
+    if cleanliness_level and cleanliness_level <= 2:
+        bits |= BITS['messy']
+    return bits
+
+
+def trait_bits(profile: Any) -> int:
+    """A profile's interests plus the habits implied by its structured answers"""
+    return interest_bits(profile) | habit_bits(
+        profile.smoking_preference, profile.pet_preference, profile.cleanliness_level
+    )
+
+
+def has_deal_breaker(profile1: Any, profile2: Any) -> bool:
+    """True if either profile's deal-breakers match the other's traits"""
+    return bool(deal_breaker_bits(profile1) & trait_bits(profile2) or deal_breaker_bits(profile2) & trait_bits(profile1))
+
+
+def jaccard(bits1: int, bits2: int) -> float:
+    """Jaccard similarity of two non-empty bitsets"""
+    return popcount(bits1 & bits2) / popcount(bits1 | bits2)
@@ -0,0 +1,166 @@
+"""
+Write-behind buffering of high-volume, idempotent inserts.
+
+Rows are collected in memory, keyed so that repeats of a key coalesce into
+the row already waiting, and handed to a flush function in batches: when
+max_batch rows are waiting, or interval seconds after the first row of a
+batch arrived, whichever comes first. The flush function is expected to
+write the batch in one statement that ignores rows already stored (INSERT
+... ON CONFLICT DO NOTHING), so a key seen again after its flush costs one
+skipped row rather than a round trip per request.
+
+A failed flush keeps its rows for the next attempt. Rows are held in memory
+only, so the buffer is flushed on close(), and buffers still open at
+interpreter exit are closed then. A process that dies hard loses at most
+one interval of writes; callers that cannot afford that should write
+through (interval 0). Once max_pending rows are waiting, add() raises
+BufferFullError instead of growing without bound.
+
+The exit hook holds buffers weakly and the flush thread only runs while
+rows are waiting, so a buffer that is no longer used (e.g. one replaced
+in a forked worker) can be garbage collected.
+"""
+
+import atexit
+import logging
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFullError(Exception):
+    """Raised when a write-behind buffer cannot take more rows"""
+
+
+# Buffers not closed yet, flushed by one exit hook
+_open_buffers: 'weakref.WeakSet[WriteBehindBuffer]' = weakref.WeakSet()
+
+
+@atexit.register
+def close_open_buffers():
+    """Close every buffer still open (run at interpreter exit)"""
+    for buffer in list(_open_buffers):
+        buffer.close()
+
+
+class WriteBehindBuffer:
+    """Coalescing in-memory buffer flushed in batches on a daemon thread"""
+
+    def __init__(self, name: str, flush: Callable[[List[Any]], Any], interval: float = 1.0,
+                 max_batch: int = 500, max_pending: Optional[int] = None,
+                 context: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending or max_batch * 20
+        self._flush = flush
+        self._context = context or nullcontext
+        self._rows: Dict[Hashable, Any] = {}
+        self._first_added: Optional[float] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Serializes flushes, so a batch that failed is retried before newer rows are written
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        _open_buffers.add(self)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: Hashable, row: Any) -> bool:
+        """Buffer row under key; returns False if a row with that key is already waiting"""
+        if self.interval <= 0 or self._closed:
+            self._write([row])
+            return True
+
+        with self._lock:
+            if key in self._rows:
+                return False
+            if len(self._rows) >= self.max_pending:
+                raise BufferFullError(f'{self.name} buffer is full ({len(self._rows)} rows waiting)')
+            self._rows[key] = row
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-flush', daemon=True)
+                self._thread.start()
+            # Wake the flush thread to start the batch's timer, or to write a full batch
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+                self._wake.notify()
+            elif len(self._rows) >= self.max_batch:
+                self._wake.notify()
+        return True
+
+    def flush(self) -> int:
+        """Write every waiting row now; returns the number of rows handed to the flush function"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._take_batch()
+                if not batch:
+                    return written
+                try:
+                    self._write(list(batch.values()))
+                except Exception:
+                    self._restore(batch)
+                    raise
+                written += len(batch)
+
+    def close(self):
+        """Stop buffering and write what is waiting (also run at interpreter exit)"""
+        self._closed = True
+        _open_buffers.discard(self)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('%s: could not flush %d buffered rows', self.name, len(self._rows))
+
+    def _take_batch(self) -> Dict[Hashable, Any]:
+        # Caller holds self._lock; takes up to max_batch rows, oldest first
+        if len(self._rows) <= self.max_batch:
+            batch, self._rows = self._rows, {}
+        else:
+            keys = list(self._rows)[:self.max_batch]
+            batch = {key: self._rows.pop(key) for key in keys}
+        self._first_added = time.monotonic() if self._rows else None
+        return batch
+
+    def _restore(self, batch: Dict[Hashable, Any]):
+        # Failed rows go back in front of the newer ones; a key re-added meanwhile keeps its failed row
+        with self._lock:
+            self._rows = {**batch, **{key: row for key, row in self._rows.items() if key not in batch}}
+            self._first_added = time.monotonic()
+
+    def _write(self, rows: List[Any]):
+        with self._context():
+            self._flush(rows)
+
+    def _due(self) -> Optional[float]:
+        # Seconds until the waiting rows must be flushed (0 = now), or None when nothing is waiting
+        if not self._rows:
+            return None
+        if len(self._rows) >= self.max_batch:
+            return 0.0
+        return max(0.0, self._first_added + self.interval - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                wait = self._due()
+                while wait is not None and wait > 0:
+                    self._wake.wait(wait)
+                    wait = self._due()
+                if wait is None:
+                    # Nothing is waiting (e.g. a manual flush took it): the next add() starts a new thread
+                    self._thread = None
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('%s: flush failed, retrying in %.1fs', self.name, self.interval)
+                time.sleep(self.interval)
@@ -0,0 +1,10 @@
+"""
+WSGI entry point for Roommatch.
+
+    flask --app app schema upgrade
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app()